@@ -1,28 +1,76 @@
 # -*- coding: utf-8 -*-
 
 from django.contrib import admin
-from easyscan_app.models import ScanRequest
+from django.db.models import Q
+from django.utils.text import smart_split, unescape_string_literal
+from easyscan_app.lib.search_text import SearchTextMaker
+from easyscan_app.models import BulkResubmitter, OutboxEmail, ScanRequest, ScanRequestArchive
 
 
 class ScanRequestAdmin( admin.ModelAdmin ):
     date_hierarchy = u'create_datetime'
     ordering = [ u'-id' ]
-    list_display = [
+    list_display = [  # light columns only; the blobs are on the change page
         u'id', u'create_datetime', u'status',
-        u'item_title', u'item_barcode', u'item_callnumber', u'item_volume_year', u'item_chap_vol_title', u'item_source_url', u'item_page_range_other', u'item_other',
-        u'patron_name', u'patron_barcode', u'patron_email',
-        u'las_conversion', u'admin_notes' ]
-    # list_filter = [ u'patron_barcode' ]
-    search_fields = [
-        u'id', u'create_datetime', u'status',
-        u'item_title', u'item_barcode', u'item_callnumber', u'item_volume_year', u'item_chap_vol_title', u'item_source_url', u'item_page_range_other', u'item_other',
-        u'patron_name', u'patron_barcode', u'patron_email',
-        u'las_conversion', u'admin_notes' ]
+        u'item_title', u'item_barcode',
+        u'patron_name', u'patron_barcode' ]
+    list_filter = [ u'status' ]
+    show_full_result_count = False  # skips a second, unfiltered count on every search
+    search_fields = [ u'search_text' ]  # shows the search box; the lookups themselves are in get_search_results()
     readonly_fields = [
         u'id', u'create_datetime', u'status',
         u'item_title', u'item_barcode', u'item_callnumber', u'item_volume_year', u'item_chap_vol_title', u'item_source_url', u'item_page_range_other', u'item_other',
         u'patron_name', u'patron_barcode', u'patron_email',
         u'las_conversion', u'admin_notes' ]
+    actions = [ u'bulk_resubmit' ]
+    BARCODE_MIN_PREFIX = 6  # all-digit terms at least this long are treated as barcode prefixes
+    MAX_ID = 2147483647  # largest value the id column holds; longer digit terms can only be barcodes
+
+    def get_search_results( self, request, queryset, search_term ):
+        """ Matches every term (quote a phrase to keep it together).
+            An all-digit term matches the request id; one of BARCODE_MIN_PREFIX or more digits also matches the start of an item or patron barcode, via their indexes.
+            Any other term matches if it appears anywhere in the normalized search_text column. """
+        maker = SearchTextMaker()
+        for term in smart_split( search_term ):
+            if term[0:1] in ( u'"', u"'" ) and len( term ) > 1 and term[0] == term[-1]:  # an unmatched quote is searched literally, as django's admin does
+                term = unescape_string_literal( term )
+            if term.isdigit() and len( term ) >= self.BARCODE_MIN_PREFIX:
+                upper = term[0:-1] + unichr( ord(term[-1]) + 1 )  # prefix as a range, so the barcode indexes are used on every backend
+                lookup = Q( item_barcode__gte=term, item_barcode__lt=upper ) | Q( patron_barcode__gte=term, patron_barcode__lt=upper )
+            else:
+                lookup = Q( search_text__contains=maker.normalize(term) )
+            if term.isdigit() and int( term ) <= self.MAX_ID:
+                lookup = lookup | Q( id=int(term) )
+            queryset = queryset.filter( lookup )
+        return ( queryset, False )
+
+    def bulk_resubmit( self, request, queryset ):
+        """ Re-sends the selected requests that aren't yet transferred, in batched files. """
+        result = BulkResubmitter().resubmit( queryset )
+        self.message_user( request, u'%(selected)s requests resubmitted; %(transferred)s transferred, %(failed)s failed' % result )
+    bulk_resubmit.short_description = u'Resubmit selected non-transferred requests to the Annex'
+
+
+class ScanRequestArchiveAdmin( ScanRequestAdmin ):
+    """ Read-only view of archived requests, searched the same way as live ones. """
+    actions = None
+    readonly_fields = ScanRequestAdmin.readonly_fields + [ u'archive_datetime' ]
+
+    def has_add_permission( self, request ):
+        return False
+
+    def has_delete_permission( self, request, obj=None ):
+        return False
+
+
+class OutboxEmailAdmin( admin.ModelAdmin ):
+    """ Shows queued, sent, and dead-lettered emails; filter on status `dead` for ones that gave up. """
+    ordering = [ u'-id' ]
+    list_display = [ u'id', u'create_datetime', u'status', u'attempts', u'subject', u'to_json', u'last_error' ]
+    list_filter = [ u'status' ]
+    readonly_fields = [ u'subject', u'body', u'from_email', u'to_json', u'reply_to', u'attempts', u'last_error', u'create_datetime', u'modify_datetime' ]
 
 
 admin.site.register( ScanRequest, ScanRequestAdmin )
+admin.site.register( ScanRequestArchive, ScanRequestArchiveAdmin )
+admin.site.register( OutboxEmail, OutboxEmailAdmin )
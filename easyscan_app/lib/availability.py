@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+""" Looks up bib titles from the availability-api, with caching.
+    Used by models.RequestViewGetHelper """
+
+from __future__ import unicode_literals
+
+import collections, logging, os, threading, time
+import requests
+from django.core.cache import cache
+from easyscan_app.lib.metrics import metrics
+
+
+log = logging.getLogger(__name__)
+sessions = {}  # pid -> requests.Session; see get_session()
+sessions_lock = threading.Lock()
+
+
+def get_session():
+    """ Returns this process's keep-alive http session, built on first use.
+        Keyed by pid so a forked worker never shares its parent's sockets.
+        Called by TitleLookup.fetch_title() """
+    pid = os.getpid()
+    with sessions_lock:
+        if pid not in sessions:
+            pool_size = int( os.environ.get('EZSCAN__AVAILABILITY_API_POOL_SIZE', '10') )
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter( pool_connections=2, pool_maxsize=pool_size )
+            session.mount( 'http://', adapter )
+            session.mount( 'https://', adapter )
+            sessions[pid] = session
+        return sessions[pid]
+
+
+class CircuitBreaker( object ):
+    """ Stops calls to a failing upstream.
+        After FAILURE_THRESHOLD failures within WINDOW_SECONDS the breaker opens and allow() says no for COOLDOWN_SECONDS;
+          then a single trial call is let through, which closes the breaker on success or re-opens it on failure. """
+
+    def __init__( self ):
+        self.FAILURE_THRESHOLD = int( os.environ.get('EZSCAN__AVAILABILITY_API_BREAKER_FAILURES', '5') )
+        self.WINDOW_SECONDS = int( os.environ.get('EZSCAN__AVAILABILITY_API_BREAKER_WINDOW_SECONDS', '60') )
+        self.COOLDOWN_SECONDS = int( os.environ.get('EZSCAN__AVAILABILITY_API_BREAKER_COOLDOWN_SECONDS', '30') )
+        self.state = 'closed'  # 'closed', 'open', or 'half_open'
+        self.failure_times = collections.deque()
+        self.open_until = 0
+        self.lock = threading.Lock()
+
+    def allow( self ):
+        """ Returns boolean; whether a call may be made now.
+            Called by TitleLookup.get_title() """
+        with self.lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.time() >= self.open_until:
+                self.state = 'half_open'  # this caller gets the trial call
+                return True
+            return False
+
+    def record_success( self ):
+        """ Closes breaker.
+            Called by TitleLookup.get_title() """
+        with self.lock:
+            self.state = 'closed'
+            self.failure_times.clear()
+        return
+
+    def record_failure( self ):
+        """ Counts failure; opens breaker on a failed trial or once the threshold is reached.
+            Called by TitleLookup.get_title() """
+        with self.lock:
+            now = time.time()
+            self.failure_times.append( now )
+            while self.failure_times and self.failure_times[0] < now - self.WINDOW_SECONDS:
+                self.failure_times.popleft()
+            if self.state == 'half_open' or len( self.failure_times ) >= self.FAILURE_THRESHOLD:
+                self.state = 'open'
+                self.open_until = now + self.COOLDOWN_SECONDS
+                self.failure_times.clear()
+                log.warning( 'CircuitBreaker(); opened for `%s` seconds' % self.COOLDOWN_SECONDS )
+        return
+
+    # end class CircuitBreaker
+
+
+class TitleCache( object ):
+    """ Bounded lru+ttl cache of bibnum -> title.
+        Entries go to django's cache (shared across workers when settings.CACHES points at a shared backend)
+          and to an in-process lru, which also keeps serving if the shared cache is unreachable.
+        A cached empty-string title is a remembered miss. """
+
+    def __init__( self ):
+        self.TTL_SECONDS = int( os.environ.get('EZSCAN__TITLE_CACHE_TTL_SECONDS', '86400') )
+        self.NEGATIVE_TTL_SECONDS = int( os.environ.get('EZSCAN__TITLE_CACHE_NEGATIVE_TTL_SECONDS', '600') )
+        self.MAX_ENTRIES = int( os.environ.get('EZSCAN__TITLE_CACHE_MAX_ENTRIES', '2000') )
+        self.key_prefix = 'easyscan_title_'
+        self.local = collections.OrderedDict()  # bibnum -> ( expiry_time, title ), oldest-used first
+        self.lock = threading.Lock()
+
+    def get( self, bibnum ):
+        """ Returns cached title ('' for a remembered miss), or None if not cached.
+            Called by TitleLookup.get_title() """
+        title = self.get_local( bibnum )
+        if title is None:
+            try:
+                title = cache.get( self.key_prefix + bibnum )
+            except Exception as e:
+                log.warning( 'TitleCache(); shared-cache get failed, `%s`' % repr(e) )
+            if title is not None:
+                self.set_local( bibnum, title, self.calc_ttl(title) )
+        return title
+
+    def set( self, bibnum, title ):
+        """ Caches title; misses get the shorter negative ttl.
+            Called by TitleLookup.get_title() """
+        ttl = self.calc_ttl( title )
+        self.set_local( bibnum, title, ttl )
+        try:
+            cache.set( self.key_prefix + bibnum, title, ttl )
+        except Exception as e:
+            log.warning( 'TitleCache(); shared-cache set failed, `%s`' % repr(e) )
+        return
+
+    def calc_ttl( self, title ):
+        """ Returns ttl for title.
+            Called by get(), set() """
+        return self.TTL_SECONDS if title else self.NEGATIVE_TTL_SECONDS
+
+    def get_local( self, bibnum ):
+        """ Returns unexpired in-process entry, marking it most-recently-used; else None.
+            Called by get() """
+        with self.lock:
+            entry = self.local.pop( bibnum, None )
+            if entry is None or entry[0] < time.time():
+                return None
+            self.local[bibnum] = entry
+            return entry[1]
+
+    def set_local( self, bibnum, title, ttl ):
+        """ Stores in-process entry, evicting the least-recently-used past MAX_ENTRIES.
+            Called by get(), set() """
+        with self.lock:
+            self.local.pop( bibnum, None )
+            self.local[bibnum] = ( time.time() + ttl, title )
+            while len( self.local ) > self.MAX_ENTRIES:
+                self.local.popitem( last=False )
+        return
+
+    # end class TitleCache
+
+
+class TitleLookup( object ):
+    """ Returns bib titles, from cache when possible, else from the availability-api with strict timeouts.
+        While the api is failing, the circuit-breaker skips the call and an empty title is returned. """
+
+    def __init__( self, api_url_root, title_cache=None ):
+        self.API_URL_ROOT = api_url_root
+        self.CONNECT_TIMEOUT_SECONDS = float( os.environ.get('EZSCAN__AVAILABILITY_API_CONNECT_TIMEOUT_SECONDS', '1.0') )
+        self.READ_TIMEOUT_SECONDS = float( os.environ.get('EZSCAN__AVAILABILITY_API_READ_TIMEOUT_SECONDS', '2.0') )
+        self.title_cache = title_cache or TitleCache()
+        self.breaker = CircuitBreaker()
+
+    def get_title( self, bibnum ):
+        """ Returns title, or '' if it can't be found.
+            Errors are not cached, so the next request tries again.
+            Called by models.RequestViewGetHelper.hit_availability_api() """
+        cacheable = bibnum.isalnum()  # keeps arbitrary param values out of cache keys
+        title = self.title_cache.get( bibnum ) if cacheable else None
+        if title is not None:
+            log.debug( 'TitleLookup(); cache hit for bibnum `%s`' % bibnum )
+            metrics.inc( 'easyscan_availability_lookups_total', {'result': 'hit'} )
+            return title
+        if not self.breaker.allow():
+            log.debug( 'TitleLookup(); breaker open; skipping api for bibnum `%s`' % bibnum )
+            metrics.inc( 'easyscan_availability_lookups_total', {'result': 'breaker_open'} )
+            return ''
+        try:
+            title = self.fetch_title( bibnum )
+        except Exception as e:
+            log.debug( 'TitleLookup(); exception, %s' % unicode(repr(e)) )
+            self.breaker.record_failure()
+            metrics.inc( 'easyscan_availability_lookups_total', {'result': 'error'} )
+            return ''
+        self.breaker.record_success()
+        metrics.inc( 'easyscan_availability_lookups_total', {'result': 'miss'} )
+        if cacheable:
+            self.title_cache.set( bibnum, title )
+        return title
+
+    def fetch_title( self, bibnum ):
+        """ Hits availability-api; returns title, or '' if the api has none for the bib.
+            Raises on network or server errors.
+            Called by get_title() """
+        availability_api_url = '%s/bib/%s' % ( self.API_URL_ROOT, bibnum )
+        r = get_session().get( availability_api_url, timeout=(self.CONNECT_TIMEOUT_SECONDS, self.READ_TIMEOUT_SECONDS) )
+        r.raise_for_status()
+        try:
+            title = r.json()['response']['backend_response'][0]['title']
+        except ( ValueError, KeyError, IndexError, TypeError ):
+            title = ''
+        return title
+
+    # end class TitleLookup
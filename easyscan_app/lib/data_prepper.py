@@ -12,7 +12,9 @@ spcr = Spacer()
 
 class LasDataMaker( object ):
     """ Contains code to make comma-delimited las string.
-        Called by models.ScanRequest.save() """
+        Called by models.ScanRequest.save(), models.BulkResubmitter """
+
+    SOURCE_FIELDS = [ 'create_datetime', 'patron_name', 'patron_barcode', 'patron_email', 'item_title', 'item_barcode', 'item_chap_vol_title', 'item_page_range_other', 'item_other' ]  # ScanRequest fields a las line is built from
 
     def __init__( self ):
         pass
@@ -141,4 +143,39 @@ class LasDataMaker( object ):
         io.close()
         return csv_string
 
+    ## batch api ##
+
+    def iter_csv_strings( self, records ):
+        """ Yields, for each ScanRequest or dict of SOURCE_FIELDS, the same unicode string make_csv_string() returns.
+            One csv-writer and buffer serve every record, the fixed notes lines are spaced once, and nothing is logged per record.
+            Called by models.BulkResubmitter.send_batch(), management/commands/benchmark_las_data_maker.py """
+        io = StringIO.StringIO()
+        writer = csv.writer( io, delimiter=','.encode('utf-8'), quoting=csv.QUOTE_ALL )
+        fixed = dict( [ (line, spcr.add_spacer(line)) for line in ['------------------------------------------------  ', ' ', 'ARTICLE-CHAPTER-TITLE...'] ] )
+        for record in records:
+            values = record if isinstance( record, dict ) else dict( [ (name, getattr(record, name)) for name in self.SOURCE_FIELDS ] )
+            email = values['patron_email']
+            notes = ''.join( [
+                fixed['------------------------------------------------  '], fixed[' '],
+                spcr.add_spacer( 'email: %s' % email ), fixed[' '],
+                spcr.add_spacer( 'EMAIL: %s' % email.upper() ), fixed[' '],
+                fixed['ARTICLE-CHAPTER-TITLE...'], fixed[' '],
+                spcr.add_spacer( self.strip_stuff(values['item_chap_vol_title']) ), fixed[' '],
+                spcr.add_spacer( 'PAGE-RANGE: %s' % self.strip_stuff(values['item_page_range_other']) ),
+                spcr.add_spacer( 'PAGE-OTHER: %s' % self.strip_stuff(values['item_other']) ) ] )
+            writer.writerow( [
+                b'item_id_not_applicable',
+                values['item_barcode'].encode( 'utf-8', 'replace' ),
+                b'ED',
+                b'QS',
+                self.strip_stuff( values['patron_name'] ).encode( 'utf-8', 'replace' ),
+                values['patron_barcode'].encode( 'utf-8', 'replace' ),
+                self.strip_stuff( values['item_title'] ).encode( 'utf-8', 'replace' ),
+                values['create_datetime'].strftime( b'%a %b %d %Y' ),
+                notes.encode( 'utf-8', 'replace' ) ] )
+            yield io.getvalue().decode( 'utf-8' )
+            io.seek( 0 )
+            io.truncate()
+        io.close()
+
     # end class LasDataMaker()
@@ -2,72 +2,202 @@
 
 """ Transports scan-request files to LAS location. """
 
-import logging, os
+import logging, os, shutil, socket, tempfile, threading, time, uuid
 import paramiko
+from easyscan_app.lib.metrics import metrics
 
 
 log = logging.getLogger(__name__)
+connections = {}  # per-process SftpConnection pool, keyed by ( server, username ); see get_connection()
+connections_lock = threading.Lock()
 
 
 class Prepper( object ):
-    """ Container for data-preparation code. """
+    """ Container for data-preparation code.
+        Each transfer is staged in its own subdirectory of the source-transfer directory,
+          so concurrent workers never see, or delete, each other's files. """
 
     def __init__( self ):
         self.source_transfer_dir_path = unicode( os.environ[u'EZSCAN__SOURCE_TRANSFER_DIR_PATH'] )
         self.filename_prefix = u'REQ-PARSED'
         self.data_file_suffix = u'.dat'
         self.count_file_suffix = u'.cnt'
+        self.staging_dir_prefix = u'transfer_'
+        self.staging_max_age_seconds = int( os.environ.get(u'EZSCAN__STAGING_MAX_AGE_HOURS', u'72') ) * 3600
+        self.staging_sweep_interval_seconds = 600
+        self.last_sweep_time = 0
+
+    def make_data_files( self, datetime_object, data_string, request_id=None ):
+        """ Creates data files for a single request that will be transferred to remote server.
+            Called by models.TryAgainConfirmationHelper.retransfer_data() """
+        request_ids = [ request_id ] if request_id else []
+        return self.make_batch_data_files( datetime_object, [data_string], request_ids )
+
+    def make_batch_data_files( self, datetime_object, data_strings, request_ids=() ):
+        """ Creates, in a fresh staging directory, a data file holding one las line per request, and the matching count file.
+            Returns the two local filepaths; pass either to cleanup() once sent.
+            Called by make_data_files(), models.TransferQueueProcessor.run_batch(), models.BulkResubmitter.send_batch() """
+        self.remove_stale_staging_dirs()
+        with metrics.timer( u'easyscan_prep_seconds' ):
+            staging_dir_path = tempfile.mkdtemp( prefix=self.staging_dir_prefix, dir=self.source_transfer_dir_path )
+            filename_stem = self.make_filename_stem( datetime_object, request_ids )
+            data_filepath = self.save_data_file( staging_dir_path, filename_stem, data_strings )
+            count_filepath = self.save_count_file( staging_dir_path, filename_stem, len(data_strings) )
+        log.debug( u'in lib.magic_bus.Prepper.make_batch_data_files(); data_filepath, `%s`; count_filepath, `%s`' % (data_filepath, count_filepath) )
+        return ( data_filepath, count_filepath )
+
+    def cleanup( self, filepath ):
+        """ Removes the staging directory holding filepath after a successful send.
+            Called by models.TransferQueueProcessor.run_batch(), models.BulkResubmitter.send_batch(), models.TryAgainConfirmationHelper.retransfer_data() """
+        staging_dir_path = os.path.dirname( filepath )
+        if os.path.dirname( staging_dir_path ) == self.source_transfer_dir_path.rstrip( u'/' ):  # never remove anything outside our own staging area
+            shutil.rmtree( staging_dir_path, ignore_errors=True )
+        return
 
-    def make_data_files( self, datetime_object, data_string ):
-        """ Creates data files that will be transferred to remote server.
-            Called by models.RequestViewPostHelper.transfer_data().
-            Future: will likely be triggered by a queued-job. """
-        self.ensure_empty_dir()
-        filename_datestring = self.make_filename_datestring( datetime_object )
-        data_filename = self.save_data_file( filename_datestring, data_string )
-        count_filename = self.save_count_file( filename_datestring )
-        log.debug( u'in lib.magic_bus.Prepper.make_data_files(); data_filename, `%s`; count_filename, `%s`' % (data_filename, count_filename) )
-        return ( data_filename, count_filename )
-
-    def ensure_empty_dir( self ):
-        """ Empties source-transfer directory.
-            Called by make_data_files() """
-        filelist = os.listdir( self.source_transfer_dir_path )
-        for filename in filelist:
-            delete_path = u'%s/%s' % ( self.source_transfer_dir_path, filename )
-            os.remove( delete_path )
+    def remove_stale_staging_dirs( self ):
+        """ Removes staging directories left by failed transfers once they're older than the max-age.
+            (Fresh failures are kept for inspection; the queue regenerates files on retry.)
+            Runs at most once per sweep-interval per process.
+            Called by make_batch_data_files() """
+        if time.time() - self.last_sweep_time < self.staging_sweep_interval_seconds:
+            return
+        self.last_sweep_time = time.time()
+        cutoff = time.time() - self.staging_max_age_seconds
+        for entry in os.listdir( self.source_transfer_dir_path ):
+            path = os.path.join( self.source_transfer_dir_path, entry )
+            try:
+                if entry.startswith( self.staging_dir_prefix ) and os.path.isdir( path ) and os.path.getmtime( path ) < cutoff:
+                    shutil.rmtree( path, ignore_errors=True )
+            except OSError:  # another worker got there first
+                pass
         return
 
+    def make_filename_stem( self, datetime_object, request_ids ):
+        """ Returns the part of the filename between prefix and suffix, unique across processes and hosts.
+            Example returned format, `2014-12-08T15:40:59.123456_r42-3_9f3c2a1b0d4e`:
+              microsecond timestamp, first request-id & request-count (when known), and a random tag.
+            The request-id makes names unique across workers; the tag covers retries of the same request.
+            Called by make_batch_data_files() """
+        parts = [ u'%s.%06d' % ( self.make_filename_datestring(datetime_object), datetime_object.microsecond ) ]
+        if request_ids:
+            parts.append( u'r%s-%s' % (request_ids[0], len(request_ids)) )
+        parts.append( uuid.uuid4().hex[0:12] )
+        return u'_'.join( parts )
+
     def make_filename_datestring( self, datetime_object ):
         """ Returns formatted date string.
             Example returned format, `2014-12-08T15:40:59`.
-            Called by make_data_files() """
+            Called by make_filename_stem() """
         utf8_date_string = datetime_object.strftime( u'%Y-%m-%dT%H:%M:%S' )  # temp: REQ-PARSED_2014-09-29T13:10:02.dat
         date_string = utf8_date_string.decode( u'utf-8' )
         return date_string
 
-    def save_data_file( self, filename_datestring, data_string ):
-        """ Saves data file.
-            Called by make_data_files() """
-        filename = u'%s_%s%s' % ( self.filename_prefix, filename_datestring, self.data_file_suffix )
-        filepath = u'%s/%s' % ( self.source_transfer_dir_path, filename )
-        buffer1 = data_string.strip()
-        buffer2 = buffer1 + u'\n'
-        utf8_data_string = buffer2.encode( u'utf-8', u'replace' )
-        with open( filepath, u'w' ) as f:
-            f.write( utf8_data_string )
-        os.chmod( filepath, 0o664 )
-        return filename
-
-    def save_count_file( self, filename_datestring ):
-        """ Saves count file.
-            Called by make_data_files() """
-        filename = u'%s_%s%s' % ( self.filename_prefix, filename_datestring, self.count_file_suffix )
-        filepath = u'%s/%s' % ( self.source_transfer_dir_path, filename )
-        with open( filepath, u'w' ) as f:
-            f.write( '1\n' )
-        os.chmod( filepath, 0o664 )
-        return filename
+    def save_data_file( self, staging_dir_path, filename_stem, data_strings ):
+        """ Saves data file, one las line per entry of data_strings; returns filepath.
+            Called by make_batch_data_files() """
+        filename = u'%s_%s%s' % ( self.filename_prefix, filename_stem, self.data_file_suffix )
+        data_buffer = u''.join( [ data_string.strip() + u'\n' for data_string in data_strings ] )
+        return self.write_file( staging_dir_path, filename, data_buffer.encode(u'utf-8', u'replace') )
+
+    def save_count_file( self, staging_dir_path, filename_stem, count=1 ):
+        """ Saves count file; returns filepath.
+            Called by make_batch_data_files() """
+        filename = u'%s_%s%s' % ( self.filename_prefix, filename_stem, self.count_file_suffix )
+        return self.write_file( staging_dir_path, filename, b'%d\n' % count )
+
+    def write_file( self, staging_dir_path, filename, utf8_data ):
+        """ Writes to a temporary name, then renames, so a file is never seen half-written; returns filepath.
+            Called by save_data_file(), save_count_file() """
+        filepath = u'%s/%s' % ( staging_dir_path, filename )
+        partial_filepath = u'%s.partial' % filepath
+        with open( partial_filepath, u'w' ) as f:
+            f.write( utf8_data )
+        os.chmod( partial_filepath, 0o664 )
+        os.rename( partial_filepath, filepath )
+        return filepath
+
+
+class SftpConnection( object ):
+    """ Keeps one authenticated ssh transport and sftp session alive for reuse across transfers.
+        Obtained via get_connection(); used by Sender. """
+
+    def __init__( self, server, username, password ):
+        self.SERVER = server
+        self.USERNAME = username
+        self.PASSWORD = password
+        self.KEEPALIVE_SECONDS = int( os.environ.get(u'EZSCAN__SFTP_KEEPALIVE_SECONDS', u'30') )
+        self.lock = threading.RLock()  # one transfer at a time per session
+        self.ssh = None
+        self.sftp = None
+        self.pid = None
+
+    def get_sftp( self ):
+        """ Returns a live sftp client, (re)connecting if needed.
+            Called by Sender.transfer_files() """
+        if not self.is_healthy():
+            self.close()
+            self.connect()
+        return self.sftp
+
+    def is_healthy( self ):
+        """ Checks that the session belongs to this process and the transport still answers; returns boolean.
+            Called by get_sftp() """
+        if self.sftp is None or self.pid != os.getpid():  # a forked worker must never reuse its parent's socket
+            return False
+        transport = self.ssh.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        try:
+            transport.send_ignore()
+        except Exception as e:
+            log.debug( u'in lib.magic_bus.SftpConnection.is_healthy(); transport check failed, `%s`' % repr(e) )
+            return False
+        return True
+
+    def connect( self ):
+        """ Sets up ssh client with keepalives and opens sftp session.
+            Called by get_sftp() """
+        with metrics.timer( u'easyscan_sftp_connect_seconds' ):
+            self.ssh = self.setup_ssh()
+            self.ssh.get_transport().set_keepalive( self.KEEPALIVE_SECONDS )
+            self.sftp = self.ssh.open_sftp()
+        self.pid = os.getpid()
+        log.debug( u'in lib.magic_bus.SftpConnection.connect(); sftp session opened' )
+        return
+
+    def setup_ssh( self ):
+        """ Sets up and returns ssh object.
+            Called by connect() """
+        ssh = paramiko.SSHClient()
+        log.debug( u'in lib.magic_bus.SftpConnection.setup_ssh(); ssh client instantiated' )
+        ssh.set_missing_host_key_policy( paramiko.AutoAddPolicy() )
+        log.debug( u'in lib.magic_bus.SftpConnection.setup_ssh(); ssh missing key policy set' )
+        ssh.connect( self.SERVER, username=self.USERNAME, password=self.PASSWORD )
+        log.debug( u'in lib.magic_bus.SftpConnection.setup_ssh(); ssh connection made' )
+        return ssh
+
+    def close( self ):
+        """ Closes session, ignoring errors from an already-dead connection.
+            Called by get_sftp(), Sender.transfer_files() """
+        if self.ssh is not None and self.pid == os.getpid():  # closing an inherited socket would break the parent's session
+            try:
+                self.ssh.close()
+            except Exception as e:
+                log.debug( u'in lib.magic_bus.SftpConnection.close(); error closing, `%s`' % repr(e) )
+        ( self.ssh, self.sftp, self.pid ) = ( None, None, None )
+        return
+
+    # end class SftpConnection
+
+
+def get_connection( server, username, password ):
+    """ Returns the process-wide SftpConnection for the server/username.
+        Called by Sender.transfer_files() """
+    key = ( server, username )
+    with connections_lock:
+        if key not in connections:
+            connections[key] = SftpConnection( server, username, password )
+        return connections[key]
 
 
 class Sender( object ):
@@ -77,51 +207,41 @@ class Sender( object ):
         self.SERVER = unicode( os.environ[u'EZSCAN__REMOTE_SERVER'] )
         self.USERNAME = unicode( os.environ[u'EZSCAN__TRANSFER_USERNAME'] )
         self.PASSWORD = unicode( os.environ[u'EZSCAN__TRANSFER_PASSWORD'] )
-        self.LOCAL_DIR = unicode( os.environ[u'EZSCAN__SOURCE_TRANSFER_DIR_PATH'] )
         self.REMOTE_DATA_DIR = unicode( os.environ[u'EZSCAN__REMOTE_TRANSFER_DATA_DIR_PATH'] )
         self.REMOTE_COUNT_DIR = unicode( os.environ[u'EZSCAN__REMOTE_TRANSFER_COUNT_DIR_PATH'] )
 
-    def transfer_files( self, data_filename, count_filename ):
-        """ Transfers data-file and count-file.
-            Called by models.RequestViewPostHelper.transfer_data()
-            Future: will likely be triggered by a queued-job. """
-        ( data_source_fp, data_remote_fp, count_source_fp, count_remote_fp ) = self.build_filepaths( data_filename, count_filename )
-        ssh = self.setup_ssh()
-        self.run_sftp( ssh, data_source_fp, data_remote_fp, count_source_fp, count_remote_fp )
-        ssh.close()
+    def transfer_files( self, data_source_fp, count_source_fp ):
+        """ Transfers data-file and count-file over the pooled sftp session.
+            A session that dies mid-transfer is reopened and the transfer retried once.
+            Called by models.TransferQueueProcessor.run_batch(), models.BulkResubmitter.send_batch(), models.TryAgainConfirmationHelper.retransfer_data() """
+        ( data_remote_fp, count_remote_fp ) = self.build_remote_filepaths( data_source_fp, count_source_fp )
+        connection = get_connection( self.SERVER, self.USERNAME, self.PASSWORD )
+        with connection.lock:
+            try:
+                self.run_sftp( connection.get_sftp(), data_source_fp, data_remote_fp, count_source_fp, count_remote_fp )
+            except ( paramiko.SSHException, socket.error, EOFError ) as e:
+                log.warning( u'in lib.magic_bus.Sender.transfer_files(); session error, `%s`; reconnecting' % repr(e) )
+                connection.close()
+                self.run_sftp( connection.get_sftp(), data_source_fp, data_remote_fp, count_source_fp, count_remote_fp )
         log.debug( u'in lib.magic_bus.Sender.transfer_files(); files transferred' )
         return
 
-    def build_filepaths( self, data_filename, count_filename ):
-        """ Builds and returns tuple of source and remote filepaths.
+    def build_remote_filepaths( self, data_source_fp, count_source_fp ):
+        """ Builds and returns tuple of remote filepaths; remote filenames match the local ones.
             Called by transfer_files() """
-        data_source_fp = '%s/%s' % ( self.LOCAL_DIR, data_filename )
-        data_remote_fp = '%s/%s' % ( self.REMOTE_DATA_DIR, data_filename )
-        count_source_fp = '%s/%s' % ( self.LOCAL_DIR, count_filename )
-        count_remote_fp = '%s/%s' % ( self.REMOTE_COUNT_DIR, count_filename )
+        data_remote_fp = '%s/%s' % ( self.REMOTE_DATA_DIR, os.path.basename(data_source_fp) )
+        count_remote_fp = '%s/%s' % ( self.REMOTE_COUNT_DIR, os.path.basename(count_source_fp) )
         log.debug( 'data_source_fp, ```%s```' % data_source_fp )
         log.debug( 'data_remote_fp, ```%s```' % data_remote_fp )
         log.debug( 'count_source_fp, ```%s```' % count_source_fp )
         log.debug( 'count_remote_fp, ```%s```' % count_remote_fp )
-        return ( data_source_fp, data_remote_fp, count_source_fp, count_remote_fp )
-
-    def setup_ssh( self ):
-        """ Sets up and returns ssh object.
-            Called by transfer_files() """
-        ssh = paramiko.SSHClient()
-        log.debug( u'in lib.magic_bus.Sender.setup_ssh(); ssh client instantiated' )
-        ssh.set_missing_host_key_policy( paramiko.AutoAddPolicy() )
-        log.debug( u'in lib.magic_bus.Sender.setup_ssh(); ssh missing key policy set' )
-        ssh.connect( self.SERVER, username=self.USERNAME, password=self.PASSWORD )
-        log.debug( u'in lib.magic_bus.Sender.setup_ssh(); ssh connection made' )
-        return ssh
+        return ( data_remote_fp, count_remote_fp )
 
-    def run_sftp( self, ssh, data_source_fp, data_remote_fp, count_source_fp, count_remote_fp ):
-        """ Instantiates and runs sftp transfer.
+    def run_sftp( self, sftp, data_source_fp, data_remote_fp, count_source_fp, count_remote_fp ):
+        """ Runs sftp transfer on an open session.
             Called by transfer_files() """
-        sftp = ssh.open_sftp()
-        sftp.put( data_source_fp, data_remote_fp )
-        sftp.put( count_source_fp, count_remote_fp )
-        sftp.close()
+        with metrics.timer( u'easyscan_sftp_put_seconds' ):
+            sftp.put( data_source_fp, data_remote_fp )
+            sftp.put( count_source_fp, count_remote_fp )
         log.debug( u'in lib.magic_bus.Sender.run_sftp(); sftp executed' )
         return
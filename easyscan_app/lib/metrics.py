@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+""" Counters and latency histograms, exported in prometheus text format.
+    Each process (passenger workers, queue workers) keeps its own values in memory and flushes them to
+      `EZSCAN__METRICS_DIR/metrics_<pid>.json`; render() sums every process's file, so the numbers cover all workers.
+    Used by models.MetricsHelper, and by hooks in models, lib.magic_bus and lib.availability. """
+
+from __future__ import unicode_literals
+
+import atexit, collections, contextlib, glob, json, logging, os, tempfile, threading, time
+
+
+log = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = ( 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0 )
+
+FAMILIES = collections.OrderedDict( [  # name -> ( type, help, histogram-buckets )
+    ( 'easyscan_submissions_total', ('counter', 'Scan requests saved from the request form.', None) ),
+    ( 'easyscan_las_transfers_total', ('counter', 'Scan requests sent to the LAS server, by source (queue, try_again, bulk) and outcome.', None) ),
+    ( 'easyscan_try_again_resubmits_total', ('counter', 'Try-again resubmits, by outcome.', None) ),
+    ( 'easyscan_availability_lookups_total', ('counter', 'Title lookups, by result (hit: cached; miss: fetched from the api; error; breaker_open).', None) ),
+    ( 'easyscan_prep_seconds', ('histogram', 'Time to write a data/count file pair.', LATENCY_BUCKETS) ),
+    ( 'easyscan_sftp_connect_seconds', ('histogram', 'Time to open an ssh/sftp session to the LAS server.', LATENCY_BUCKETS) ),
+    ( 'easyscan_sftp_put_seconds', ('histogram', 'Time to put a data/count file pair on an open sftp session.', LATENCY_BUCKETS) ),
+    ( 'easyscan_smtp_send_seconds', ('histogram', 'Time to send one outbox email on an open smtp connection.', LATENCY_BUCKETS) ),
+    ] )
+
+
+class MetricsStore( object ):
+    """ Holds this process's samples, keyed by their prometheus sample text, eg `easyscan_sftp_put_seconds_bucket{le="0.5"}`;
+          histogram buckets are stored cumulative, so summing samples across processes stays valid. """
+
+    def __init__( self ):
+        self.DIR = os.environ.get( 'EZSCAN__METRICS_DIR', os.path.join(tempfile.gettempdir(), 'easyscan_metrics') )
+        self.FLUSH_SECONDS = float( os.environ.get('EZSCAN__METRICS_FLUSH_SECONDS', '5') )
+        self.lock = threading.Lock()
+        self.pid = None
+        self.samples = {}
+        self.last_flush = 0
+
+    def inc( self, name, labels=None, amount=1 ):
+        """ Adds amount to a counter.
+            Called by hooks in models, lib.magic_bus, lib.availability """
+        if name not in FAMILIES:
+            raise KeyError( name )
+        with self.lock:
+            self.check_pid()
+            key = self.sample_key( name, labels )
+            self.samples[key] = self.samples.get( key, 0 ) + amount
+        self.maybe_flush()
+
+    def observe( self, name, seconds, labels=None ):
+        """ Records one duration in a histogram.
+            Called by timer(), and hooks in models """
+        buckets = FAMILIES[name][2]
+        with self.lock:
+            self.check_pid()
+            for bound in buckets:
+                if seconds <= bound:
+                    key = self.sample_key( name + '_bucket', labels, le=repr(bound) )
+                    self.samples[key] = self.samples.get( key, 0 ) + 1
+            for ( key, amount ) in [ (self.sample_key(name + '_bucket', labels, le='+Inf'), 1), (self.sample_key(name + '_count', labels), 1), (self.sample_key(name + '_sum', labels), seconds) ]:
+                self.samples[key] = self.samples.get( key, 0 ) + amount
+        self.maybe_flush()
+
+    @contextlib.contextmanager
+    def timer( self, name, labels=None ):
+        """ Observes the block's duration, whether or not it raises.
+            Called by hooks in models, lib.magic_bus """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe( name, time.time() - start, labels )
+
+    def sample_key( self, name, labels, le=None ):
+        """ Returns sample text, labels sorted, eg `easyscan_las_transfers_total{outcome="success",source="queue"}`.
+            Called by inc(), observe(), render() """
+        pairs = sorted( (labels or {}).items() )
+        if le is not None:
+            pairs.append( ('le', le) )
+        if not pairs:
+            return name
+        escaped = [ '%s="%s"' % ( key, unicode(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') ) for ( key, value ) in pairs ]
+        return '%s{%s}' % ( name, ','.join(escaped) )
+
+    def check_pid( self ):
+        """ On first use, and after a fork, starts from this pid's file -- so a reused pid keeps counting up -- rather than the parent's values.
+            Called under the lock by inc(), observe(), flush() """
+        if self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        self.samples = {}
+        try:
+            with open( self.build_filepath() ) as f:
+                self.samples = json.load( f )
+        except ( IOError, ValueError ):
+            pass
+        return
+
+    def build_filepath( self ):
+        return os.path.join( self.DIR, 'metrics_%s.json' % self.pid )
+
+    def maybe_flush( self ):
+        """ Flushes at most once per FLUSH_SECONDS.
+            Called by inc(), observe() """
+        if time.time() - self.last_flush >= self.FLUSH_SECONDS:
+            self.flush()
+
+    def flush( self ):
+        """ Writes this process's samples to its file, via a rename so readers never see half a file.
+            Errors are logged, never raised; metrics must not break a request.
+            Called by maybe_flush(), render(), and at exit """
+        with self.lock:
+            self.check_pid()
+            self.last_flush = time.time()
+            filepath = self.build_filepath()
+            try:
+                if not os.path.isdir( self.DIR ):
+                    os.makedirs( self.DIR )
+                with open( '%s.partial' % filepath, 'w' ) as f:
+                    json.dump( self.samples, f )
+                os.rename( '%s.partial' % filepath, filepath )
+            except ( IOError, OSError ) as e:
+                log.warning( 'MetricsStore(); flush failed, `%s`' % unicode(repr(e)) )
+        return
+
+    def collect( self ):
+        """ Returns samples summed across every process's file.
+            Called by render() """
+        totals = {}
+        for filepath in glob.glob( os.path.join(self.DIR, 'metrics_*.json') ):
+            try:
+                with open( filepath ) as f:
+                    samples = json.load( f )
+            except ( IOError, ValueError ):  # removed, or being replaced, mid-scrape
+                continue
+            for ( key, value ) in samples.items():
+                totals[key] = totals.get( key, 0 ) + value
+        return totals
+
+    def render( self, gauges=() ):
+        """ Returns prometheus text for all families, plus gauges -- ( name, help, [(labels, value), ...] ) -- computed by the caller.
+            Called by models.MetricsHelper.build_response() """
+        self.flush()
+        totals = self.collect()
+        lines = []
+        for ( name, (metric_type, help_text, buckets) ) in FAMILIES.items():
+            lines.extend( ['# HELP %s %s' % (name, help_text), '# TYPE %s %s' % (name, metric_type)] )
+            family_keys = [ key for key in totals if key == name or key.startswith(name + '{') or key.startswith(name + '_') ]
+            for key in sorted( family_keys, key=self.sort_key ):
+                lines.append( '%s %s' % (key, self.format_value(totals[key])) )
+        for ( name, help_text, values ) in gauges:
+            lines.extend( ['# HELP %s %s' % (name, help_text), '# TYPE %s gauge' % name] )
+            for ( labels, value ) in values:
+                lines.append( '%s %s' % (self.sample_key(name, labels), self.format_value(value)) )
+        return '\n'.join( lines ) + '\n'
+
+    def sort_key( self, key ):
+        """ Orders samples by labels, buckets numerically with +Inf last, then _count and _sum.
+            Called by render() """
+        ( name, _, labels ) = key.partition( '{' )
+        le = 0.0
+        if 'le="' in labels:
+            le_text = labels.split( 'le="' )[1].split( '"' )[0]
+            le = float( 'inf' ) if le_text == '+Inf' else float( le_text )
+            labels = labels.split( 'le="' )[0]
+        return ( name, labels, le )
+
+    def format_value( self, value ):
+        return repr( float(value) ) if isinstance( value, float ) else unicode( value )
+
+    # end class MetricsStore
+
+
+metrics = MetricsStore()
+atexit.register( metrics.flush )
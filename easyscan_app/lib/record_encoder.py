@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+""" Builds json-compatible record dicts straight from db rows.
+    Used by models.ScanRequest.jsonify(), models.TryAgainHelper, models.TryAgainConfirmationHelper """
+
+from __future__ import unicode_literals
+
+import datetime, decimal, json, logging, uuid
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+log = logging.getLogger(__name__)
+
+
+class RecordEncoder( object ):
+    """ Produces the same `{model, pk, fields}` dicts as `json.loads( serializers.serialize('json', ...) )`,
+          but from `values()` rows, skipping model instantiation and the string round-trip. """
+
+    def __init__( self, model, exclude=() ):
+        self.model_label = '%s.%s' % ( model._meta.app_label, model._meta.model_name )
+        self.pk_attname = model._meta.pk.attname
+        self.fields = [  # ( output-key, row-key ); foreign-keys serialize under the field name with the raw id
+            ( field.name, field.attname ) for field in model._meta.concrete_fields if not field.primary_key and field.name not in exclude ]
+        self.json_encoder = DjangoJSONEncoder()
+
+    def value_names( self ):
+        """ Returns the names to pass to `queryset.values()`.
+            Called by encode_queryset(), and by callers building their own values() queries. """
+        return [ self.pk_attname ] + [ attname for ( name, attname ) in self.fields ]
+
+    def encode_row( self, row ):
+        """ Returns record dict for a values() row.
+            Called by encode_queryset(), encode_instance() """
+        fields = {}
+        for ( name, attname ) in self.fields:
+            value = row[attname]
+            if isinstance( value, (datetime.date, datetime.time, datetime.timedelta, decimal.Decimal, uuid.UUID) ):
+                value = self.json_encoder.default( value )  # the string django's json serializer would have written
+            fields[name] = value
+        return { 'model': self.model_label, 'pk': row[self.pk_attname], 'fields': fields }
+
+    def encode_instance( self, instance ):
+        """ Returns record dict for an already-loaded model instance.
+            Called by models.ScanRequest.jsonify() """
+        row = dict( [ (attname, getattr(instance, attname)) for attname in self.value_names() ] )
+        return self.encode_row( row )
+
+    def encode_queryset( self, queryset ):
+        """ Yields record dicts, fetching only the encoder's columns.
+            Called by models.TryAgainConfirmationHelper.build_get_data_dct() """
+        for row in queryset.values( *self.value_names() ).iterator():
+            yield self.encode_row( row )
+
+    def stream_json_list( self, records, indent='    ' ):
+        """ Yields a json list a record at a time, so large results never exist as one string.
+            Called by models.TryAgainHelper.stream_json() """
+        yield '['
+        for ( i, record ) in enumerate( records ):
+            yield '%s\n%s%s' % ( ',' if i else '', indent, json.dumps(record, sort_keys=True) )
+        yield '\n%s]' % indent[0:-2]
+
+    # end class RecordEncoder
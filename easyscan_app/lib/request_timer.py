@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+""" Per-request phase timing.
+    RequestTimingMiddleware times each request, and phase() blocks inside it;
+      the response gets a `Server-Timing` header, and one json log line is written per request, with a full breakdown when slow.
+    Outside a request (eg in the queue workers) phase() does nothing. """
+
+from __future__ import unicode_literals
+
+import contextlib, json, logging, os, threading, time
+from django.db import connections
+from django.utils.deprecation import MiddlewareMixin
+
+
+log = logging.getLogger(__name__)
+state = threading.local()  # .timings: { phase-name: [seconds, count] } while a request is being timed, else absent or None
+
+
+@contextlib.contextmanager
+def phase( name ):
+    """ Adds the block's duration to the current request's `name` phase.
+        Called by models helpers around the availability-api lookup, file-prep, sftp, and the patron-email enqueue. """
+    timings = getattr( state, 'timings', None )
+    if timings is None:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        entry = timings.setdefault( name, [0.0, 0] )
+        entry[0] += time.time() - start
+        entry[1] += 1
+
+
+class RequestTimingMiddleware( MiddlewareMixin ):
+    """ Times requests by phase.
+        Db time is opt-in (EZSCAN__REQUEST_TIMING_DB): it switches on django's debug cursor for the request, which records and formats every query. """
+
+    def __init__( self, get_response=None ):
+        super( RequestTimingMiddleware, self ).__init__( get_response )
+        self.SLOW_REQUEST_MS = float( os.environ.get('EZSCAN__SLOW_REQUEST_MS', '1000') )
+        self.TIME_DB = json.loads( os.environ.get('EZSCAN__REQUEST_TIMING_DB', 'false') )
+
+    def process_request( self, request ):
+        state.timings = {}
+        state.start = time.time()
+        state.db_marks = []  # ( connection, queries-logged-before, force_debug_cursor-before )
+        if self.TIME_DB:
+            for connection in connections.all():
+                state.db_marks.append( (connection, len(connection.queries_log), connection.force_debug_cursor) )
+                connection.force_debug_cursor = True
+        return None
+
+    def process_response( self, request, response ):
+        timings = getattr( state, 'timings', None )
+        if timings is None:  # process_request didn't run, eg an earlier middleware answered
+            return response
+        try:
+            total_ms = ( time.time() - state.start ) * 1000
+            queries = self.collect_queries()
+            if queries:
+                timings['db'] = [ sum([ float(query['time']) for query in queries ]), len(queries) ]
+            response['Server-Timing'] = self.build_header( timings, total_ms )
+            self.log_timings( request, response, timings, total_ms, queries )
+        except Exception as e:
+            log.error( 'RequestTimingMiddleware(); error, `%s`' % unicode(repr(e)) )
+        finally:
+            state.timings = None
+        return response
+
+    def collect_queries( self ):
+        """ Returns queries run during the request, restoring each connection's debug-cursor setting.
+            Called by process_response() """
+        queries = []
+        for ( connection, mark, force_debug_cursor ) in state.db_marks:
+            queries.extend( list(connection.queries_log)[mark:] )  # queries_log is a bounded deque; a huge request may have rotated some out
+            connection.force_debug_cursor = force_debug_cursor
+        state.db_marks = []
+        return queries
+
+    def build_header( self, timings, total_ms ):
+        """ Returns `Server-Timing` value, eg `db;dur=3.1, sftp;dur=812.0, total;dur=840.2`.
+            Called by process_response() """
+        metrics = [ '%s;dur=%.1f' % (name, seconds * 1000) for ( name, (seconds, count) ) in sorted(timings.items()) ]
+        metrics.append( 'total;dur=%.1f' % total_ms )
+        return ', '.join( metrics )
+
+    def log_timings( self, request, response, timings, total_ms, queries ):
+        """ Logs one json line per request; over SLOW_REQUEST_MS, a warning with call-counts and the slowest queries too.
+            Called by process_response() """
+        data = {
+            'method': request.method, 'path': request.path, 'status': response.status_code, 'total_ms': round( total_ms, 1 ),
+            'phases_ms': dict( [ (name, round(seconds * 1000, 1)) for ( name, (seconds, count) ) in timings.items() ] ) }
+        if total_ms < self.SLOW_REQUEST_MS:
+            log.info( 'request_timing %s' % json.dumps(data, sort_keys=True) )
+            return
+        data['phase_counts'] = dict( [ (name, count) for ( name, (seconds, count) ) in timings.items() ] )
+        data['slowest_queries'] = [
+            { 'ms': round(float(query['time']) * 1000, 1), 'sql': query['sql'][0:300] } for query in sorted( queries, key=lambda query: -float(query['time']) )[0:5] ]
+        log.warning( 'slow_request %s' % json.dumps(data, sort_keys=True) )
+        return
+
+    # end class RequestTimingMiddleware
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import logging, re, unicodedata
+
+
+log = logging.getLogger(__name__)
+
+
+class SearchTextMaker( object ):
+    """ Builds the normalized text admin searches run against, and normalizes search terms the same way.
+        Called by models.ScanRequest.save(), admin.ScanRequestAdmin, and the search_text backfill migration. """
+
+    SOURCE_FIELDS = [
+        'item_title', 'item_barcode', 'item_callnumber', 'item_volume_year', 'item_chap_vol_title', 'item_page_range_other', 'item_other',
+        'patron_name', 'patron_barcode', 'patron_email', 'admin_notes' ]
+
+    def __init__( self ):
+        self.whitespace = re.compile( r'\s+', re.UNICODE )
+
+    def make_search_text( self, obj ):
+        """ Returns one normalized string from obj's SOURCE_FIELDS.
+            Called by models.ScanRequest.save() """
+        values = [ getattr(obj, field_name) or '' for field_name in self.SOURCE_FIELDS ]
+        return self.normalize( ' '.join(values) )
+
+    def normalize( self, text ):
+        """ Returns text lowercased, with accents dropped and whitespace collapsed; `Müller  Café` -> `muller cafe`.
+            Called by make_search_text(), admin.ScanRequestAdmin.get_search_results() """
+        decomposed = unicodedata.normalize( 'NFKD', text )
+        stripped = ''.join( [ char for char in decomposed if not unicodedata.combining(char) ] )
+        return self.whitespace.sub( ' ', stripped.lower() ).strip()
+
+    # end class SearchTextMaker
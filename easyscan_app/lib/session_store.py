@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+""" Session engine that writes a session only when its contents changed.
+    Set as settings.SESSION_ENGINE; wraps the engine named by EZSCAN__SESSION_BASE_ENGINE --
+      by default cached_db when EZSCAN__CACHES_JSON configures a shared cache, else db,
+      since cached_db over each worker's own local-memory cache would serve, and save back, stale sessions. """
+
+from __future__ import unicode_literals
+
+import json, logging, os
+from importlib import import_module
+
+
+log = logging.getLogger(__name__)
+DEFAULT_BASE_ENGINE = 'django.contrib.sessions.backends.cached_db' if os.environ.get( 'EZSCAN__CACHES_JSON' ) else 'django.contrib.sessions.backends.db'
+base_engine = import_module( os.environ.get('EZSCAN__SESSION_BASE_ENGINE', DEFAULT_BASE_ENGINE) )
+
+
+class ChangeOnlySessionMixin( object ):
+    """ Reports `modified` by comparing the session's contents with what was loaded,
+          so re-setting an unchanged value costs no write, while in-place changes to nested dicts
+          -- eg `request.session['item_info']['title'] = title` -- are still saved. """
+
+    def _get_modified( self ):
+        if self._modified:  # set by flush(), cycle_key(), pop(), etc.
+            return True
+        if not hasattr( self, '_session_cache' ):  # never read, so unchanged
+            return False
+        current = self.snapshot( self._session_cache )
+        return current is None or current != getattr( self, '_loaded_snapshot', None )
+
+    def _set_modified( self, value ):
+        self._modified = value
+
+    modified = property( _get_modified, _set_modified )
+
+    def __setitem__( self, key, value ):
+        self._session[key] = value  # no modified-flag; the snapshot comparison decides
+
+    def load( self ):
+        data = super( ChangeOnlySessionMixin, self ).load()
+        self._loaded_snapshot = self.snapshot( data )
+        return data
+
+    def snapshot( self, data ):
+        """ Returns comparable text of the session data, or None if it can't be made (treated as changed).
+            Called by _get_modified(), load() """
+        try:
+            return json.dumps( data, sort_keys=True, separators=(',', ':') )
+        except ( TypeError, ValueError ):
+            return None
+
+    # end class ChangeOnlySessionMixin
+
+
+class SessionStore( ChangeOnlySessionMixin, base_engine.SessionStore ):
+    pass
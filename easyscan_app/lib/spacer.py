@@ -15,54 +15,60 @@ class Spacer( object ):
     def __init__( self ):
         self.notes_line_length = 50
         self.spacer_character = ' '
+        self.MAX_CACHE_ENTRIES = 512
+        self.cache = {}  # ( notes_line_length, spacer_character, start_string ) -> spaced string; short strings only
 
     def add_spacer( self, start_string ):
         """ Manages spacer code.
-            Called by x() """
+            Results for strings no longer than a line -- the constant notes headers, emails -- are memoized.
+            Called by data_prepper.LasDataMaker """
+        cacheable = len( start_string ) <= self.notes_line_length
+        if cacheable:
+            key = ( self.notes_line_length, self.spacer_character, start_string )
+            full_line = self.cache.get( key )
+            if full_line is not None:
+                return full_line
         lines = self.convert_string_to_lines( start_string.strip() )
-        full_line = ''
-        for line in lines:
-            spaced_line = self.make_spaced_line( line )
-            full_line = full_line + spaced_line
-        log.debug( 'full_line, ```{0}```'.format(full_line) )
+        full_line = ''.join( [ self.make_spaced_line(line) for line in lines ] )
+        if cacheable:
+            if len( self.cache ) >= self.MAX_CACHE_ENTRIES:
+                self.cache.clear()
+            self.cache[key] = full_line
         return full_line
 
     def convert_string_to_lines( self, start_string ):
         """ Converts full-string to separate lines of words, trying to keep each line's length less-than-or-equal-to the line-length limit.
               (Goal not possible if word-length exceeds line-length limit.)
+            Builds each line as a list of words with a running length, so long text wraps in linear time.
+            Long-standing quirks kept on purpose, since las notes depend on them:
+              - a word at least a line long becomes its own line, and words gathered before it on the current line are dropped
+              - a word is only added if the line would still have room for a trailing space
+              - the final line is dropped if it equals the line before it
             Called by add_spacer() """
-        ( lines, words, line ) = ( [], start_string.split(), '' )
-        for word in words:
-            ( line, lines ) = self.apply_word_logic( word, line, lines )
+        limit = self.notes_line_length
+        ( lines, line_words, line_length ) = ( [], [], 0 )  # line_length is len( ' '.join(line_words) )
+        for word in start_string.split():
+            word_length = len( word )
+            if word_length >= limit:
+                lines.append( word )
+                ( line_words, line_length ) = ( [], 0 )
+            elif line_length + word_length + 2 <= limit:
+                line_length = line_length + word_length + 1 if line_words else word_length
+                line_words.append( word )
+            else:
+                lines.append( ' '.join(line_words) )
+                ( line_words, line_length ) = ( [word], word_length )
+        line = ' '.join( line_words )
         if len(lines) == 0:  # lines was empty, so add line
-            lines.append( line.strip() )
-        elif lines[-1] != line:  # the last line of lines doesn't match the current line...
-            if len(line) > 0:  # ...and the current line is not empty, so add it to lines
-                lines.append( line.strip() )
-        log.debug( 'lines, ```{0}```'.format(lines) )
+            lines.append( line )
+        elif lines[-1] != line and len(line) > 0:  # the current line is new and not empty, so add it to lines
+            lines.append( line )
         return lines
 
-    def apply_word_logic( self, word, line, lines ):
-        """ Builds a line word-by-word. Just before the line-length would exceed the maximum limit,
-              adds the line to lines, and starts with a fresh empty line.
-            Called by convert_string_to_lines() """
-        if len(word) >= self.notes_line_length:  # if word is greater-or-equal-to max-line-length (sigh), update `lines` & refresh `line`
-            lines.append( word )
-            line = ''
-        elif ( len(line) + len(' ') + len(word) + len(' ') <= self.notes_line_length ):  # if adding the word to the line doesn't make the line too long, do it
-            line = '{ln} {wd}'.format( ln=line, wd=word ).lstrip()
-        elif ( len(line) + len(' ') + len(word) + len(' ') > self.notes_line_length ):  # if adding the word to the line makes it too long, and the line to lines, and add the word to the new line
-            lines.append( line.strip() )
-            line = word
-        else:
-            raise Exception( 'condition not handled' )
-        return ( line, lines )
-
     def make_spaced_line( self, line ):
         spacers_needed = self.calc_spacers_needed( line )
         line_spacer = self.assemble_spacer( spacers_needed )
         spaced_line = line + line_spacer
-        log.debug( 'spaced_line, ```{0}```'.format(spaced_line) )
         return spaced_line
 
     def calc_spacers_needed( self, line ):
@@ -71,7 +77,6 @@ class Spacer( object ):
             spacers_needed = self.notes_line_length - line_len
         else:
             spacers_needed = self.notes_line_length - ( line_len % self.notes_line_length )
-        log.debug( 'spacers_needed, ```{0}```'.format(spacers_needed) )
         return spacers_needed
 
     def assemble_spacer( self, spaces_needed ):
@@ -85,7 +90,6 @@ class Spacer( object ):
         elif spaces_needed > 2:
             temp_spacer = self.spacer_character * spaces_needed
             line_spacer = ' ' + temp_spacer[0:-2] + ' '
-        log.debug( 'line_spacer, ```{0}```'.format(line_spacer) )
         return line_spacer
 
     # end class Spacer()
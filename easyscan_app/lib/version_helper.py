@@ -2,44 +2,100 @@
 
 from __future__ import unicode_literals
 
-import datetime, json, logging, os, subprocess
+import datetime, json, logging, os, threading
 from django.conf import settings
 
 
 log = logging.getLogger(__name__)
+cache = {}  # 'info' -> { 'branch': ..., 'commit': ... }, resolved once per process; see get_version_info()
+cache_lock = threading.Lock()
 
 
 def get_commit():
-    """ Returns commit-string.
+    """ Returns commit-string, eg `commit 3f2a...`, as the first line of `git log` would.
         Called by views.version() """
-    original_directory = os.getcwd()
-    log.debug( 'BASE_DIR, ```%s```' % settings.BASE_DIR )
-    git_dir = settings.BASE_DIR
-    os.chdir( git_dir )
-    output8 = subprocess.check_output( ['git', 'log'], stderr=subprocess.STDOUT )
-    output = output8.decode( 'utf-8' )
-    os.chdir( original_directory )
-    lines = output.split( '\n' )
-    commit = lines[0]
-    return commit
+    return 'commit %s' % get_version_info()['commit']
 
 
 def get_branch():
     """ Returns branch.
         Called by views.version() """
-    original_directory = os.getcwd()
-    git_dir = settings.BASE_DIR
-    os.chdir( git_dir )
-    output8 = subprocess.check_output( ['git', 'branch'], stderr=subprocess.STDOUT )
-    output = output8.decode( 'utf-8' )
-    os.chdir( original_directory )
-    lines = output.split( '\n' )
-    branch = 'init'
-    for line in lines:
-        if line[0:1] == '*':
-            branch = line[2:]
-            break
-    return branch
+    return get_version_info()['branch']
+
+
+def get_version_info():
+    """ Returns { 'branch': ..., 'commit': ... }, read once per process from the checkout's .git directory,
+          else from the file written at deploy by `manage.py stamp_version` (EZSCAN__VERSION_FILE_PATH).
+        No subprocess, no chdir; later calls return the cached dict.
+        Called by get_commit(), get_branch() """
+    with cache_lock:
+        if 'info' not in cache:
+            info = read_git_dir( os.path.join(settings.BASE_DIR, '.git') ) or read_version_file( get_version_file_path() )
+            cache['info'] = info or { 'branch': 'init', 'commit': 'unknown' }
+            log.debug( 'version info, ```%s```' % cache['info'] )
+        return cache['info']
+
+
+def get_version_file_path():
+    """ Returns path of the deploy-time stamp file.
+        Called by get_version_info(), management/commands/stamp_version.py """
+    return os.environ.get( 'EZSCAN__VERSION_FILE_PATH', os.path.join(settings.BASE_DIR, 'version.json') )
+
+
+def read_git_dir( git_path ):
+    """ Returns { 'branch': ..., 'commit': ... } from HEAD and the refs, loose or packed; None if there's no readable checkout.
+        Handles a `.git` file pointing elsewhere (worktrees, submodules) and a detached HEAD.
+        Called by get_version_info(), management/commands/stamp_version.py """
+    try:
+        if os.path.isfile( git_path ):  # `gitdir: <path>`
+            with open( git_path ) as f:
+                git_path = os.path.join( os.path.dirname(git_path), f.read().strip().split('gitdir:', 1)[1].strip() )
+        with open( os.path.join(git_path, 'HEAD') ) as f:
+            head = f.read().decode( 'utf-8' ).strip()
+        if not head.startswith( 'ref:' ):
+            return { 'branch': '(HEAD detached)', 'commit': head }
+        ref = head[4:].strip()
+        common_path = git_path
+        if os.path.isfile( os.path.join(git_path, 'commondir') ):  # a worktree's branch refs live in the main .git
+            with open( os.path.join(git_path, 'commondir') ) as f:
+                common_path = os.path.join( git_path, f.read().strip() )
+        commit = read_ref( git_path, ref ) or read_ref( common_path, ref )
+        if commit is None:
+            return None
+        return { 'branch': ref.replace('refs/heads/', '', 1), 'commit': commit }
+    except ( IOError, OSError, IndexError ) as e:
+        log.debug( 'no readable git checkout at `%s`, `%s`' % (git_path, repr(e)) )
+        return None
+
+
+def read_ref( git_path, ref ):
+    """ Returns the sha for ref from its loose file, else from packed-refs; None if not found.
+        Called by read_git_dir() """
+    try:
+        with open( os.path.join(git_path, ref) ) as f:
+            return f.read().decode( 'utf-8' ).strip()
+    except ( IOError, OSError ):
+        pass
+    try:
+        with open( os.path.join(git_path, 'packed-refs') ) as f:
+            for line in f.read().decode( 'utf-8' ).splitlines():
+                if line[0:1] not in ( '#', '^' ) and line.endswith( ' ' + ref ):
+                    return line.split( ' ', 1 )[0]
+    except ( IOError, OSError ):
+        pass
+    return None
+
+
+def read_version_file( file_path ):
+    """ Returns { 'branch': ..., 'commit': ... } from the deploy-time stamp file, or None.
+        Called by get_version_info() """
+    try:
+        with open( file_path ) as f:
+            info = json.loads( f.read() )
+        return { 'branch': info['branch'], 'commit': info['commit'] }
+    except ( IOError, OSError, ValueError, KeyError, TypeError ):
+        return None
+
 
 def make_context( request, rq_now, info_txt ):
     """ Assembles data-dct.
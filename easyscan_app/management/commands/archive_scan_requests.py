@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+""" Moves old scan-requests from the live table into ScanRequestArchive.
+    Usage: `python ./manage.py archive_scan_requests [--days 365] [--chunk-size 500]` """
+
+from __future__ import unicode_literals
+
+import datetime, logging, os
+from django.core.management.base import BaseCommand, CommandError
+from easyscan_app.models import ScanRequestArchive
+
+
+log = logging.getLogger(__name__)
+
+
+class Command( BaseCommand ):
+    help = 'Archives scan-requests older than the horizon (EZSCAN__ARCHIVE_HORIZON_DAYS, default 365), in chunked transactions.'
+
+    def add_arguments( self, parser ):
+        parser.add_argument( '--days', type=int, default=int(os.environ.get('EZSCAN__ARCHIVE_HORIZON_DAYS', '365')), help='archive requests created more than this many days ago' )
+        parser.add_argument( '--chunk-size', type=int, default=500, help='requests moved per transaction' )
+
+    def handle( self, *args, **options ):
+        if options['days'] <= 30:
+            raise CommandError( '--days must be more than 30; the try-again page works on the last 30 days of live requests' )
+        if options['chunk_size'] < 1:
+            raise CommandError( '--chunk-size must be positive' )
+        cutoff = datetime.datetime.combine( datetime.date.today() - datetime.timedelta(days=options['days']), datetime.time() )
+        moved = ScanRequestArchive.archive_older_than( cutoff, options['chunk_size'] )
+        self.stdout.write( 'requests archived, `%s`' % moved )
+        return
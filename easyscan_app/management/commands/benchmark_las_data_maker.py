@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+""" Times LasDataMaker's per-record make_csv_string() against its batch iter_csv_strings() on recent scan-requests; read-only.
+    Usage: `python ./manage.py benchmark_las_data_maker [--count 10000] [--repeat 3]` """
+
+from __future__ import unicode_literals
+
+import logging, time
+from django.core.management.base import BaseCommand, CommandError
+from easyscan_app.lib.data_prepper import LasDataMaker
+from easyscan_app.models import ScanRequest
+
+
+log = logging.getLogger(__name__)
+
+
+class Command( BaseCommand ):
+    help = 'Compares per-record and batch las csv generation on the newest scan-requests, and checks the output is identical.'
+
+    def add_arguments( self, parser ):
+        parser.add_argument( '--count', type=int, default=10000, help='number of newest scan-requests to convert' )
+        parser.add_argument( '--repeat', type=int, default=3, help='runs per method; the best is reported' )
+
+    def handle( self, *args, **options ):
+        rows = list( ScanRequest.objects.filter(create_datetime__isnull=False).order_by('-id').values(*LasDataMaker.SOURCE_FIELDS)[0:options['count']] )
+        if not rows:
+            raise CommandError( 'no scan-requests to convert' )
+        maker = LasDataMaker()
+        single = lambda: [ maker.make_csv_string(*[ row[name] for name in LasDataMaker.SOURCE_FIELDS ]) for row in rows ]
+        batch = lambda: list( maker.iter_csv_strings(rows) )
+        if single() != batch():
+            raise CommandError( 'batch output differs from per-record output' )
+        single_seconds = self.best_of( options['repeat'], single )
+        batch_seconds = self.best_of( options['repeat'], batch )
+        self.stdout.write( 'records, `%s`; output identical' % len(rows) )
+        self.stdout.write( 'make_csv_string(), `%.4f` seconds' % single_seconds )
+        self.stdout.write( 'iter_csv_strings(), `%.4f` seconds' % batch_seconds )
+        self.stdout.write( 'speedup, `%.1fx`' % (single_seconds / max(batch_seconds, 1e-9)) )
+        return
+
+    def best_of( self, repeat, func ):
+        """ Returns fastest wall-clock time of `repeat` calls.
+            Called by handle() """
+        timings = []
+        for i in range( max(repeat, 1) ):
+            start = time.time()
+            func()
+            timings.append( time.time() - start )
+        return min( timings )
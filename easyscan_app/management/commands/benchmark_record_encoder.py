@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+""" Times the serialize->json.loads conversion against RecordEncoder on recent scan-requests; read-only.
+    Usage: `python ./manage.py benchmark_record_encoder [--count 500] [--repeat 5]` """
+
+from __future__ import unicode_literals
+
+import json, logging, time
+from django.core import serializers
+from django.core.management.base import BaseCommand, CommandError
+from easyscan_app.models import ScanRequest, scan_request_encoder
+
+
+log = logging.getLogger(__name__)
+
+
+class Command( BaseCommand ):
+    help = 'Compares the old serializer round-trip with the record-encoder on the newest scan-requests.'
+
+    def add_arguments( self, parser ):
+        parser.add_argument( '--count', type=int, default=500, help='number of newest scan-requests to convert' )
+        parser.add_argument( '--repeat', type=int, default=5, help='runs per method; the best is reported' )
+
+    def handle( self, *args, **options ):
+        ids = list( ScanRequest.objects.order_by('-id').values_list('id', flat=True)[0:options['count']] )
+        if not ids:
+            raise CommandError( 'no scan-requests to convert' )
+        queryset = ScanRequest.objects.filter( id__in=ids ).order_by( '-id' )
+        old_seconds = self.best_of( options['repeat'], lambda: json.loads(serializers.serialize('json', queryset)) )
+        new_seconds = self.best_of( options['repeat'], lambda: list(scan_request_encoder.encode_queryset(queryset)) )
+        self.stdout.write( 'records, `%s`' % len(ids) )
+        self.stdout.write( 'serialize->json.loads, `%.4f` seconds' % old_seconds )
+        self.stdout.write( 'record-encoder, `%.4f` seconds' % new_seconds )
+        self.stdout.write( 'speedup, `%.1fx`' % (old_seconds / max(new_seconds, 1e-9)) )
+        return
+
+    def best_of( self, repeat, func ):
+        """ Returns fastest wall-clock time of `repeat` calls; each call re-runs its query.
+            Called by handle() """
+        timings = []
+        for i in range( max(repeat, 1) ):
+            start = time.time()
+            func()
+            timings.append( time.time() - start )
+        return min( timings )
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+""" Re-sends every non-transferred scan-request created in a date range, eg after an Annex outage.
+    Usage: `python ./manage.py bulk_resubmit --start-date 2015-04-01 --end-date 2015-04-30 [--dry-run]` """
+
+from __future__ import unicode_literals
+
+import datetime, logging
+from django.core.management.base import BaseCommand, CommandError
+from easyscan_app.models import BulkResubmitter
+
+
+log = logging.getLogger(__name__)
+
+
+class Command( BaseCommand ):
+    help = 'Resubmits non-transferred scan-requests created between the given dates, in batched files over one sftp session.'
+
+    def add_arguments( self, parser ):
+        parser.add_argument( '--start-date', required=True, help='first day, YYYY-MM-DD' )
+        parser.add_argument( '--end-date', required=True, help='last day, YYYY-MM-DD' )
+        parser.add_argument( '--batch-size', type=int, help='las lines per file; defaults to EZSCAN__BULK_RESUBMIT_BATCH_SIZE, else 100' )
+        parser.add_argument( '--dry-run', action='store_true', help='report how many requests would be resubmitted, and stop' )
+
+    def handle( self, *args, **options ):
+        try:
+            ( start_day, end_day ) = [ datetime.datetime.strptime(options[key], '%Y-%m-%d').date() for key in ('start_date', 'end_date') ]
+        except ValueError as e:
+            raise CommandError( 'dates must be YYYY-MM-DD; %s' % e )
+        resubmitter = BulkResubmitter()
+        if options['batch_size']:
+            resubmitter.BATCH_SIZE = options['batch_size']
+        scan_requests = resubmitter.select_requests( start_day, end_day )
+        if options['dry_run']:
+            self.stdout.write( 'requests to resubmit, `%s`' % scan_requests.count() )
+            return
+        result = resubmitter.resubmit( scan_requests )
+        self.stdout.write( 'selected, `%(selected)s`; transferred, `%(transferred)s`; failed, `%(failed)s`' % result )
+        return
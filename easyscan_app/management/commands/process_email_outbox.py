@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+""" Sends queued emails.
+    Usage: `python ./manage.py process_email_outbox [--loop] [--sleep 5]` """
+
+from __future__ import unicode_literals
+
+import logging, time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from easyscan_app.models import OutboxProcessor
+
+
+log = logging.getLogger(__name__)
+
+
+class Command( BaseCommand ):
+    help = 'Sends queued patron and admin emails over one smtp connection per poll; with --loop, keeps polling.'
+
+    def add_arguments( self, parser ):
+        parser.add_argument( '--loop', action='store_true', help='keep polling instead of exiting once the outbox is drained' )
+        parser.add_argument( '--sleep', type=float, default=5.0, help='seconds to wait between polls when looping' )
+        parser.add_argument( '--limit', type=int, default=50, help='maximum emails to send per poll' )
+
+    def handle( self, *args, **options ):
+        processor = OutboxProcessor()
+        while True:
+            close_old_connections()  # long-running loop; don't hold a dead db connection
+            sent_count = processor.process_due_emails( limit=options['limit'] )
+            if sent_count:
+                self.stdout.write( 'emails sent, `%s`' % sent_count )
+            if not options['loop']:
+                break
+            if sent_count < options['limit']:
+                time.sleep( options['sleep'] )
+        return
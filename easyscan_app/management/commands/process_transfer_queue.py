@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+""" Runs queued LAS transfers.
+    Usage: `python ./manage.py process_transfer_queue [--loop] [--sleep 5]` """
+
+from __future__ import unicode_literals
+
+import logging, time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from easyscan_app.models import TransferQueueProcessor
+
+
+log = logging.getLogger(__name__)
+
+
+class Command( BaseCommand ):
+    help = 'Processes queued LAS transfers; with --loop, keeps polling.'
+
+    def add_arguments( self, parser ):
+        parser.add_argument( '--loop', action='store_true', help='keep polling instead of exiting once the queue is drained' )
+        parser.add_argument( '--sleep', type=float, default=5.0, help='seconds to wait between polls when looping' )
+        parser.add_argument( '--limit', type=int, default=50, help='maximum jobs to claim per poll' )
+
+    def handle( self, *args, **options ):
+        processor = TransferQueueProcessor()
+        while True:
+            close_old_connections()  # long-running loop; don't hold a dead db connection
+            run_count = processor.process_due_jobs( limit=options['limit'] )
+            if run_count:
+                self.stdout.write( 'jobs run, `%s`' % run_count )
+            if not options['loop']:
+                break
+            if run_count < options['limit']:
+                time.sleep( options['sleep'] )
+        return
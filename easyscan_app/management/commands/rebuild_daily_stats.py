@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+""" Rebuilds the ScanRequestDailyStats rollups used by the stats api.
+    Usage: `python ./manage.py rebuild_daily_stats [--start-date 2015-04-01] [--end-date 2015-04-30]` """
+
+from __future__ import unicode_literals
+
+import datetime, logging
+from django.core.management.base import BaseCommand, CommandError
+from easyscan_app.models import ScanRequestDailyStats
+
+
+log = logging.getLogger(__name__)
+
+
+class Command( BaseCommand ):
+    help = 'Recomputes daily stats rollups from scan-request rows; all days unless a range is given.'
+
+    def add_arguments( self, parser ):
+        parser.add_argument( '--start-date', help='first day to rebuild, YYYY-MM-DD' )
+        parser.add_argument( '--end-date', help='last day to rebuild, YYYY-MM-DD' )
+
+    def handle( self, *args, **options ):
+        try:
+            ( start_day, end_day ) = [ datetime.datetime.strptime(options[key], '%Y-%m-%d').date() if options[key] else None for key in ('start_date', 'end_date') ]
+        except ValueError as e:
+            raise CommandError( 'dates must be YYYY-MM-DD; %s' % e )
+        bucket_count = ScanRequestDailyStats.rebuild( start_day, end_day )
+        self.stdout.write( 'buckets rebuilt, `%s`' % bucket_count )
+        return
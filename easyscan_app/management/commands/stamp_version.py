@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+""" Writes the branch and commit of the checkout to the version file served by /version/ when there's no .git directory, eg in a built release.
+    Usage: `python ./manage.py stamp_version [--path /path/to/version.json]` """
+
+from __future__ import unicode_literals
+
+import json, logging, os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from easyscan_app.lib import version_helper
+
+
+log = logging.getLogger(__name__)
+
+
+class Command( BaseCommand ):
+    help = 'Stamps branch and commit into the version file (EZSCAN__VERSION_FILE_PATH, default BASE_DIR/version.json).'
+
+    def add_arguments( self, parser ):
+        parser.add_argument( '--path', default=None, help='file to write; defaults to EZSCAN__VERSION_FILE_PATH' )
+
+    def handle( self, *args, **options ):
+        info = version_helper.read_git_dir( os.path.join(settings.BASE_DIR, '.git') )
+        if info is None:
+            raise CommandError( 'no readable git checkout at `%s`' % settings.BASE_DIR )
+        file_path = options['path'] or version_helper.get_version_file_path()
+        with open( file_path, 'w' ) as f:
+            f.write( json.dumps(info, sort_keys=True, indent=2) )
+        self.stdout.write( 'stamped `%s %s` to `%s`' % (info['branch'], info['commit'], file_path) )
+        return
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 04:47
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanRequest',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_title', models.CharField(blank=True, max_length=200)),
+                ('item_barcode', models.CharField(blank=True, max_length=50)),
+                ('item_callnumber', models.CharField(blank=True, max_length=200)),
+                ('item_volume_year', models.CharField(blank=True, max_length=200)),
+                ('item_source_url', models.TextField(blank=True)),
+                ('item_chap_vol_title', models.TextField(blank=True)),
+                ('item_page_range_other', models.TextField(blank=True)),
+                ('item_other', models.TextField(blank=True)),
+                ('patron_name', models.CharField(blank=True, max_length=100)),
+                ('patron_barcode', models.CharField(blank=True, max_length=50)),
+                ('patron_email', models.CharField(blank=True, max_length=100)),
+                ('create_datetime', models.DateTimeField(auto_now_add=True)),
+                ('las_conversion', models.TextField(blank=True)),
+                ('status', models.CharField(blank=True, max_length=200)),
+                ('admin_notes', models.TextField(blank=True)),
+            ],
+        ),
+    ]
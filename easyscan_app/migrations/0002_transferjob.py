@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 04:47
+from __future__ import unicode_literals
+
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('easyscan_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransferJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(default='pending', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_datetime', models.DateTimeField(default=datetime.datetime.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('create_datetime', models.DateTimeField(auto_now_add=True)),
+                ('modify_datetime', models.DateTimeField(auto_now=True)),
+                ('scan_request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transfer_jobs', to='easyscan_app.ScanRequest')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='transferjob',
+            index_together=set([('status', 'next_attempt_datetime')]),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 04:51
+from __future__ import unicode_literals
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('easyscan_app', '0002_transferjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='scanrequest',
+            name='create_datetime',
+            field=models.DateTimeField(blank=True, default=datetime.datetime.now, editable=False),
+        ),
+    ]
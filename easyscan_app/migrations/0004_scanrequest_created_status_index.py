@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 04:52
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('easyscan_app', '0003_scanrequest_create_datetime_default'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='scanrequest',
+            index=models.Index(fields=['create_datetime', 'status'], name='scanrequest_created_status'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 04:53
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('easyscan_app', '0004_scanrequest_created_status_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanRequestDailyStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(blank=True, max_length=200)),
+                ('source_host', models.CharField(max_length=255)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='scanrequestdailystats',
+            unique_together=set([('day', 'status', 'source_host')]),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 04:57
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('easyscan_app', '0005_scanrequestdailystats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='scanrequest',
+            index=models.Index(fields=['status', 'create_datetime'], name='scanrequest_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='scanrequest',
+            index=models.Index(fields=['item_barcode'], name='scanrequest_item_barcode'),
+        ),
+        migrations.AddIndex(
+            model_name='scanrequest',
+            index=models.Index(fields=['patron_barcode'], name='scanrequest_patron_barcode'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 04:58
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from easyscan_app.lib.search_text import SearchTextMaker
+
+
+def backfill_search_text(apps, schema_editor):
+    """ Fills search_text for existing rows, a chunk of ids at a time. """
+    ScanRequest = apps.get_model('easyscan_app', 'ScanRequest')
+    maker = SearchTextMaker()
+    last_id = 0
+    while True:
+        chunk = list(ScanRequest.objects.filter(id__gt=last_id).order_by('id').only('id', *SearchTextMaker.SOURCE_FIELDS)[0:500])
+        if not chunk:
+            break
+        for scan_request in chunk:
+            ScanRequest.objects.filter(id=scan_request.id).update(search_text=maker.make_search_text(scan_request))
+        last_id = chunk[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('easyscan_app', '0006_scanrequest_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanrequest',
+            name='search_text',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(backfill_search_text, migrations.RunPython.noop),
+    ]
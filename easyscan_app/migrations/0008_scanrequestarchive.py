@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 05:00
+from __future__ import unicode_literals
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('easyscan_app', '0007_scanrequest_search_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanRequestArchive',
+            fields=[
+                ('item_title', models.CharField(blank=True, max_length=200)),
+                ('item_barcode', models.CharField(blank=True, max_length=50)),
+                ('item_callnumber', models.CharField(blank=True, max_length=200)),
+                ('item_volume_year', models.CharField(blank=True, max_length=200)),
+                ('item_source_url', models.TextField(blank=True)),
+                ('item_chap_vol_title', models.TextField(blank=True)),
+                ('item_page_range_other', models.TextField(blank=True)),
+                ('item_other', models.TextField(blank=True)),
+                ('patron_name', models.CharField(blank=True, max_length=100)),
+                ('patron_barcode', models.CharField(blank=True, max_length=50)),
+                ('patron_email', models.CharField(blank=True, max_length=100)),
+                ('create_datetime', models.DateTimeField(blank=True, default=datetime.datetime.now, editable=False)),
+                ('las_conversion', models.TextField(blank=True)),
+                ('status', models.CharField(blank=True, max_length=200)),
+                ('admin_notes', models.TextField(blank=True)),
+                ('search_text', models.TextField(blank=True, editable=False)),
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('archive_datetime', models.DateTimeField(default=datetime.datetime.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='scanrequestarchive',
+            index=models.Index(fields=['create_datetime'], name='scanarchive_created'),
+        ),
+        migrations.AddIndex(
+            model_name='scanrequestarchive',
+            index=models.Index(fields=['item_barcode'], name='scanarchive_item_barcode'),
+        ),
+        migrations.AddIndex(
+            model_name='scanrequestarchive',
+            index=models.Index(fields=['patron_barcode'], name='scanarchive_patron_barcode'),
+        ),
+    ]
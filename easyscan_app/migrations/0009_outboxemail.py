@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 05:02
+from __future__ import unicode_literals
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('easyscan_app', '0008_scanrequestarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEmail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255)),
+                ('body', models.TextField()),
+                ('from_email', models.CharField(max_length=255)),
+                ('to_json', models.TextField()),
+                ('reply_to', models.CharField(blank=True, max_length=255)),
+                ('dedupe_key', models.CharField(blank=True, db_index=True, max_length=64)),
+                ('status', models.CharField(default='pending', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_datetime', models.DateTimeField(default=datetime.datetime.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('create_datetime', models.DateTimeField(auto_now_add=True)),
+                ('modify_datetime', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='outboxemail',
+            index_together=set([('status', 'next_attempt_datetime')]),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 05:03
+from __future__ import unicode_literals
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('easyscan_app', '0009_outboxemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdminAlert',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=40)),
+                ('message', models.TextField()),
+                ('count', models.IntegerField(default=1)),
+                ('scan_request_ids', models.TextField(blank=True)),
+                ('status', models.CharField(default='open', max_length=20)),
+                ('first_datetime', models.DateTimeField(default=datetime.datetime.now)),
+                ('last_datetime', models.DateTimeField(default=datetime.datetime.now)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='adminalert',
+            index_together=set([('fingerprint', 'status'), ('status', 'first_datetime')]),
+        ),
+    ]
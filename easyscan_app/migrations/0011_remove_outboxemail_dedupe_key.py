@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 05:20
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('easyscan_app', '0010_adminalert'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='outboxemail',
+            name='dedupe_key',
+        ),
+    ]
@@ -3,36 +3,45 @@
 from __future__ import unicode_literals
 
 # import csv, datetime, json, logging, os, pprint, StringIO
-import datetime, json, logging, os, pprint
-import requests
+import collections, contextlib, datetime, hashlib, json, logging, os, pprint, threading, urlparse
 from django.conf import settings as project_settings
 from django.contrib.auth import logout
-from django.core import serializers
-from django.core.mail import EmailMessage
+from django.core.mail import EmailMessage, get_connection
 from django.core.urlresolvers import reverse
-from django.db import models
-from django.http import HttpResponse, HttpResponseRedirect
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, F, Value, When
+from django.db.models.functions import Concat, TruncDate
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import render
 from django.utils.encoding import smart_unicode
 from django.utils.http import urlquote
+from django.utils.text import compress_string
 from easyscan_app.easyscan_forms import CitationForm
+from easyscan_app.lib.availability import TitleLookup
 from easyscan_app.lib.data_prepper import LasDataMaker
+from easyscan_app.lib.metrics import metrics
 from easyscan_app.lib.magic_bus import Prepper, Sender
+from easyscan_app.lib.record_encoder import RecordEncoder
+from easyscan_app.lib.request_timer import phase
+from easyscan_app.lib.search_text import SearchTextMaker
 # from easyscan_app.lib.spacer import Spacer
 
 
 log = logging.getLogger(__name__)
 prepper = Prepper()
 sender = Sender()
+search_text_maker = SearchTextMaker()
+las_maker = LasDataMaker()
 # spcr = Spacer()
 
 
 ## db models ##
 
 
-class ScanRequest( models.Model ):
-    """ Contains user & item data.
-        Called by RequestViewPostHelper, TryAgainHelper. """
+class ScanRequestFields( models.Model ):
+    """ Columns shared by the live ScanRequest table and ScanRequestArchive. """
     item_title = models.CharField( blank=True, max_length=200 )
     item_barcode = models.CharField( blank=True, max_length=50 )
     status = models.CharField( max_length=200 )
@@ -45,32 +54,331 @@ class ScanRequest( models.Model ):
     patron_name = models.CharField( blank=True, max_length=100 )
     patron_barcode = models.CharField( blank=True, max_length=50 )
     patron_email = models.CharField( blank=True, max_length=100 )
-    create_datetime = models.DateTimeField( auto_now_add=True, blank=True )  # blank=True for backward compatibility
+    create_datetime = models.DateTimeField( default=datetime.datetime.now, editable=False, blank=True )  # set before the insert so las_conversion can use it; blank=True for backward compatibility
     las_conversion = models.TextField( blank=True )
     status = models.CharField( blank=True, max_length=200 )
     admin_notes = models.TextField( blank=True )
+    search_text = models.TextField( blank=True, editable=False )  # normalized copy of SearchTextMaker.SOURCE_FIELDS, for admin search; maintained by save()
+
+    class Meta:
+        abstract = True
+
+    # end class ScanRequestFields
+
+
+class ScanRequest( ScanRequestFields ):
+    """ Contains user & item data.
+        Called by RequestViewPostHelper, TryAgainHelper. """
+
+    class Meta:
+        indexes = [
+            models.Index( fields=['create_datetime', 'status'], name='scanrequest_created_status' ),  # date-range filters, and stats counts by status without touching rows
+            models.Index( fields=['status', 'create_datetime'], name='scanrequest_status_created' ),  # one status over a date range
+            models.Index( fields=['item_barcode'], name='scanrequest_item_barcode' ),  # staff lookups
+            models.Index( fields=['patron_barcode'], name='scanrequest_patron_barcode' ),
+            ]
 
     def __unicode__(self):
         return smart_unicode( 'id: %s || title: %s' % (self.id, self.item_title) , 'utf-8', 'replace' )
 
-    def save(self):
-        super( ScanRequest, self ).save() # Call the "real" save() method
+    LAS_SOURCE_FIELDS = LasDataMaker.SOURCE_FIELDS
+
+    @classmethod
+    def from_db( cls, db, field_names, values ):
+        """ Remembers the stored status, so save() can move daily-stats counts when it changes. """
+        instance = super( ScanRequest, cls ).from_db( db, field_names, values )
+        instance._saved_status = instance.__dict__.get( 'status' )  # absent if deferred
+        return instance
+
+    def save( self, *args, **kwargs ):
+        """ Builds las_conversion and search_text before writing, so a new request costs a single INSERT.
+            With `update_fields`, only writes those columns; las_conversion and search_text are rebuilt only if a field they're built from is among them.
+            Keeps ScanRequestDailyStats current for new requests and status changes. """
+        adding = self._state.adding
+        saved_status = getattr( self, '_saved_status', None )
+        update_fields = kwargs.get( 'update_fields' )
+        if update_fields is not None:
+            update_fields = set( update_fields )
+            if update_fields.intersection( self.LAS_SOURCE_FIELDS ):
+                update_fields.add( 'las_conversion' )
+            if update_fields.intersection( SearchTextMaker.SOURCE_FIELDS ):
+                update_fields.add( 'search_text' )
+            kwargs['update_fields'] = update_fields
+        if update_fields is None or 'las_conversion' in update_fields:
+            if self.create_datetime is None:
+                self.create_datetime = datetime.datetime.now()
+            self.las_conversion = self.make_las_conversion()
+        if update_fields is None or 'search_text' in update_fields:
+            self.search_text = search_text_maker.make_search_text( self )
+        super( ScanRequest, self ).save( *args, **kwargs ) # Call the "real" save() method
+        if adding:
+            ScanRequestDailyStats.adjust( self.create_datetime.date(), self.status, ScanRequestDailyStats.extract_host(self.item_source_url), 1 )
+        elif saved_status is not None and saved_status != self.status and ( update_fields is None or 'status' in update_fields ):
+            ( day, source_host ) = ( self.create_datetime.date(), ScanRequestDailyStats.extract_host(self.item_source_url) )
+            ScanRequestDailyStats.adjust( day, saved_status, source_host, -1 )
+            ScanRequestDailyStats.adjust( day, self.status, source_host, 1 )
+        self._saved_status = self.status
+
+    def make_las_conversion( self ):
+        """ Returns las csv string for this request.
+            Called by save() """
         maker = LasDataMaker()
         las_string = maker.make_csv_string(
             self.create_datetime, self.patron_name, self.patron_barcode, self.patron_email, self.item_title, self.item_barcode, self.item_chap_vol_title, self.item_page_range_other, self.item_other )
-        self.las_conversion = las_string
-        super( ScanRequest, self ).save() # Call the "real" save() method
+        return las_string
 
     def jsonify(self):
         """ Returns object data in json-compatible dict. """
-        jsn = serializers.serialize( 'json', [self] )  # json string is single-item list
-        lst = json.loads( jsn )
-        object_dct = lst[0]
+        object_dct = scan_request_encoder.encode_instance( self )
         return object_dct
 
     # end class ScanRequest
 
 
+scan_request_encoder = RecordEncoder( ScanRequest )
+
+
+class TransferJob( models.Model ):
+    """ Queued LAS transfer for a ScanRequest.
+        Created by RequestViewPostHelper; processed by TransferQueueProcessor. """
+    scan_request = models.ForeignKey( ScanRequest, on_delete=models.CASCADE, related_name='transfer_jobs' )
+    status = models.CharField( max_length=20, default='pending' )  # 'pending', 'in_process', 'done', or 'failed'
+    attempts = models.IntegerField( default=0 )
+    next_attempt_datetime = models.DateTimeField( default=datetime.datetime.now )
+    last_error = models.TextField( blank=True )
+    create_datetime = models.DateTimeField( auto_now_add=True )
+    modify_datetime = models.DateTimeField( auto_now=True )
+
+    class Meta:
+        index_together = [ ['status', 'next_attempt_datetime'] ]
+
+    def __unicode__(self):
+        return smart_unicode( 'id: %s || scan_request_id: %s || status: %s' % (self.id, self.scan_request_id, self.status) , 'utf-8', 'replace' )
+
+    # end class TransferJob
+
+
+class ScanRequestDailyStats( models.Model ):
+    """ Per-day request counts by status and source-host, so StatsBuilder can answer long ranges without reading ScanRequest rows.
+        Kept current by ScanRequest.save(), TransferQueueProcessor, and the ScanRequest post_delete handler; rebuilt by `manage.py rebuild_daily_stats`. """
+    day = models.DateField()
+    status = models.CharField( blank=True, max_length=200 )
+    source_host = models.CharField( max_length=255 )
+    count = models.IntegerField( default=0 )
+
+    class Meta:
+        unique_together = [ ['day', 'status', 'source_host'] ]
+
+    held = threading.local()  # .active: true inside hold_counts()
+
+    def __unicode__(self):
+        return smart_unicode( '%s || %s || %s: %s' % (self.day, self.status, self.source_host, self.count) , 'utf-8', 'replace' )
+
+    @classmethod
+    def extract_host( cls, url ):
+        """ Returns host of url, or 'unknown'.
+            Called by ScanRequest.save(), move_status(), rebuild(), StatsBuilder.process_results() """
+        host = urlparse.urlparse( url ).netloc
+        return host[0:255] if host else 'unknown'
+
+    @classmethod
+    def adjust( cls, day, status, source_host, delta ):
+        """ Adds delta to a bucket, creating it if needed; a negative delta for a missing bucket is dropped (rebuild() fixes such days).
+            Called by ScanRequest.save(), move_status(), decrement_daily_stats() """
+        updated = cls.objects.filter( day=day, status=status, source_host=source_host ).update( count=F('count') + delta )
+        if not updated and delta > 0:
+            try:
+                with transaction.atomic():
+                    cls.objects.create( day=day, status=status, source_host=source_host, count=delta )
+            except IntegrityError:  # another worker created it first
+                cls.objects.filter( day=day, status=status, source_host=source_host ).update( count=F('count') + delta )
+        return
+
+    @classmethod
+    def move_status( cls, scan_requests, new_status ):
+        """ Moves each request's count from its current-status bucket to new_status; call before a bulk status update is written.
+            Called by TransferQueueProcessor.run_batch(), BulkResubmitter.record_outcome(), TryAgainConfirmationHelper.retransfer_data() """
+        deltas = collections.Counter()
+        for scnrqst in scan_requests:
+            if scnrqst.status != new_status:
+                ( day, source_host ) = ( scnrqst.create_datetime.date(), cls.extract_host(scnrqst.item_source_url) )
+                deltas[( day, scnrqst.status, source_host )] -= 1
+                deltas[( day, new_status, source_host )] += 1
+        for ( ( day, status, source_host ), delta ) in deltas.items():
+            if delta:
+                cls.adjust( day, status, source_host, delta )
+        return
+
+    @classmethod
+    @contextlib.contextmanager
+    def hold_counts( cls ):
+        """ Keeps ScanRequest deletes inside the block from decrementing buckets.
+            Called by ScanRequestArchive.archive_older_than() """
+        cls.held.active = True
+        try:
+            yield
+        finally:
+            cls.held.active = False
+
+    @classmethod
+    def rebuild( cls, start_day=None, end_day=None ):
+        """ Recomputes buckets from ScanRequest and ScanRequestArchive rows for the given days (all days if unspecified); returns bucket count.
+            Called by rebuild_daily_stats command. """
+        rollups = cls.objects.all()
+        counts = collections.Counter()
+        for model in ( ScanRequest, ScanRequestArchive ):
+            requests = model.objects.order_by()
+            if start_day:
+                requests = requests.filter( create_datetime__gte=start_day )
+            if end_day:
+                requests = requests.filter( create_datetime__lt=end_day + datetime.timedelta(days=1) )
+            for row in requests.annotate( day=TruncDate('create_datetime') ).values( 'day', 'status', 'item_source_url' ).annotate( count=Count('id') ):
+                counts[( row['day'], row['status'], cls.extract_host(row['item_source_url']) )] += row['count']
+        if start_day:
+            rollups = rollups.filter( day__gte=start_day )
+        if end_day:
+            rollups = rollups.filter( day__lte=end_day )
+        with transaction.atomic():
+            rollups.delete()
+            cls.objects.bulk_create(
+                [ cls(day=day, status=status, source_host=source_host, count=count) for ( (day, status, source_host), count ) in counts.items() ],
+                batch_size=500 )
+        log.debug( 'ScanRequestDailyStats(); rebuilt `%s` buckets' % len(counts) )
+        return len( counts )
+
+    # end class ScanRequestDailyStats
+
+
+class ScanRequestArchive( ScanRequestFields ):
+    """ Scan-requests older than the archive horizon, moved out of the live table -- ids kept -- so it and its indexes stay small.
+        Filled by `manage.py archive_scan_requests`; read by the archive admin and ScanRequestDailyStats.rebuild(). """
+    id = models.IntegerField( primary_key=True )  # the original ScanRequest id
+    archive_datetime = models.DateTimeField( default=datetime.datetime.now )
+
+    class Meta:
+        indexes = [
+            models.Index( fields=['create_datetime'], name='scanarchive_created' ),
+            models.Index( fields=['item_barcode'], name='scanarchive_item_barcode' ),
+            models.Index( fields=['patron_barcode'], name='scanarchive_patron_barcode' ),
+            ]
+
+    def __unicode__(self):
+        return smart_unicode( 'id: %s || title: %s' % (self.id, self.item_title) , 'utf-8', 'replace' )
+
+    @classmethod
+    def archive_older_than( cls, cutoff, chunk_size=500 ):
+        """ Moves requests created before cutoff from ScanRequest to the archive, one transaction per chunk; returns count moved.
+            Requests with a pending or in-process TransferJob stay put; finished jobs for moved requests are deleted with them.
+            Daily-stats rollups are untouched, since archived requests still count.
+            Called by archive_scan_requests command. """
+        field_names = [ field.attname for field in ScanRequest._meta.concrete_fields ]
+        candidates = ScanRequest.objects.filter( create_datetime__lt=cutoff ).exclude( transfer_jobs__status__in=['pending', 'in_process'] ).order_by( 'id' )
+        ( moved, last_id ) = ( 0, 0 )
+        while True:
+            with transaction.atomic():
+                rows = list( candidates.filter(id__gt=last_id).values(*field_names)[0:chunk_size] )
+                if not rows:
+                    break
+                cls.objects.bulk_create( [ cls(**row) for row in rows ] )
+                with ScanRequestDailyStats.hold_counts():
+                    ScanRequest.objects.filter( id__in=[ row['id'] for row in rows ] ).delete()
+            ( moved, last_id ) = ( moved + len(rows), rows[-1]['id'] )
+            log.debug( 'ScanRequestArchive(); moved `%s` requests through id `%s`' % (moved, last_id) )
+        return moved
+
+    # end class ScanRequestArchive
+
+
+@receiver( post_delete, sender=ScanRequest )
+def decrement_daily_stats( sender, instance, **kwargs ):
+    """ Takes a deleted request out of its daily-stats bucket.
+        Django sends post_delete for each row of a queryset delete too, so the admin's delete-selected action is covered.
+        Called on ScanRequest deletes, except archiving's. """
+    if getattr( ScanRequestDailyStats.held, 'active', False ):
+        return
+    ScanRequestDailyStats.adjust( instance.create_datetime.date(), instance.status, ScanRequestDailyStats.extract_host(instance.item_source_url), -1 )
+
+
+class OutboxEmail( models.Model ):
+    """ Email waiting to be sent, so the request-cycle only pays for an insert.
+        Created by enqueue(); sent by OutboxProcessor. """
+    subject = models.CharField( max_length=255 )
+    body = models.TextField()
+    from_email = models.CharField( max_length=255 )
+    to_json = models.TextField()  # json list of addresses
+    reply_to = models.CharField( blank=True, max_length=255 )
+    status = models.CharField( max_length=20, default='pending' )  # 'pending', 'sending', 'sent', or 'dead'
+    attempts = models.IntegerField( default=0 )
+    next_attempt_datetime = models.DateTimeField( default=datetime.datetime.now )
+    last_error = models.TextField( blank=True )
+    create_datetime = models.DateTimeField( auto_now_add=True )
+    modify_datetime = models.DateTimeField( auto_now=True )
+
+    class Meta:
+        index_together = [ ['status', 'next_attempt_datetime'] ]
+
+    def __unicode__(self):
+        return smart_unicode( 'id: %s || subject: %s || status: %s' % (self.id, self.subject, self.status) , 'utf-8', 'replace' )
+
+    @classmethod
+    def enqueue( cls, subject, body, from_email, to, reply_to='' ):
+        """ Saves email for the outbox worker; returns the new OutboxEmail.
+            Called by RequestViewPostHelper.email_patron(), AlertDigester.flush_due() """
+        return cls.objects.create(
+            subject=subject[0:255], body=body, from_email=from_email, to_json=json.dumps(to), reply_to=reply_to )
+
+    def build_message( self, connection ):
+        """ Returns EmailMessage bound to the shared smtp connection.
+            Called by OutboxProcessor.send_emails() """
+        headers = { 'Reply-To': self.reply_to } if self.reply_to else None
+        return EmailMessage( self.subject, self.body, self.from_email, json.loads(self.to_json), headers=headers, connection=connection )
+
+    # end class OutboxEmail
+
+
+class AdminAlert( models.Model ):
+    """ Occurrences of one error message, coalesced until AlertDigester sends them in a digest email.
+        Created and counted by record(). """
+    fingerprint = models.CharField( max_length=40 )  # sha1 of message
+    message = models.TextField()
+    count = models.IntegerField( default=1 )
+    scan_request_ids = models.TextField( blank=True )  # comma-separated; kept for the first MAX_IDS occurrences
+    status = models.CharField( max_length=20, default='open' )  # 'open' or 'sent'
+    first_datetime = models.DateTimeField( default=datetime.datetime.now )
+    last_datetime = models.DateTimeField( default=datetime.datetime.now )
+
+    class Meta:
+        index_together = [ ['fingerprint', 'status'], ['status', 'first_datetime'] ]
+
+    MAX_IDS = 50
+
+    def __unicode__(self):
+        return smart_unicode( 'id: %s || count: %s || status: %s' % (self.id, self.count, self.status) , 'utf-8', 'replace' )
+
+    @classmethod
+    def record( cls, message, scan_request_ids=() ):
+        """ Counts an occurrence on the open alert for message, creating it if needed.
+            If a race left duplicate open alerts, only the lowest-id one -- the one AlertDigester merges into -- is counted.
+            Called by RequestViewPostHelper.email_admins_on_error(), OutboxProcessor.handle_undeliverable() """
+        fingerprint = hashlib.sha1( message.encode('utf-8') ).hexdigest()
+        ids_text = ','.join( [ unicode(scan_request_id) for scan_request_id in scan_request_ids ] )
+        alert_id = cls.objects.filter( fingerprint=fingerprint, status='open' ).order_by( 'id' ).values_list( 'id', flat=True ).first()
+        updated = 0
+        if alert_id is not None:
+            alert = cls.objects.filter( id=alert_id, status='open' )  # status re-checked; the digester may have just sent it
+            updates = { 'count': F('count') + 1, 'last_datetime': datetime.datetime.now() }
+            if ids_text:
+                updated = alert.filter( count__lt=cls.MAX_IDS ).update(
+                    scan_request_ids=Concat( 'scan_request_ids', Value(',' + ids_text), output_field=models.TextField() ), **updates )
+            if not updated:
+                updated = alert.update( **updates )
+        if not updated:  # a concurrent first occurrence can make a second open alert; AlertDigester merges them
+            cls.objects.create( fingerprint=fingerprint, message=message, scan_request_ids=',' + ids_text if ids_text else '' )
+        return
+
+    # end class AdminAlert
+
+
 ## non db models below  ##
 
 
@@ -102,32 +410,60 @@ class BasicAuthHelper( object ):
 
 
 class TryAgainHelper( object ):
-    """ Contains helpers for views.try_again() """
+    """ Contains helpers for views.try_again()
+        Lists the last 30 days of requests a page at a time, newest first, keyed on id (`?before=<id>` gets the next page). """
+
+    def __init__( self ):
+        self.PAGE_SIZE = int( os.environ.get('EZSCAN__TRY_AGAIN_PAGE_SIZE', '50') )
+        self.encoder = RecordEncoder( ScanRequest, exclude=['las_conversion', 'search_text'] )  # no blobs in the list
 
     def build_response( self, request ):
-        """ Builds page.
+        """ Builds page, or streams json for `?format=json`.
             Called by views.try_again() """
         request.session['try_again_page_accessed'] = True
         data_dct = self.build_data_dct( request )
-        format = request.GET.get( 'format', None )
         if request.GET.get( 'format', None ) == 'json':
-          jsn = json.dumps( data_dct, sort_keys=True, indent=2 )
-          return_response = HttpResponse( jsn, content_type = 'application/javascript; charset=utf-8' )
+            return_response = StreamingHttpResponse( self.stream_json(data_dct), content_type='application/javascript; charset=utf-8' )
         else:
             return_response = render( request, 'easyscan_app_templates/try_again.html', data_dct )
         return return_response
 
     def build_data_dct( self, request ):
-        """ Prepares data.
+        """ Prepares data for one page; memory stays bounded by PAGE_SIZE however busy the window was.
             Called by build_response() """
         month_ago = datetime.date.today() - datetime.timedelta(days=30)
-        entries = ScanRequest.objects.filter( create_datetime__gte=month_ago ).order_by( '-id' )
-        jsn = serializers.serialize( 'json', entries )
-        lst = json.loads( jsn )
-        data_dct = { 'entries': lst, 'entries_count': len( lst ) }
+        window = ScanRequest.objects.filter( create_datetime__gte=month_ago )
+        page = window.order_by( '-id' )
+        before = self.parse_cursor( request.GET.get('before', '') )
+        if before:
+            page = page.filter( id__lt=before )
+        rows = list( page.values(*self.encoder.value_names())[0:self.PAGE_SIZE + 1] )  # one extra tells us whether there's a next page
+        next_cursor = rows[self.PAGE_SIZE - 1]['id'] if len( rows ) > self.PAGE_SIZE else None
+        data_dct = {
+            'entries': [ self.encoder.encode_row(row) for row in rows[0:self.PAGE_SIZE] ],
+            'entries_count': window.count(),
+            'before': before,
+            'next_cursor': next_cursor }
         log.debug( 'TryAgainHelper(); data_dct prepared' )
         return data_dct
 
+    def parse_cursor( self, before ):
+        """ Returns id from `before` param, or None.
+            Called by build_data_dct() """
+        try:
+            return int( before )
+        except ValueError:
+            return None
+
+    def stream_json( self, data_dct ):
+        """ Yields json for the page an entry at a time.
+            Called by build_response() """
+        yield '{\n  "entries": '
+        for chunk in self.encoder.stream_json_list( data_dct['entries'] ):
+            yield chunk
+        yield ',\n  "before": %s,\n  "entries_count": %s,\n  "next_cursor": %s\n}' % (
+            json.dumps(data_dct['before']), data_dct['entries_count'], json.dumps(data_dct['next_cursor']) )
+
     # end class TryAgainHelper
 
 
@@ -146,13 +482,8 @@ class TryAgainConfirmationHelper( object ):
     def build_get_data_dct( self, scan_request_id ):
         """ Prepares data.
             Called by views.try_again_confirmation() """
-        entry = ScanRequest.objects.filter( id=scan_request_id ).first()
-        if entry:
-            jsn = serializers.serialize( 'json', [entry] )
-            lst = json.loads( jsn )
-            data_dct = { 'entry': lst[0] }
-        else:
-            data_dct = { 'entry': None }
+        entry = next( scan_request_encoder.encode_queryset(ScanRequest.objects.filter(id=scan_request_id)), None )
+        data_dct = { 'entry': entry }
         log.debug( 'TryAgainConfirmationHelper(); data_dct prepared' )
         return data_dct
 
@@ -175,6 +506,7 @@ class TryAgainConfirmationHelper( object ):
         request.session['scan_request_id'] = None
         self.update_notes( scan_request_id, 'resubmit requested' )
         check = self.retransfer_data( scan_request_id )
+        metrics.inc( 'easyscan_try_again_resubmits_total', {'outcome': 'success' if check['success'] else 'failure'} )
         if check['success']:
             self.update_notes( scan_request_id, 'resubmit completed' )
         else:
@@ -188,24 +520,56 @@ class TryAgainConfirmationHelper( object ):
         entry = ScanRequest.objects.get( id=scan_request_id )
         entry.admin_notes = '%s -- %s\r || %s' % (
             unicode( datetime.datetime.now() ), message, entry.admin_notes )
-        entry.save()
+        entry.save( update_fields=['admin_notes'] )
         return
 
     def retransfer_data( self, scan_request_id ):
         """ Retransfers data; sends admin email on transfer error.
+            Works through the request's TransferJob, so the queue worker won't send the same files again:
+              on success the job is done and the request transferred; on failure the job gets the queue's backoff.
             Called by resubmit_request() """
         scnrqst = ScanRequest.objects.get( id=scan_request_id )
-        ( data_filename, count_filename ) = prepper.make_data_files( datetime_object=datetime.datetime.now(), data_string=scnrqst.las_conversion )
+        queue_processor = TransferQueueProcessor()
+        job = self.claim_transfer_job( scnrqst, queue_processor )
+        if job is None:
+            check = { 'success': False, 'error_message': 'a queue worker is sending this request now' }
+            log.debug( 'TryAgainConfirmationHelper(); check, `%s`' % pprint.pformat(check) )
+            return check
         try:
-            sender.transfer_files( data_filename, count_filename )
-            check = { 'success': True, 'data_filename': data_filename, 'count_filename': count_filename }
+            with phase( 'prep' ):
+                ( data_filepath, count_filepath ) = prepper.make_data_files( datetime_object=datetime.datetime.now(), data_string=scnrqst.las_conversion, request_id=scnrqst.id )
+            with phase( 'sftp' ):
+                sender.transfer_files( data_filepath, count_filepath )
+            prepper.cleanup( data_filepath )
+            ScanRequestDailyStats.move_status( [scnrqst], 'transferred' )
+            ScanRequest.objects.filter( id=scnrqst.id ).update( status='transferred' )
+            TransferJob.objects.filter( id=job.id ).update(
+                status='done', attempts=F('attempts') + 1, last_error='', modify_datetime=datetime.datetime.now() )
+            metrics.inc( 'easyscan_las_transfers_total', {'source': 'try_again', 'outcome': 'success'} )
+            check = { 'success': True, 'data_filepath': data_filepath, 'count_filepath': count_filepath }
         except Exception as e:
+            metrics.inc( 'easyscan_las_transfers_total', {'source': 'try_again', 'outcome': 'failure'} )
+            queue_processor.handle_failure( job, unicode(repr(e)) )
             request_view_post_helper = RequestViewPostHelper()
-            request_view_post_helper.email_admins_on_error( unicode(repr(e)) )
+            request_view_post_helper.email_admins_on_error( unicode(repr(e)), [scnrqst.id] )
             check = { 'success': False, 'error_message': unicode(repr(e)) }
         log.debug( 'TryAgainConfirmationHelper(); check, `%s`' % pprint.pformat(check) )
         return check
 
+    def claim_transfer_job( self, scnrqst, queue_processor ):
+        """ Returns the request's pending TransferJob, claimed; or, when none is queued, a new job created already claimed.
+            Returns None when a queue worker has the job in_process, or wins the race for it.
+            Called by retransfer_data() """
+        jobs = TransferJob.objects.filter( scan_request=scnrqst )
+        if jobs.filter( status='in_process' ).exists():
+            return None
+        pending_job_id = jobs.filter( status='pending' ).order_by( 'id' ).values_list( 'id', flat=True ).first()
+        if pending_job_id is None:
+            return TransferJob.objects.create( scan_request=scnrqst, status='in_process' )
+        if not queue_processor.claim_job( pending_job_id ):
+            return None
+        return TransferJob.objects.get( id=pending_job_id )
+
     # end class TryAgainConfirmationHelper
 
 
@@ -345,6 +709,7 @@ class RequestViewGetHelper( object ):
 
     def __init__( self ):
         self.AVAILABILITY_API_URL_ROOT = os.environ['EZSCAN__AVAILABILITY_API_URL_ROOT']
+        self.title_lookup = TitleLookup( self.AVAILABILITY_API_URL_ROOT )
 
     def handle_get( self, request ):
         """ Handles request-page GET; returns response.
@@ -398,16 +763,10 @@ class RequestViewGetHelper( object ):
         return title
 
     def hit_availability_api( self, bibnum ):
-        """ Hits availability-api with bib for title.
+        """ Gets title for bib from the availability-api, via the title-cache.
             Called by check_title() """
-        try:
-            availability_api_url = '%s/bib/%s' % ( self.AVAILABILITY_API_URL_ROOT, bibnum )
-            r = requests.get( availability_api_url )
-            d = r.json()
-            title = d['response']['backend_response'][0]['title']
-        except Exception as e:
-            log.debug( 'RequestViewGetHelper(); exception, %s' % unicode(repr(e)) )
-            title = ''
+        with phase( 'availability_api' ):
+            title = self.title_lookup.get_title( bibnum )
         return title
 
     def initialize_session( self, request, title ):
@@ -498,7 +857,7 @@ class RequestViewPostHelper( object ):
         log.debug( 'RequestViewPostHelper(); starting' )
         self.update_session( request )
         scnrqst = self.save_post_data( request )
-        self.transfer_data( scnrqst )  # will eventually trigger queue job instead of sending directly
+        self.queue_transfer( scnrqst )  # TransferQueueProcessor does the actual sftp work
         self.email_patron( scnrqst )
         scheme = 'https' if request.is_secure() else 'http'
         redirect_url = '%s://%s%s' % ( scheme, request.get_host(), reverse('confirmation_url') )
@@ -534,41 +893,35 @@ class RequestViewPostHelper( object ):
             scnrqst.patron_barcode = request.session['user_info']['patron_barcode']
             scnrqst.patron_email = request.session['user_info']['email']
             scnrqst.save()
+            metrics.inc( 'easyscan_submissions_total' )
             log.debug( 'RequestViewPostHelper(); post-data saved' )
         except Exception as e:
             log.debug( 'RequestViewPostHelper(); exception, `%s`' % unicode(repr(e)) )
         return scnrqst
 
-    def transfer_data( self, scnrqst ):
-        """ Transfers data.
+    def queue_transfer( self, scnrqst ):
+        """ Queues the las transfer; the request-cycle only pays for an insert.
             Called by handle_valid_form() """
-        ( data_filename, count_filename ) = prepper.make_data_files( datetime_object=scnrqst.create_datetime, data_string=scnrqst.las_conversion )
-        log.debug( 'data_filename, ```%s```' % data_filename )
-        log.debug( 'count_filename, ```%s```' % count_filename )
         try:
-            sender.transfer_files( data_filename, count_filename )
-            log.debug( 'RequestViewPostHelper(); here-B' )
-            scnrqst.status = 'transferred'
-            scnrqst.save()
-            log.debug( 'RequestViewPostHelper(); `%s` and `%s` transferred' % (data_filename, count_filename) )
+            job = TransferJob.objects.create( scan_request=scnrqst )
+            log.debug( 'RequestViewPostHelper(); transfer-job `%s` queued' % job.id )
         except Exception as e:
             error_message = unicode( repr(e) )
-            log.error( 'RequestViewPostHelper(); error, `%s`' % error_message )
-            self.email_admins_on_error( error_message )
+            log.error( 'RequestViewPostHelper(); error queueing transfer, `%s`' % error_message )
+            self.email_admins_on_error( error_message, [scnrqst.id] if scnrqst else [] )
         return
 
     def email_patron( self, scnrqst ):
-        """ Emails patron confirmation.
+        """ Queues patron confirmation for the outbox worker.
             Called by handle_valid_form() """
         try:
             subject = 'Brown University Library - Scan Request Confirmation'
             body = self.build_email_body( scnrqst )
             ffrom = self.EMAIL_FROM  # `from` reserved
             to = [ scnrqst.patron_email ]
-            extra_headers = { 'Reply-To': self.EMAIL_REPLY_TO }
-            email = EmailMessage( subject, body, ffrom, to, headers=extra_headers )
-            email.send()
-            log.debug( 'RequestViewPostHelper(); mail sent' )
+            with phase( 'email_patron' ):
+                OutboxEmail.enqueue( subject, body, ffrom, to, reply_to=self.EMAIL_REPLY_TO )
+            log.debug( 'RequestViewPostHelper(); mail queued' )
         except Exception as e:
             log.debug( 'RequestViewPostHelper(); exception, `%s`' % unicode(repr(e)) )
         return
@@ -600,26 +953,391 @@ If you have questions, feel free to email %s or call %s, and reference easyscan
             )
         return body
 
-    def email_admins_on_error( self, error_message ):
-        """ Emails admins error.
-            Called by transfer_data() """
+    def email_admins_on_error( self, error_message, scan_request_ids=() ):
+        """ Records error for the admins' digest email; identical errors within the alert window become one line with a count.
+            Costs the caller one db write; AlertDigester sends the digest from the outbox worker.
+            Called by queue_transfer(), TransferQueueProcessor.run_batch(), BulkResubmitter.resubmit(), TryAgainConfirmationHelper.retransfer_data() """
         try:
-            subject = 'easyscan error'
-            body = 'Error transferring data to Annex server: `%s`' % error_message
-            ffrom = self.ON_ERROR_EMAIL_FROM  # `from` reserved
-            to = self.ON_ERROR_EMAIL_TO  # list
-            # extra_headers = { 'Reply-To': self.EMAIL_REPLY_TO }
-            # email = EmailMessage( subject, body, ffrom, to, headers=extra_headers )
-            email = EmailMessage( subject, body, ffrom, to )
-            email.send()
-            log.debug( 'RequestViewPostHelper(); mail sent' )
+            AdminAlert.record( 'Error transferring data to Annex server: `%s`' % error_message, scan_request_ids )
+            log.debug( 'RequestViewPostHelper(); admin alert recorded' )
         except Exception as e:
-            log.debug( 'RequestViewPostHelper(); exception, `%s`' % unicode(repr(e)) )
+            log.error( 'RequestViewPostHelper(); exception recording admin alert, `%s`; error was, `%s`' % (unicode(repr(e)), error_message) )
         return
 
     # end class RequestViewPostHelper
 
 
+class TransferQueueProcessor( object ):
+    """ Drains the TransferJob queue, shipping due jobs in batches of up to BATCH_SIZE las lines per file.
+        Called by management/commands/process_transfer_queue.py """
+
+    def __init__( self ):
+        self.MAX_ATTEMPTS = int( os.environ.get('EZSCAN__TRANSFER_MAX_ATTEMPTS', '8') )
+        self.BACKOFF_BASE_SECONDS = int( os.environ.get('EZSCAN__TRANSFER_BACKOFF_BASE_SECONDS', '30') )
+        self.BACKOFF_MAX_SECONDS = int( os.environ.get('EZSCAN__TRANSFER_BACKOFF_MAX_SECONDS', '3600') )
+        self.STALE_SECONDS = int( os.environ.get('EZSCAN__TRANSFER_STALE_SECONDS', '900') )
+        self.BATCH_SIZE = int( os.environ.get('EZSCAN__TRANSFER_BATCH_SIZE', '1') )
+        self.BATCH_WINDOW_SECONDS = int( os.environ.get('EZSCAN__TRANSFER_BATCH_WINDOW_SECONDS', '0') )
+
+    def process_due_jobs( self, limit=50 ):
+        """ Claims and runs due jobs once a batch is full or its window has elapsed; returns number of jobs run.
+            Called by process_transfer_queue command. """
+        self.requeue_stale_jobs()
+        due_jobs = list( TransferJob.objects.filter(
+            status='pending', next_attempt_datetime__lte=datetime.datetime.now() ).order_by( 'id' ).values( 'id', 'create_datetime' )[0:max(limit, self.BATCH_SIZE)] )
+        if not self.batch_ready( due_jobs ):
+            return 0
+        claimed_ids = [ job['id'] for job in due_jobs if self.claim_job(job['id']) ]
+        jobs = list( TransferJob.objects.select_related( 'scan_request' ).filter( id__in=claimed_ids ).order_by( 'id' ) )
+        for i in range( 0, len(jobs), self.BATCH_SIZE ):
+            self.run_batch( jobs[i:i + self.BATCH_SIZE] )
+        log.debug( 'TransferQueueProcessor(); run_count, `%s`' % len(jobs) )
+        return len( jobs )
+
+    def batch_ready( self, due_jobs ):
+        """ Returns boolean; true when enough jobs are due, or the oldest has waited out the batch window.
+            Called by process_due_jobs() """
+        if not due_jobs:
+            return False
+        if len( due_jobs ) >= self.BATCH_SIZE:
+            return True
+        window_start = datetime.datetime.now() - datetime.timedelta( seconds=self.BATCH_WINDOW_SECONDS )
+        return due_jobs[0]['create_datetime'] <= window_start
+
+    def claim_job( self, job_id ):
+        """ Flips job from pending to in_process; returns boolean.
+            The conditional update means only one worker can win a given job.
+            Called by process_due_jobs(), BulkResubmitter.claim_batch(), TryAgainConfirmationHelper.claim_transfer_job() """
+        updated = TransferJob.objects.filter( id=job_id, status='pending' ).update(
+            status='in_process', modify_datetime=datetime.datetime.now() )
+        return updated == 1
+
+    def requeue_stale_jobs( self ):
+        """ Returns jobs left in_process by a crashed worker to the queue.
+            Called by process_due_jobs() """
+        cutoff = datetime.datetime.now() - datetime.timedelta( seconds=self.STALE_SECONDS )
+        requeued = TransferJob.objects.filter( status='in_process', modify_datetime__lt=cutoff ).update(
+            status='pending', modify_datetime=datetime.datetime.now() )
+        if requeued:
+            log.warning( 'TransferQueueProcessor(); requeued `%s` stale jobs' % requeued )
+        return requeued
+
+    def run_batch( self, jobs ):
+        """ Makes one data/count file pair for the jobs, sends it, then records the outcome.
+            Called by process_due_jobs() """
+        job_ids = [ job.id for job in jobs ]
+        scan_request_ids = [ job.scan_request_id for job in jobs ]
+        try:
+            ( data_filepath, count_filepath ) = prepper.make_batch_data_files(
+                datetime_object=datetime.datetime.now(), data_strings=[ job.scan_request.las_conversion for job in jobs ], request_ids=scan_request_ids )
+            sender.transfer_files( data_filepath, count_filepath )
+            prepper.cleanup( data_filepath )
+            ScanRequestDailyStats.move_status( [ job.scan_request for job in jobs ], 'transferred' )
+            ScanRequest.objects.filter( id__in=scan_request_ids ).update( status='transferred' )
+            TransferJob.objects.filter( id__in=job_ids ).update(
+                status='done', attempts=models.F('attempts') + 1, last_error='', modify_datetime=datetime.datetime.now() )
+            metrics.inc( 'easyscan_las_transfers_total', {'source': 'queue', 'outcome': 'success'}, len(jobs) )
+            log.debug( 'TransferQueueProcessor(); `%s` and `%s` transferred for scan_requests `%s`' % (data_filepath, count_filepath, scan_request_ids) )
+        except Exception as e:
+            error_message = unicode( repr(e) )
+            metrics.inc( 'easyscan_las_transfers_total', {'source': 'queue', 'outcome': 'failure'}, len(jobs) )
+            for job in jobs:
+                self.handle_failure( job, error_message )
+            RequestViewPostHelper().email_admins_on_error( error_message, scan_request_ids )
+        return
+
+    def handle_failure( self, job, error_message ):
+        """ Schedules a retry with exponential backoff, or gives up after MAX_ATTEMPTS.
+            Called by run_batch(), TryAgainConfirmationHelper.retransfer_data() """
+        job.attempts += 1
+        log.error( 'TransferQueueProcessor(); job `%s` attempt `%s` error, `%s`' % (job.id, job.attempts, error_message) )
+        job.last_error = error_message
+        if job.attempts >= self.MAX_ATTEMPTS:
+            job.status = 'failed'
+        else:
+            job.status = 'pending'
+            job.next_attempt_datetime = datetime.datetime.now() + datetime.timedelta( seconds=self.calc_backoff(job.attempts) )
+        job.save( update_fields=['attempts', 'last_error', 'status', 'next_attempt_datetime', 'modify_datetime'] )
+        return
+
+    def calc_backoff( self, attempts ):
+        """ Returns seconds to wait before the next attempt.
+            Called by handle_failure() """
+        seconds = self.BACKOFF_BASE_SECONDS * ( 2 ** (attempts - 1) )
+        return min( seconds, self.BACKOFF_MAX_SECONDS )
+
+    # end class TransferQueueProcessor
+
+
+class BulkResubmitter( object ):
+    """ Re-sends many scan-requests at once, eg after an Annex outage.
+        Las lines are rebuilt from the request fields in one pass, and go out BATCH_SIZE to a file over the worker's one sftp session;
+          outcomes and admin-notes are written with bulk updates.
+        Called by admin.ScanRequestAdmin.bulk_resubmit() and management/commands/bulk_resubmit.py """
+
+    def __init__( self ):
+        self.BATCH_SIZE = int( os.environ.get('EZSCAN__BULK_RESUBMIT_BATCH_SIZE', '100') )
+
+    def select_requests( self, start_day, end_day ):
+        """ Returns non-transferred requests created within the days given.
+            Called by bulk_resubmit command. """
+        return ScanRequest.objects.exclude( status='transferred' ).filter(
+            create_datetime__gte=start_day, create_datetime__lt=end_day + datetime.timedelta(days=1) )
+
+    def resubmit( self, scan_requests ):
+        """ Sends the non-transferred requests in the queryset; returns dict of counts.
+            Requests whose TransferJob a queue worker is running are skipped; pending jobs are claimed a batch at a time, just before it is sent,
+              so the worker won't send them too, and no claim sits unsent long enough for requeue_stale_jobs() to hand it back.
+            Called by admin.ScanRequestAdmin.bulk_resubmit(), bulk_resubmit command. """
+        candidates = scan_requests.exclude( status='transferred' ).exclude( transfer_jobs__status='in_process' )
+        scnrqsts = list( candidates.order_by( 'id' ).only( 'id', 'status', 'item_source_url', *LasDataMaker.SOURCE_FIELDS ) )
+        pending_job_ids = list( TransferJob.objects.filter(scan_request__in=candidates, status='pending').values_list('id', 'scan_request_id') )  # both read before any claim changes `candidates`
+        result = { 'selected': 0, 'transferred': 0, 'failed': 0 }
+        for i in range( 0, len(scnrqsts), self.BATCH_SIZE ):
+            ( batch, claimed_job_ids ) = self.claim_batch( scnrqsts[i:i + self.BATCH_SIZE], pending_job_ids )
+            if not batch:
+                continue
+            result['selected'] += len( batch )
+            error_message = self.send_batch( batch )
+            self.record_outcome( batch, claimed_job_ids, error_message )
+            metrics.inc( 'easyscan_las_transfers_total', {'source': 'bulk', 'outcome': 'failure' if error_message else 'success'}, len(batch) )
+            if error_message:
+                result['failed'] += len( batch )
+                RequestViewPostHelper().email_admins_on_error( 'bulk resubmit; %s' % error_message, [ scnrqst.id for scnrqst in batch ] )
+            else:
+                result['transferred'] += len( batch )
+        log.info( 'BulkResubmitter(); result, `%s`' % result )
+        return result
+
+    def claim_batch( self, batch, pending_job_ids ):
+        """ Claims the batch's pending jobs; returns the requests still to send, and the claimed job ids.
+            A request whose job a worker has claimed since selection -- and may already have sent -- is dropped.
+            Called by resubmit() """
+        batch_ids = set( [ scnrqst.id for scnrqst in batch ] )
+        batch_job_ids = [ ( job_id, scan_request_id ) for ( job_id, scan_request_id ) in pending_job_ids if scan_request_id in batch_ids ]
+        queue_processor = TransferQueueProcessor()
+        lost_ids = set( [ scan_request_id for ( job_id, scan_request_id ) in batch_job_ids if not queue_processor.claim_job(job_id) ] )  # a worker won the race
+        batch = [ scnrqst for scnrqst in batch if scnrqst.id not in lost_ids ]
+        claimed_job_ids = [ job_id for ( job_id, scan_request_id ) in batch_job_ids if scan_request_id not in lost_ids ]
+        return ( batch, claimed_job_ids )
+
+    def send_batch( self, batch ):
+        """ Rebuilds the batch's las lines, and ships them as one data/count file pair; returns None, or the error message.
+            Called by resubmit() """
+        try:
+            with phase( 'prep' ):
+                ( data_filepath, count_filepath ) = prepper.make_batch_data_files(
+                    datetime_object=datetime.datetime.now(), data_strings=list( las_maker.iter_csv_strings(batch) ), request_ids=[ scnrqst.id for scnrqst in batch ] )
+            with phase( 'sftp' ):
+                sender.transfer_files( data_filepath, count_filepath )
+            prepper.cleanup( data_filepath )
+        except Exception as e:
+            log.error( 'BulkResubmitter(); batch error, `%s`' % unicode(repr(e)) )
+            return unicode( repr(e) )
+        return None
+
+    def record_outcome( self, batch, claimed_job_ids, error_message ):
+        """ Stamps admin-notes, and on success marks the requests transferred and their claimed jobs done;
+              on failure counts an attempt on the claimed jobs, returning them to the queue, or failing those that reached the queue's MAX_ATTEMPTS.
+            Called by resubmit() """
+        scan_request_ids = [ scnrqst.id for scnrqst in batch ]
+        note = 'error on bulk resubmit, `%s`' % error_message if error_message else 'bulk resubmit completed'
+        note_prefix = '%s -- %s\r || ' % ( unicode(datetime.datetime.now()), note )  # same note format as TryAgainConfirmationHelper.update_notes()
+        jobs = TransferJob.objects.filter( id__in=claimed_job_ids, scan_request_id__in=scan_request_ids )
+        with transaction.atomic():
+            updates = self.build_note_updates( scan_request_ids, note_prefix )
+            if error_message:
+                ScanRequest.objects.filter( id__in=scan_request_ids ).update( **updates )
+                max_attempts = TransferQueueProcessor().MAX_ATTEMPTS
+                job_updates = { 'attempts': F('attempts') + 1, 'last_error': error_message, 'modify_datetime': datetime.datetime.now() }
+                jobs.filter( attempts__gte=max_attempts - 1 ).update( status='failed', **job_updates )
+                jobs.filter( attempts__lt=max_attempts - 1 ).update( status='pending', **job_updates )
+            else:
+                ScanRequestDailyStats.move_status( batch, 'transferred' )
+                ScanRequest.objects.filter( id__in=scan_request_ids ).update( status='transferred', **updates )
+                jobs.update( status='done', attempts=F('attempts') + 1, last_error='', modify_datetime=datetime.datetime.now() )
+        return
+
+    def build_note_updates( self, scan_request_ids, note_prefix ):
+        """ Returns update() kwargs prepending note_prefix to each request's admin-notes, with search_text rebuilt exactly as save() would.
+            Reads the rows' search fields locked, so the values written match the rows; one CASE per column keeps it to one UPDATE.
+            Called, inside a transaction, by record_outcome() """
+        rows = list( ScanRequest.objects.select_for_update().filter( id__in=scan_request_ids ).only( 'id', *SearchTextMaker.SOURCE_FIELDS ) )
+        ( notes_whens, search_whens ) = ( [], [] )
+        for row in rows:
+            row.admin_notes = note_prefix + ( row.admin_notes or '' )
+            notes_whens.append( When(id=row.id, then=Value(row.admin_notes)) )
+            search_whens.append( When(id=row.id, then=Value(search_text_maker.make_search_text(row))) )
+        return {
+            'admin_notes': Case( *notes_whens, default=F('admin_notes'), output_field=models.TextField() ),
+            'search_text': Case( *search_whens, default=F('search_text'), output_field=models.TextField() ) }
+
+    # end class BulkResubmitter
+
+
+class OutboxProcessor( object ):
+    """ Drains the OutboxEmail queue over one smtp connection per poll.
+        A failed email is retried with exponential backoff, and dead-lettered (status 'dead', kept for the admin) after MAX_ATTEMPTS;
+          one with no recipients, or that the backend reports as not sent, is dead-lettered at once, with an admin alert.
+        Called by management/commands/process_email_outbox.py """
+
+    def __init__( self ):
+        self.MAX_ATTEMPTS = int( os.environ.get('EZSCAN__EMAIL_MAX_ATTEMPTS', '6') )
+        self.BACKOFF_BASE_SECONDS = int( os.environ.get('EZSCAN__EMAIL_BACKOFF_BASE_SECONDS', '60') )
+        self.BACKOFF_MAX_SECONDS = int( os.environ.get('EZSCAN__EMAIL_BACKOFF_MAX_SECONDS', '3600') )
+        self.STALE_SECONDS = int( os.environ.get('EZSCAN__EMAIL_STALE_SECONDS', '900') )
+
+    def process_due_emails( self, limit=50 ):
+        """ Queues any due admin-alert digest, then claims and sends due emails; returns number sent.
+            Called by process_email_outbox command. """
+        AlertDigester().flush_due()
+        now = datetime.datetime.now()
+        OutboxEmail.objects.filter( status='sending', modify_datetime__lt=now - datetime.timedelta(seconds=self.STALE_SECONDS) ).update(
+            status='pending', modify_datetime=now )  # left by a crashed worker
+        due_ids = list( OutboxEmail.objects.filter( status='pending', next_attempt_datetime__lte=now ).order_by( 'id' ).values_list( 'id', flat=True )[0:limit] )
+        claimed_ids = [ email_id for email_id in due_ids if OutboxEmail.objects.filter( id=email_id, status='pending' ).update( status='sending', modify_datetime=now ) ]
+        if not claimed_ids:
+            return 0
+        emails = list( OutboxEmail.objects.filter( id__in=claimed_ids ).order_by( 'id' ) )
+        sent_ids = self.send_emails( emails )
+        OutboxEmail.objects.filter( id__in=sent_ids ).update(
+            status='sent', attempts=F('attempts') + 1, last_error='', modify_datetime=datetime.datetime.now() )
+        log.debug( 'OutboxProcessor(); sent `%s` of `%s`' % (len(sent_ids), len(emails)) )
+        return len( sent_ids )
+
+    def send_emails( self, emails ):
+        """ Sends emails over one connection; returns ids sent, having scheduled retries for the rest.
+            Called by process_due_emails() """
+        sent_ids = []
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as e:
+            for email in emails:
+                self.handle_failure( email, unicode(repr(e)) )
+            return sent_ids
+        try:
+            for email in emails:
+                try:
+                    message = email.build_message( connection )
+                    if not message.recipients():
+                        self.handle_undeliverable( email, 'no recipients' )
+                        continue
+                    with metrics.timer( 'easyscan_smtp_send_seconds' ):
+                        sent_count = message.send()
+                    if sent_count:
+                        sent_ids.append( email.id )
+                    else:
+                        self.handle_undeliverable( email, 'email backend reported nothing sent' )
+                except Exception as e:
+                    self.handle_failure( email, unicode(repr(e)) )
+        finally:
+            try:
+                connection.close()
+            except Exception as e:
+                log.warning( 'OutboxProcessor(); error closing connection, `%s`' % unicode(repr(e)) )
+        return sent_ids
+
+    def handle_failure( self, email, error_message ):
+        """ Schedules a retry with exponential backoff, or dead-letters the email after MAX_ATTEMPTS.
+            Called by send_emails() """
+        email.attempts += 1
+        email.last_error = error_message
+        if email.attempts >= self.MAX_ATTEMPTS:
+            email.status = 'dead'
+            log.error( 'OutboxProcessor(); email `%s` dead after `%s` attempts, `%s`' % (email.id, email.attempts, error_message) )
+        else:
+            email.status = 'pending'
+            seconds = min( self.BACKOFF_BASE_SECONDS * (2 ** (email.attempts - 1)), self.BACKOFF_MAX_SECONDS )
+            email.next_attempt_datetime = datetime.datetime.now() + datetime.timedelta( seconds=seconds )
+            log.warning( 'OutboxProcessor(); email `%s` attempt `%s` error, `%s`' % (email.id, email.attempts, error_message) )
+        email.save( update_fields=['attempts', 'last_error', 'status', 'next_attempt_datetime', 'modify_datetime'] )
+        return
+
+    def handle_undeliverable( self, email, error_message ):
+        """ Dead-letters an email that can't go anywhere -- retrying won't help -- and raises an admin alert, rather than counting it sent.
+            Called by send_emails() """
+        email.attempts += 1
+        email.last_error = error_message
+        email.status = 'dead'
+        email.save( update_fields=['attempts', 'last_error', 'status', 'modify_datetime'] )
+        log.error( 'OutboxProcessor(); email `%s` dead, `%s`' % (email.id, error_message) )
+        AdminAlert.record( 'outbox email not sent, `%s`; see OutboxEmail entries with status `dead`' % error_message )
+        return
+
+    # end class OutboxProcessor
+
+
+class AlertDigester( object ):
+    """ Sends open AdminAlerts as one digest email, once the oldest has been open WINDOW_SECONDS.
+        Called by OutboxProcessor.process_due_emails() """
+
+    def __init__( self ):
+        self.WINDOW_SECONDS = int( os.environ.get('EZSCAN__ADMIN_ALERT_WINDOW_SECONDS', '300') )
+
+    def flush_due( self ):
+        """ Queues the digest if due; returns number of alerts it covers.
+            Called by OutboxProcessor.process_due_emails() """
+        window_start = datetime.datetime.now() - datetime.timedelta( seconds=self.WINDOW_SECONDS )
+        if not AdminAlert.objects.filter( status='open', first_datetime__lte=window_start ).exists():
+            return 0
+        alert_ids = list( AdminAlert.objects.filter( status='open' ).order_by( 'id' ).values_list( 'id', flat=True ) )
+        claimed_ids = [ alert_id for alert_id in alert_ids if AdminAlert.objects.filter( id=alert_id, status='open' ).update( status='sent' ) ]  # one worker per alert
+        alerts = list( AdminAlert.objects.filter( id__in=claimed_ids ).order_by( 'id' ) )
+        if alerts:
+            helper = RequestViewPostHelper()
+            OutboxEmail.enqueue( 'easyscan errors (%s)' % sum([ alert.count for alert in alerts ]), self.build_body(alerts), helper.ON_ERROR_EMAIL_FROM, helper.ON_ERROR_EMAIL_TO )
+        return len( alerts )
+
+    def build_body( self, alerts ):
+        """ Returns digest text; alerts sharing a message are merged.
+            Called by flush_due() """
+        merged = collections.OrderedDict()
+        for alert in alerts:
+            entry = merged.setdefault( alert.fingerprint, {'message': alert.message, 'count': 0, 'first': alert.first_datetime, 'last': alert.last_datetime, 'ids': []} )
+            entry['count'] += alert.count
+            ( entry['first'], entry['last'] ) = ( min(entry['first'], alert.first_datetime), max(entry['last'], alert.last_datetime) )
+            entry['ids'].extend( [ scan_request_id for scan_request_id in alert.scan_request_ids.split(',') if scan_request_id and scan_request_id not in entry['ids'] ] )
+        sections = []
+        for entry in merged.values():
+            ids_text = ', '.join( entry['ids'][0:AdminAlert.MAX_IDS] ) or 'none recorded'
+            sections.append( '%s time(s), %s to %s\n%s\nscan_request ids: %s' % (
+                entry['count'], entry['first'].strftime('%Y-%m-%d %H:%M:%S'), entry['last'].strftime('%Y-%m-%d %H:%M:%S'), entry['message'], ids_text) )
+        return '\n\n'.join( sections )
+
+    # end class AlertDigester
+
+
+class MetricsHelper( object ):
+    """ Builds the prometheus scrape: counters and histograms from lib.metrics, queue depths from the db.
+        Called by views.metrics() """
+
+    def __init__( self ):
+        self.ALLOWED_IPS = json.loads( os.environ.get('EZSCAN__METRICS_ALLOWED_IPS_JSON', '["127.0.0.1"]') )
+
+    def check_ip( self, request ):
+        """ Returns boolean; whether the scraper's address is allowed.
+            Called by views.metrics() """
+        return request.META.get( 'REMOTE_ADDR' ) in self.ALLOWED_IPS
+
+    def build_response( self ):
+        """ Returns prometheus text response.
+            Called by views.metrics() """
+        gauges = [
+            ( 'easyscan_transfer_queue_depth', 'Transfer jobs waiting or being sent, by status.', self.count_by_status(TransferJob, ['pending', 'in_process']) ),
+            ( 'easyscan_email_outbox_depth', 'Outbox emails waiting or being sent, by status.', self.count_by_status(OutboxEmail, ['pending', 'sending']) ) ]
+        output = metrics.render( gauges )
+        return HttpResponse( output, content_type='text/plain; version=0.0.4; charset=utf-8' )
+
+    def count_by_status( self, model, statuses ):
+        """ Returns [ ({'status': status}, count), ... ] from one grouped query, zero-filled.
+            Called by build_response() """
+        counts = dict( model.objects.filter( status__in=statuses ).values_list( 'status' ).annotate( Count('id') ).order_by() )
+        return [ ( {'status': status}, counts.get(status, 0) ) for status in statuses ]
+
+    # end class MetricsHelper
+
+
 class ShibViewHelper( object ):
     """ Contains helpers for views.shib_login() """
 
@@ -785,6 +1503,8 @@ class StatsBuilder( object ):
     """ Handles stats-api calls. """
 
     def __init__( self ):
+        self.day_start = None  # datetime.date; set by check_params()
+        self.day_end = None  # datetime.date; set by check_params()
         self.date_start = None  # set by check_params()
         self.date_end = None  # set by check_params()
         self.output = None  # set by check_params() or...
@@ -796,27 +1516,47 @@ class StatsBuilder( object ):
         if 'start_date' not in get_params or 'end_date' not in get_params:  # not valid
             self._handle_bad_params( server_name )
             return False
-        else:  # valid
-            self.date_start = '%s 00:00:00' % get_params['start_date']
-            self.date_end = '%s 23:59:59' % get_params['end_date']
-            return True
+        try:  # strptime also takes unpadded dates, eg `2015-1-1`
+            ( self.day_start, self.day_end ) = [ datetime.datetime.strptime( unicode(get_params[key]), '%Y-%m-%d' ).date() for key in ('start_date', 'end_date') ]
+        except ValueError:
+            self._handle_bad_params( server_name )
+            return False
+        self.date_start = '%s 00:00:00' % self.day_start
+        self.date_end = '%s 23:59:59' % self.day_end
+        return True
 
     def run_query( self ):
         """ Queries db.
             Called by views.stats_v1() """
         requests = ScanRequest.objects.filter(
-            create_datetime__gte=self.date_start).filter(create_datetime__lte=self.date_end)
+            create_datetime__gte=self.day_start).filter(create_datetime__lt=self.day_end + datetime.timedelta(days=1))
         return requests
 
     def process_results( self, requests ):
-        """ Extracts desired data from resultset.
+        """ Extracts desired data; closed days come from the ScanRequestDailyStats rollups, and only today's partial day is aggregated from ScanRequest rows.
             Called by views.stats_v1() """
-        data = { 'count_request_for_period': len(requests) }
-        for request in requests:
-            # TODO: add in 'source'
-            pass
+        today = datetime.date.today()
+        data = {
+            'count_request_for_period': 0,
+            'count_by_status': {},
+            'count_by_day': {},
+            'count_by_source_host': {} }
+        rollups = ScanRequestDailyStats.objects.filter( day__gte=self.day_start, day__lte=self.day_end, day__lt=today )
+        for row in rollups.values( 'day', 'status', 'source_host', 'count' ):
+            self.add_count( data, row['day'], row['status'], row['source_host'], row['count'] )
+        todays_requests = requests.order_by().filter( create_datetime__gte=today )  # no ordering, so GROUP BY stays on the grouped columns
+        for row in todays_requests.values( 'status', 'item_source_url' ).annotate( count=Count('id') ):
+            self.add_count( data, today, row['status'], ScanRequestDailyStats.extract_host(row['item_source_url']), row['count'] )
         return data
 
+    def add_count( self, data, day, status, source_host, count ):
+        """ Adds count to total and breakdowns.
+            Called by process_results() """
+        data['count_request_for_period'] += count
+        for ( breakdown, key ) in [ ('count_by_status', status), ('count_by_day', unicode(day)), ('count_by_source_host', source_host) ]:
+            data[breakdown][key] = data[breakdown].get( key, 0 ) + count
+        return
+
     def build_response( self, data ):
         """ Builds json response.
             Called by views.stats_v1() """
@@ -824,7 +1564,10 @@ class StatsBuilder( object ):
             'request': {
                 'date_begin': self.date_start, 'date_end': self.date_end },
             'response': {
-                'count_total': data['count_request_for_period'] }
+                'count_total': data['count_request_for_period'],
+                'count_by_status': data['count_by_status'],
+                'count_by_day': data['count_by_day'],
+                'count_by_source_host': data['count_by_source_host'] }
             }
         self.output = json.dumps( jdict, sort_keys=True, indent=2 )
         return
@@ -843,3 +1586,86 @@ class StatsBuilder( object ):
         return
 
     # end class StatsBuilder
+
+
+class DevJsHelper( object ):
+    """ Serves the development copies of the josiah javascript, rewritten for the requesting host and scheme.
+        Each rewrite is kept per ( file, host, scheme ) and redone when the file's mtime changes;
+          responses carry ETag and Last-Modified for 304s, and are gzipped when the client accepts it (EZSCAN__DEV_JS_GZIP).
+        Called by views.easyscan_js(), views.request_item_js() """
+
+    def __init__( self ):
+        self.JS_DIR_PATH = os.path.join( os.path.dirname(os.path.abspath(__file__)), 'lib' )
+        self.GZIP = json.loads( os.environ.get('EZSCAN__DEV_JS_GZIP', 'true') )
+        self.MAX_ENTRIES = 64  # hosts are limited by ALLOWED_HOSTS; this just bounds memory
+        self.entries = {}  # ( filename, host, scheme ) -> { 'mtime', 'body', 'gzip_body', 'etag' }
+
+    def get_entry( self, request, filename ):
+        """ Returns the cached rewrite, rebuilding it if the file changed.
+            The entry is kept on the request, so the etag, last-modified, and body lookups of one hit cost a single stat.
+            Called by get_etag(), get_last_modified(), build_response() """
+        memo = getattr( request, '_devjs_entry', None )
+        if memo is not None and memo[0] == filename:
+            return memo[1]
+        scheme = 'https' if request.is_secure() else 'http'
+        key = ( filename, request.get_host(), scheme )
+        mtime = self.read_mtime( filename )
+        entry = self.entries.get( key )
+        if entry is None or entry['mtime'] != mtime:
+            entry = self.build_entry( filename, key[1], scheme, mtime )
+            if len( self.entries ) >= self.MAX_ENTRIES:
+                self.entries.clear()
+            self.entries[key] = entry
+        request._devjs_entry = ( filename, entry )
+        return entry
+
+    def read_mtime( self, filename ):
+        """ Returns the file's mtime.
+            Called by get_entry() """
+        return os.path.getmtime( os.path.join(self.JS_DIR_PATH, filename) )
+
+    def build_entry( self, filename, host, scheme, mtime ):
+        """ Reads and rewrites the file; returns the entry.
+            Called by get_entry() """
+        with open( os.path.join(self.JS_DIR_PATH, filename) ) as f:
+            js_unicode = f.read().decode( 'utf-8' )
+        if filename == 'josiah_easyscan.js':
+            js_unicode = js_unicode.replace( 'library.brown.edu/easyscan/josiah_request_item.js', '%s/easyscan/dev_josiah_request_item.js' % host )
+            js_unicode = js_unicode.replace( 'library.brown.edu', host )
+            js_unicode = js_unicode.replace( 'https', scheme )
+        else:
+            js_unicode = js_unicode.replace( 'library.brown.edu', host )
+        body = js_unicode.encode( 'utf-8' )
+        log.debug( 'DevJsHelper(); rewrote `%s` for `%s://%s`' % (filename, scheme, host) )
+        return { 'mtime': mtime, 'body': body, 'gzip_body': compress_string( body ), 'etag': hashlib.md5( body ).hexdigest() }
+
+    def use_gzip( self, request ):
+        """ Returns boolean; whether gzip is enabled and the client accepts it.
+            Called by get_etag(), build_response() """
+        return self.GZIP and 'gzip' in request.META.get( 'HTTP_ACCEPT_ENCODING', '' )
+
+    def get_etag( self, request, filename ):
+        """ Returns etag; the gzipped representation gets its own.
+            Called by views' condition() decorator """
+        etag = self.get_entry( request, filename )['etag']
+        return '%s-gzip' % etag if self.use_gzip( request ) else etag
+
+    def get_last_modified( self, request, filename ):
+        """ Returns the file's mtime as a utc datetime.
+            Called by views' condition() decorator """
+        return datetime.datetime.utcfromtimestamp( int(self.get_entry(request, filename)['mtime']) )
+
+    def build_response( self, request, filename ):
+        """ Returns the javascript response; the condition() decorator adds ETag & Last-Modified, and answers 304s before this runs.
+            Called by views.easyscan_js(), views.request_item_js() """
+        entry = self.get_entry( request, filename )
+        if self.use_gzip( request ):
+            response = HttpResponse( entry['gzip_body'], content_type='application/javascript; charset=utf-8' )
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse( entry['body'], content_type='application/javascript; charset=utf-8' )
+        response['Vary'] = 'Accept-Encoding'
+        response['Cache-Control'] = 'no-cache'  # revalidate every time, so an edited file shows up at once, as a cheap 304 otherwise
+        return response
+
+    # end class DevJsHelper
@@ -2,14 +2,37 @@
 
 from __future__ import unicode_literals
 
-import datetime, pprint
+import datetime, gzip, io, json, logging, os, pprint, random, shutil, tempfile, threading, time, unittest
 # from easyscan_app.models import LasDataMaker, ScanRequest, StatsBuilder
 from django.http import QueryDict
-from django.test import TestCase
+from django.conf import settings
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core import serializers
+from django.contrib.admin.actions import delete_selected
+from django.contrib.admin.sites import AdminSite
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend
+from easyscan_app import models, views
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from easyscan_app.admin import ScanRequestAdmin, ScanRequestArchiveAdmin
+from easyscan_app.lib.availability import CircuitBreaker, TitleCache, TitleLookup
 from easyscan_app.lib.data_prepper import LasDataMaker
-from easyscan_app.lib.magic_bus import Prepper
+from easyscan_app.lib import version_helper
+from easyscan_app.lib.magic_bus import Prepper, SftpConnection
+from easyscan_app.lib.metrics import MetricsStore
+from easyscan_app.lib.record_encoder import RecordEncoder
+from easyscan_app.lib.request_timer import RequestTimingMiddleware, phase, state as timer_state
+from easyscan_app.lib import session_store
+from easyscan_app.lib.session_store import SessionStore
 from easyscan_app.lib.spacer import Spacer
-from easyscan_app.models import ScanRequest, StatsBuilder
+from easyscan_app.models import AdminAlert, AlertDigester, BulkResubmitter, DevJsHelper, MetricsHelper, OutboxEmail, OutboxProcessor, RequestViewPostHelper, ScanRequest, ScanRequestArchive, ScanRequestDailyStats, StatsBuilder, TransferJob, TransferQueueProcessor, TryAgainConfirmationHelper, TryAgainHelper
 
 
 # maker = LasDataMaker()
@@ -147,9 +170,146 @@ class LasDataMakerTest( TestCase ):
             self.maker.make_notes_field( patron_email, item_chap_vol_title, item_page_range_other, item_other )
             )
 
+    def test__iter_csv_strings__matches_single( self ):
+        """ Checks the batch api returns exactly what make_csv_string() does, for instances and dicts. """
+        records = [
+            ScanRequest( create_datetime=datetime.datetime(2014, 12, 8, 12, 40, 59), patron_name=u'Zoë "Z" Smith', patron_barcode=u'1234', patron_email=u'z@a.edu',
+                item_title=u'“iñtërnâtiônàlĭzætiøn”,\nwith `ticks`', item_barcode=u'31236090031116', item_chap_vol_title=u'a ' * 40, item_page_range_other=u'1-10\r\n', item_other=u'x' * 120 ),
+            ScanRequest( create_datetime=datetime.datetime(2015, 1, 1), patron_name=u'', patron_barcode=u'', patron_email=u'', item_title=u'', item_barcode=u'', item_chap_vol_title=u'', item_page_range_other=u'', item_other=u'' ),
+            ]
+        expected = [ self.maker.make_csv_string(
+            r.create_datetime, r.patron_name, r.patron_barcode, r.patron_email, r.item_title, r.item_barcode, r.item_chap_vol_title, r.item_page_range_other, r.item_other ) for r in records ]
+        self.assertEqual( expected, list(self.maker.iter_csv_strings(records)) )
+        dicts = [ dict( [ (name, getattr(r, name)) for name in LasDataMaker.SOURCE_FIELDS ] ) for r in records ]
+        self.assertEqual( expected, list(self.maker.iter_csv_strings(dicts)) )
+
     # end class class LasDataMakerTest
 
 
+class ScanRequestSaveTest( TestCase ):
+    """ Tests models.py ScanRequest.save() """
+
+    def test__save__new_is_single_insert( self ):
+        """ Checks that a new request, las_conversion included, is written to its table with one query. """
+        sr = ScanRequest( item_title=u'foo', item_barcode=u'31236090031116', patron_email=u'a@a.edu', status=u'in_process' )
+        with CaptureQueriesContext( connection ) as context:
+            sr.save()
+        self.assertEqual( 1, len([ query for query in context.captured_queries if u'"easyscan_app_scanrequest"' in query['sql'] ]) )
+        saved = ScanRequest.objects.get( id=sr.id )
+        self.assertTrue( u'31236090031116' in saved.las_conversion )
+        self.assertTrue( saved.create_datetime.strftime(u'%a %b %d %Y') in saved.las_conversion )
+
+    def test__save__update_fields( self ):
+        """ Checks that a narrow update leaves las_conversion alone unless one of its source fields changed. """
+        sr = ScanRequest( item_title=u'foo', status=u'in_process' )
+        sr.save()
+        sr.status = u'transferred'
+        sr.las_conversion = u'untouched'
+        with CaptureQueriesContext( connection ) as context:
+            sr.save( update_fields=[u'status'] )
+        self.assertEqual( 1, len([ query for query in context.captured_queries if u'"easyscan_app_scanrequest"' in query['sql'] ]) )
+        saved = ScanRequest.objects.get( id=sr.id )
+        self.assertEqual( u'transferred', saved.status )
+        self.assertNotEqual( u'untouched', saved.las_conversion )
+        sr.item_title = u'bar'
+        sr.save( update_fields=[u'item_title'] )
+        self.assertTrue( u'"bar"' in ScanRequest.objects.get(id=sr.id).las_conversion )
+
+    def test__save__search_text( self ):
+        """ Checks that search_text is normalized on insert, and rebuilt when a narrow update touches one of its source fields. """
+        sr = ScanRequest( item_title=u'Müller  Café', patron_email=u'A@A.edu', status=u'in_process' )
+        sr.save()
+        self.assertEqual( u'muller cafe a@a.edu', ScanRequest.objects.get(id=sr.id).search_text )
+        sr.admin_notes = u'Re-Sent'
+        sr.save( update_fields=[u'admin_notes'] )
+        self.assertEqual( u'muller cafe a@a.edu re-sent', ScanRequest.objects.get(id=sr.id).search_text )
+
+    # end class ScanRequestSaveTest
+
+
+class ScanRequestDeleteTest( TestCase ):
+    """ Tests models.py decrement_daily_stats() """
+
+    def setUp( self ):
+        self.ids = []
+        for status in [ u'in_process', u'in_process', u'transferred', u'transferred' ]:
+            sr = ScanRequest( item_title=u'foo', item_source_url=u'http://library.example.edu/x', status=status )
+            sr.save()
+            self.ids.append( sr.id )
+
+    def counts( self ):
+        return dict( ScanRequestDailyStats.objects.filter(day=datetime.date.today()).values_list(u'status', u'count') )
+
+    def test__delete( self ):
+        """ Checks deleting a request takes it out of the rollups. """
+        ScanRequest.objects.get( id=self.ids[0] ).delete()
+        self.assertEqual( {u'in_process': 1, u'transferred': 2}, self.counts() )
+
+    def test__admin_delete_selected( self ):
+        """ Checks the admin's bulk delete action takes every deleted request out of the rollups. """
+        request = RequestFactory().post( u'/', {u'post': u'yes'} )
+        request.user = User.objects.create( username=u'staff', is_active=True, is_staff=True, is_superuser=True )  # the action logs each deletion against the user
+        request._messages = CookieStorage( request )
+        delete_selected( ScanRequestAdmin(ScanRequest, AdminSite()), request, ScanRequest.objects.filter(id__in=self.ids[1:]) )
+        self.assertEqual( [self.ids[0]], list(ScanRequest.objects.values_list(u'id', flat=True)) )
+        self.assertEqual( {u'in_process': 1, u'transferred': 0}, self.counts() )
+
+    def test__archive_keeps_counts( self ):
+        """ Checks archiving, which deletes the live rows, leaves the rollups alone. """
+        ScanRequestArchive.archive_older_than( datetime.datetime.now() + datetime.timedelta(days=1) )
+        self.assertEqual( 0, ScanRequest.objects.count() )
+        self.assertEqual( {u'in_process': 2, u'transferred': 2}, self.counts() )
+
+    # end class ScanRequestDeleteTest
+
+
+class ScanRequestAdminSearchTest( TestCase ):
+    """ Tests admin.py ScanRequestAdmin.get_search_results() """
+
+    def setUp( self ):
+        self.admin = ScanRequestAdmin( ScanRequest, AdminSite() )
+        self.first = ScanRequest( item_title=u'Über Zeit', item_barcode=u'31236090031116', patron_barcode=u'12345678', patron_name=u'Ann Lee', status=u'in_process' )
+        self.first.save()
+        self.second = ScanRequest( item_title=u'Time and tide', item_barcode=u'31236011112222', patron_barcode=u'99990000', patron_name=u'Bo Lee', status=u'in_process' )
+        self.second.save()
+
+    def search( self, search_term ):
+        ( queryset, use_distinct ) = self.admin.get_search_results( None, ScanRequest.objects.all(), search_term )
+        return sorted( queryset.values_list(u'id', flat=True) )
+
+    def test__text_terms( self ):
+        """ Checks accent- and case-insensitive terms, and that every term must match. """
+        self.assertEqual( [self.first.id], self.search(u'uber') )
+        self.assertEqual( [self.first.id, self.second.id], self.search(u'LEE') )
+        self.assertEqual( [self.second.id], self.search(u'lee tide') )
+        self.assertEqual( [self.second.id], self.search(u'"bo lee"') )
+
+    def test__unmatched_quotes( self ):
+        """ Checks a term with an unmatched quote is searched literally, rather than raising. """
+        self.assertEqual( [], self.search(u'"smith') )
+        self.assertEqual( [], self.search(u"'foo") )
+
+    def test__archive_admin_read_only( self ):
+        """ Checks the archive admin leaves every field read-only. """
+        archive_admin = ScanRequestArchiveAdmin( ScanRequestArchive, AdminSite() )
+        editable = [ field.name for field in ScanRequestArchive._meta.fields if field.editable ]
+        self.assertEqual( [], [ name for name in editable if name not in archive_admin.get_readonly_fields(None) ] )
+
+    def test__barcode_prefixes( self ):
+        """ Checks long digit terms match the start of either barcode, or the id; and short ones the id or text. """
+        self.assertEqual( [self.first.id, self.second.id], self.search(u'312360') )
+        self.assertEqual( [self.first.id], self.search(u'3123609') )
+        self.assertEqual( [self.second.id], self.search(u'999900') )
+        self.assertEqual( [], self.search(u'090031') )  # not a prefix
+        self.assertTrue( self.second.id in self.search(unicode(self.second.id)) )
+        long_id = ScanRequest( id=7654321, item_title=u'later', status=u'in_process' )
+        long_id.save()
+        self.assertEqual( [long_id.id], self.search(u'7654321') )
+        self.assertEqual( [self.first.id], self.search(u'31236090031116') )  # too long for an id
+
+    # end class ScanRequestAdminSearchTest
+
+
 class SpacerTest( TestCase ):
     """ Checks spacer.py Spacer() """
 
@@ -330,12 +490,81 @@ class SpacerTest( TestCase ):
             self.spcr.add_spacer( long_text )
             )
 
+    ## against the pre-rewrite implementation ##
+
+    def test__matches_reference__random_text( self ):
+        """ Checks lines and spacing match the original string-concatenation engine over random text, line-lengths, and spacer characters. """
+        rng = random.Random( 20 )
+        reference = ReferenceSpacer()
+        for i in range( 400 ):
+            limit = rng.choice( [1, 2, 3, 4, 5, 10, 11, 50, 51] )
+            words = [ u'x' * rng.choice([ 1, 2, limit - 2, limit - 1, limit, limit + 1, rng.randint(1, 2 * limit + 1) ]) for j in range( rng.randint(0, 12) ) ]
+            words = [ word if word else u'é' for word in words ]
+            text = rng.choice( [u' ', u'  ', u'\n'] ).join( words ) + rng.choice( [u'', u' '] )
+            spacer_character = rng.choice( [u' ', u'|'] )
+            for spacer in ( self.spcr, reference ):
+                ( spacer.notes_line_length, spacer.spacer_character ) = ( limit, spacer_character )
+            self.assertEqual( reference.convert_string_to_lines(text.strip()), self.spcr.convert_string_to_lines(text.strip()), repr((limit, text)) )
+            self.assertEqual( reference.add_spacer(text), self.spcr.add_spacer(text), repr((limit, text)) )
+
+    def test__cache( self ):
+        """ Checks a memoized result isn't reused after the line-length or spacer character changes, and that the cache stays bounded. """
+        self.assertEqual( u'abc' + u' ' * 47, self.spcr.add_spacer(u'abc') )
+        self.spcr.spacer_character = u'|'
+        self.assertEqual( u'abc ' + u'|' * 45 + u' ', self.spcr.add_spacer(u'abc') )
+        self.spcr.notes_line_length = 10
+        self.assertEqual( u'abc ||||| ', self.spcr.add_spacer(u'abc') )
+        self.spcr.MAX_CACHE_ENTRIES = 5
+        for i in range( 20 ):
+            self.spcr.add_spacer( unicode(i) )
+        self.assertTrue( len(self.spcr.cache) <= 5 )
+
     # end class SpacerTest()
 
 
+class ReferenceSpacer( Spacer ):
+    """ The wrapping engine as it was before the linear-time rewrite; SpacerTest checks the two agree. """
+
+    def add_spacer( self, start_string ):
+        lines = self.convert_string_to_lines( start_string.strip() )
+        full_line = ''
+        for line in lines:
+            full_line = full_line + self.make_spaced_line( line )
+        return full_line
+
+    def convert_string_to_lines( self, start_string ):
+        ( lines, words, line ) = ( [], start_string.split(), '' )
+        for word in words:
+            ( line, lines ) = self.apply_word_logic( word, line, lines )
+        if len(lines) == 0:
+            lines.append( line.strip() )
+        elif lines[-1] != line:
+            if len(line) > 0:
+                lines.append( line.strip() )
+        return lines
+
+    def apply_word_logic( self, word, line, lines ):
+        if len(word) >= self.notes_line_length:
+            lines.append( word )
+            line = ''
+        elif ( len(line) + len(' ') + len(word) + len(' ') <= self.notes_line_length ):
+            line = '{ln} {wd}'.format( ln=line, wd=word ).lstrip()
+        elif ( len(line) + len(' ') + len(word) + len(' ') > self.notes_line_length ):
+            lines.append( line.strip() )
+            line = word
+        return ( line, lines )
+
+
 class MagicBusPrepperTest( TestCase ):
     """ Tests magic_bus.py Prepper() """
 
+    def setUp( self ):
+        self.prepper = Prepper()
+        self.prepper.source_transfer_dir_path = tempfile.mkdtemp()
+
+    def tearDown( self ):
+        shutil.rmtree( self.prepper.source_transfer_dir_path )
+
     def test__make_filename_datestring( self ):
         """ Tests conversion of datetime object to string for filename. """
         dt = datetime.datetime( 2014, 12, 8, 15, 40, 59 )
@@ -344,9 +573,123 @@ class MagicBusPrepperTest( TestCase ):
             prepper.make_filename_datestring( dt )
             )
 
+    def test__make_filename_stem( self ):
+        """ Checks stem format: seconds-datestring, microseconds, request info, random tag. """
+        dt = datetime.datetime( 2014, 12, 8, 15, 40, 59, 123 )
+        stem = self.prepper.make_filename_stem( dt, [42, 43, 44] )
+        self.assertTrue( stem.startswith(u'2014-12-08T15:40:59.000123_r42-3_'), stem )
+        self.assertNotEqual( stem, self.prepper.make_filename_stem(dt, [42, 43, 44]) )
+
+    def test__make_data_files__concurrent_same_second( self ):
+        """ Checks that hundreds of same-second transfers from concurrent threads never share a filename or lose a file. """
+        dt = datetime.datetime( 2014, 12, 8, 15, 40, 59 )
+        results = []
+        def make_files( thread_number ):
+            for i in range( 25 ):
+                request_id = thread_number * 25 + i
+                results.append( self.prepper.make_data_files(dt, u'"%s"' % request_id, request_id=request_id) )
+        threads = [ threading.Thread(target=make_files, args=(n,)) for n in range(20) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        data_filenames = set( [ os.path.basename(data_fp) for (data_fp, count_fp) in results ] )
+        self.assertEqual( 500, len(data_filenames) )
+        self.assertEqual( 500, len([ data_fp for (data_fp, count_fp) in results if os.path.exists(data_fp) and os.path.exists(count_fp) ]) )
+
+    def test__make_batch_data_files( self ):
+        """ Checks one line per request and the matching count. """
+        ( data_filepath, count_filepath ) = self.prepper.make_batch_data_files( datetime.datetime(2014, 12, 8, 15, 40, 59), [u'"a"\n', u'"b"'] )
+        with open( data_filepath ) as f:
+            self.assertEqual( b'"a"\n"b"\n', f.read() )
+        with open( count_filepath ) as f:
+            self.assertEqual( b'2\n', f.read() )
+
+    def test__make_batch_data_files__isolated_staging( self ):
+        """ Checks that each transfer gets its own directory, and that cleanup only removes its own. """
+        dt = datetime.datetime( 2014, 12, 8, 15, 40, 59 )
+        ( data_filepath_a, count_filepath_a ) = self.prepper.make_data_files( dt, u'"a"' )
+        ( data_filepath_b, count_filepath_b ) = self.prepper.make_data_files( dt, u'"b"' )
+        self.assertNotEqual( os.path.dirname(data_filepath_a), os.path.dirname(data_filepath_b) )
+        self.assertEqual( os.path.dirname(data_filepath_a), os.path.dirname(count_filepath_a) )
+        self.prepper.cleanup( data_filepath_a )
+        self.assertFalse( os.path.exists(os.path.dirname(data_filepath_a)) )
+        self.assertTrue( os.path.exists(data_filepath_b) and os.path.exists(count_filepath_b) )
+        self.assertEqual( [], [ fname for fname in os.listdir(os.path.dirname(data_filepath_b)) if fname.endswith(u'.partial') ] )
+
+    def test__remove_stale_staging_dirs( self ):
+        """ Checks that only staging dirs past the max-age are swept. """
+        ( data_filepath, count_filepath ) = self.prepper.make_data_files( datetime.datetime.now(), u'"a"' )
+        old_time = time.time() - self.prepper.staging_max_age_seconds - 60
+        os.utime( os.path.dirname(data_filepath), (old_time, old_time) )
+        self.prepper.last_sweep_time = 0
+        ( fresh_filepath, count_filepath ) = self.prepper.make_data_files( datetime.datetime.now(), u'"b"' )  # sweeps
+        self.assertFalse( os.path.exists(data_filepath) )
+        self.assertTrue( os.path.exists(fresh_filepath) )
+
     # end class MagicBusPrepperTest
 
 
+class FakeTransport( object ):
+    def __init__( self ):
+        self.active = True
+    def is_active( self ):
+        return self.active
+    def send_ignore( self ):
+        pass
+    def set_keepalive( self, seconds ):
+        self.keepalive = seconds
+
+
+class FakeSSH( object ):
+    def __init__( self ):
+        self.transport = FakeTransport()
+    def get_transport( self ):
+        return self.transport
+    def open_sftp( self ):
+        return object()
+    def close( self ):
+        self.transport.active = False
+
+
+class CountingSftpConnection( SftpConnection ):
+    """ Counts handshakes instead of making them. """
+    handshakes = 0
+    def setup_ssh( self ):
+        self.handshakes += 1
+        return FakeSSH()
+
+
+class MagicBusSftpConnectionTest( TestCase ):
+    """ Tests magic_bus.py SftpConnection() """
+
+    def setUp( self ):
+        self.connection = CountingSftpConnection( u'server', u'user', u'pass' )
+
+    def test__get_sftp__reuses_session( self ):
+        """ Checks that a healthy session is handed out again without a new handshake. """
+        sftp = self.connection.get_sftp()
+        self.assertTrue( sftp is self.connection.get_sftp() )
+        self.assertEqual( 1, self.connection.handshakes )
+        self.assertEqual( self.connection.KEEPALIVE_SECONDS, self.connection.ssh.transport.keepalive )
+
+    def test__get_sftp__reconnects_dead_transport( self ):
+        """ Checks transparent reconnect when the transport drops. """
+        self.connection.get_sftp()
+        self.connection.ssh.transport.active = False
+        self.connection.get_sftp()
+        self.assertEqual( 2, self.connection.handshakes )
+
+    def test__get_sftp__reconnects_after_fork( self ):
+        """ Checks that a session inherited from another process isn't reused. """
+        self.connection.get_sftp()
+        self.connection.pid = -1
+        self.connection.get_sftp()
+        self.assertEqual( 2, self.connection.handshakes )
+
+    # end class MagicBusSftpConnectionTest
+
+
 class StatsBuilderTest( TestCase ):
     """ Tests models.py StatsBuilder() """
 
@@ -355,9 +698,13 @@ class StatsBuilderTest( TestCase ):
         ## bad params
         qdict = QueryDict( u'', mutable=True ); qdict.update( {u'start': u'a', u'end': u'b'} )
         self.assertEqual( False, statsbuilder.check_params(qdict, u'server_name') )
-        ## good params
+        ## unparseable dates
         qdict = QueryDict( u'', mutable=True ); qdict.update( {u'start_date': 'a', u'end_date': 'b'} )
+        self.assertEqual( False, statsbuilder.check_params(qdict, u'server_name') )
+        ## good params, unpadded too
+        qdict = QueryDict( u'', mutable=True ); qdict.update( {u'start_date': '2015-1-1', u'end_date': '2015-04-30'} )
         self.assertEqual( True, statsbuilder.check_params(qdict, u'server_name') )
+        self.assertEqual( (datetime.date(2015, 1, 1), datetime.date(2015, 4, 30)), (statsbuilder.day_start, statsbuilder.day_end) )
 
     def test__run_query( self ):
         """ Tests that scanrequest is found and returned. """
@@ -368,4 +715,957 @@ class StatsBuilderTest( TestCase ):
         results = statsbuilder.run_query()
         self.assertEqual( 1, len(results) )
 
+    def test__process_results( self ):
+        """ Checks totals and breakdowns, computed with aggregate queries only. """
+        for ( status, url ) in [ (u'transferred', u'https://search.library.brown.edu/catalog/b1'), (u'transferred', u'https://search.library.brown.edu/catalog/b2'), (u'in_process', u'not_in_request_meta') ]:
+            sr = ScanRequest( item_title=u'foo', status=status, item_source_url=url )
+            sr.save()
+        qdict = QueryDict( u'', mutable=True ); qdict.update( {u'start_date': datetime.date.today(), u'end_date': datetime.date.today()} )
+        statsbuilder.check_params( qdict, u'server_name' )
+        with self.assertNumQueries( 2 ):
+            data = statsbuilder.process_results( statsbuilder.run_query() )
+        self.assertEqual( 3, data['count_request_for_period'] )
+        self.assertEqual( {u'transferred': 2, u'in_process': 1}, data['count_by_status'] )
+        self.assertEqual( {unicode(datetime.date.today()): 3}, data['count_by_day'] )
+        self.assertEqual( {u'search.library.brown.edu': 2, u'unknown': 1}, data['count_by_source_host'] )
+
+    def test__unpadded_dates( self ):
+        """ Checks the stats api answers dates without zero-padding from both the rollups and the rows. """
+        ScanRequest( item_title=u'foo', status=u'in_process', create_datetime=datetime.datetime(2015, 1, 1, 9, 30) ).save()
+        response = self.client.get( reverse('stats_v1_url'), {u'start_date': u'2015-1-1', u'end_date': u'2015-1-2'} )
+        self.assertEqual( 200, response.status_code )
+        self.assertEqual( 1, json.loads(response.content)['response']['count_total'] )
+        statsbuilder.check_params( QueryDict(u'start_date=2015-1-1&end_date=2015-1-1'), u'server_name' )
+        self.assertEqual( 1, statsbuilder.run_query().count() )
+
+    def test__process_results__rollups( self ):
+        """ Checks that closed days are answered from the rollups, kept current by save(). """
+        yesterday = datetime.datetime.now() - datetime.timedelta( days=1 )
+        sr = ScanRequest( item_title=u'foo', status=u'in_process', item_source_url=u'https://search.library.brown.edu/catalog/b1', create_datetime=yesterday )
+        sr.save()
+        sr = ScanRequest.objects.get( id=sr.id )
+        sr.status = u'transferred'
+        sr.save( update_fields=[u'status'] )
+        ScanRequest( item_title=u'bar', status=u'in_process' ).save()
+        ScanRequest.objects.filter( id=sr.id ).update( item_title=u'not read' )  # rollups don't need the row
+        qdict = QueryDict( u'', mutable=True ); qdict.update( {u'start_date': yesterday.date(), u'end_date': datetime.date.today()} )
+        statsbuilder.check_params( qdict, u'server_name' )
+        data = statsbuilder.process_results( statsbuilder.run_query() )
+        self.assertEqual( 2, data['count_request_for_period'] )
+        self.assertEqual( {u'transferred': 1, u'in_process': 1}, data['count_by_status'] )
+        self.assertEqual( {unicode(yesterday.date()): 1, unicode(datetime.date.today()): 1}, data['count_by_day'] )
+
+    def test__rebuild_daily_stats( self ):
+        """ Checks that rebuild() recomputes buckets from rows. """
+        for status in [ u'transferred', u'transferred', u'in_process' ]:
+            ScanRequest( item_title=u'foo', status=status ).save()
+        ScanRequestDailyStats.objects.all().delete()
+        self.assertEqual( 2, ScanRequestDailyStats.rebuild(start_day=datetime.date.today()) )
+        self.assertEqual(
+            [ (u'in_process', 1), (u'transferred', 2) ],
+            list(ScanRequestDailyStats.objects.order_by(u'status').values_list(u'status', u'count')) )
+
+    # end class StatsBuilderTest
+
+
+class FakePrepper( object ):
+    """ Stands in for magic_bus.Prepper so tests don't touch the transfer directory. """
+
+    def __init__( self ):
+        self.batches = []
+        self.request_ids = []
+
+    def make_batch_data_files( self, datetime_object, data_strings, request_ids=() ):
+        self.batches.append( data_strings )
+        self.request_ids.extend( request_ids )
+        return ( '/tmp/transfer_test/REQ-PARSED_test.dat', '/tmp/transfer_test/REQ-PARSED_test.cnt' )
+
+    def make_data_files( self, datetime_object, data_string, request_id=None ):
+        return self.make_batch_data_files( datetime_object, [data_string], [request_id] )
+
+    def cleanup( self, filepath ):
+        pass
+
+
+class FakeSender( object ):
+    """ Stands in for magic_bus.Sender; raises `error` if set. """
+
+    def __init__( self, error=None ):
+        self.error = error
+        self.transferred = []
+
+    def transfer_files( self, data_filepath, count_filepath ):
+        if self.error:
+            raise self.error
+        self.transferred.append( (data_filepath, count_filepath) )
+
+
+class TransferQueueProcessorTest( TestCase ):
+    """ Tests models.py TransferQueueProcessor() """
+
+    def setUp( self ):
+        ( self.original_prepper, self.original_sender ) = ( models.prepper, models.sender )
+        models.prepper = FakePrepper()
+        self.processor = TransferQueueProcessor()
+        self.processor.MAX_ATTEMPTS = 2
+        sr = ScanRequest( item_title=u'foo', status=u'in_process' )
+        sr.save()
+        self.job = TransferJob.objects.create( scan_request=sr )
+
+    def tearDown( self ):
+        ( models.prepper, models.sender ) = ( self.original_prepper, self.original_sender )
+
+    def test__process_due_jobs__success( self ):
+        """ Checks that a good transfer marks both the job and the scan-request. """
+        models.sender = FakeSender()
+        self.assertEqual( 1, self.processor.process_due_jobs() )
+        job = TransferJob.objects.get( id=self.job.id )
+        self.assertEqual( u'done', job.status )
+        self.assertEqual( u'transferred', job.scan_request.status )
+        self.assertEqual( 0, self.processor.process_due_jobs() )  # nothing left
+
+    def test__process_due_jobs__retry_then_fail( self ):
+        """ Checks backoff scheduling, then giving up after MAX_ATTEMPTS. """
+        models.sender = FakeSender( error=Exception(u'annex down') )
+        self.processor.process_due_jobs()
+        job = TransferJob.objects.get( id=self.job.id )
+        self.assertEqual( ( u'pending', 1 ), ( job.status, job.attempts ) )
+        self.assertTrue( job.next_attempt_datetime > datetime.datetime.now() )
+        self.assertEqual( 0, self.processor.process_due_jobs() )  # not due yet
+        TransferJob.objects.filter( id=job.id ).update( next_attempt_datetime=datetime.datetime.now() )
+        self.processor.process_due_jobs()
+        job = TransferJob.objects.get( id=self.job.id )
+        self.assertEqual( ( u'failed', 2 ), ( job.status, job.attempts ) )
+        self.assertEqual( u'in_process', job.scan_request.status )
+
+    def test__claim_job( self ):
+        """ Checks that a job can only be claimed once. """
+        self.assertEqual( True, self.processor.claim_job(self.job.id) )
+        self.assertEqual( False, self.processor.claim_job(self.job.id) )
+
+    def test__process_due_jobs__batches( self ):
+        """ Checks that jobs wait for a full batch, then ship in one file pair. """
+        models.sender = FakeSender()
+        ( self.processor.BATCH_SIZE, self.processor.BATCH_WINDOW_SECONDS ) = ( 3, 3600 )
+        sr = ScanRequest( item_title=u'bar', status=u'in_process' )
+        sr.save()
+        TransferJob.objects.create( scan_request=sr )
+        self.assertEqual( 0, self.processor.process_due_jobs() )  # 2 of 3, window still open
+        sr = ScanRequest( item_title=u'baz', status=u'in_process' )
+        sr.save()
+        TransferJob.objects.create( scan_request=sr )
+        self.assertEqual( 3, self.processor.process_due_jobs() )
+        self.assertEqual( 1, len(models.sender.transferred) )
+        self.assertEqual( 3, len(models.prepper.batches[0]) )
+        self.assertEqual( 3, ScanRequest.objects.filter(status=u'transferred').count() )
+        self.assertEqual( [ (u'transferred', 3) ], list(ScanRequestDailyStats.objects.filter(count__gt=0).values_list(u'status', u'count')) )
+
+    def test__process_due_jobs__batch_window( self ):
+        """ Checks that a partial batch ships once its window elapses. """
+        models.sender = FakeSender()
+        ( self.processor.BATCH_SIZE, self.processor.BATCH_WINDOW_SECONDS ) = ( 3, 60 )
+        self.assertEqual( 0, self.processor.process_due_jobs() )
+        TransferJob.objects.filter( id=self.job.id ).update( create_datetime=datetime.datetime.now() - datetime.timedelta(seconds=61) )
+        self.assertEqual( 1, self.processor.process_due_jobs() )
+
+    def test__calc_backoff( self ):
+        """ Checks exponential growth and cap. """
+        self.processor.BACKOFF_BASE_SECONDS = 30
+        self.processor.BACKOFF_MAX_SECONDS = 100
+        self.assertEqual( [30, 60, 100], [self.processor.calc_backoff(n) for n in (1, 2, 3)] )
+
+    # end class TransferQueueProcessorTest
+
+
+class CountingTitleLookup( TitleLookup ):
+    """ Serves titles from a dict, counting api calls; a bibnum mapped to an exception raises it. """
+
+    def __init__( self, titles ):
+        super( CountingTitleLookup, self ).__init__( u'http://127.0.0.1' )
+        self.titles = titles
+        self.fetch_count = 0
+
+    def fetch_title( self, bibnum ):
+        self.fetch_count += 1
+        title = self.titles.get( bibnum, u'' )
+        if isinstance( title, Exception ):
+            raise title
+        return title
+
+
+class TitleLookupTest( TestCase ):
+    """ Tests availability.py TitleCache() and TitleLookup() """
+
+    def setUp( self ):
+        cache.clear()
+        self.lookup = CountingTitleLookup( {u'b1234567': u'American imago', u'b7654321': Exception(u'timeout')} )
+
+    def test__get_title__cached( self ):
+        """ Checks that a repeated bib is served from cache. """
+        self.assertEqual( u'American imago', self.lookup.get_title(u'b1234567') )
+        self.assertEqual( u'American imago', self.lookup.get_title(u'b1234567') )
+        self.assertEqual( 1, self.lookup.fetch_count )
+
+    def test__get_title__negative_cached( self ):
+        """ Checks that a bib with no title is remembered as a miss. """
+        self.assertEqual( u'', self.lookup.get_title(u'b0000000') )
+        self.assertEqual( u'', self.lookup.get_title(u'b0000000') )
+        self.assertEqual( 1, self.lookup.fetch_count )
+
+    def test__get_title__error_not_cached( self ):
+        """ Checks that api errors return an empty title and are retried next time. """
+        self.assertEqual( u'', self.lookup.get_title(u'b7654321') )
+        self.assertEqual( u'', self.lookup.get_title(u'b7654321') )
+        self.assertEqual( 2, self.lookup.fetch_count )
+
+    def test__local_cache__lru_and_ttl( self ):
+        """ Checks eviction of the least-recently-used entry and expiry. """
+        title_cache = TitleCache()
+        title_cache.MAX_ENTRIES = 2
+        title_cache.set_local( u'a', u'A', 60 )
+        title_cache.set_local( u'b', u'B', 60 )
+        title_cache.get_local( u'a' )  # `b` is now least-recently-used
+        title_cache.set_local( u'c', u'C', 60 )
+        self.assertEqual( [u'A', None, u'C'], [ title_cache.get_local(key) for key in (u'a', u'b', u'c') ] )
+        title_cache.set_local( u'd', u'D', -1 )
+        self.assertEqual( None, title_cache.get_local(u'd') )
+
+    def test__get_title__breaker_skips_api( self ):
+        """ Checks that repeated failures open the breaker, so the api isn't called during the cool-down,
+            while already-cached titles are still served. """
+        self.lookup.breaker.FAILURE_THRESHOLD = 2
+        self.lookup.get_title( u'b1234567' )
+        for i in range( 2 ):
+            self.lookup.get_title( u'b7654321' )
+        self.assertEqual( u'', self.lookup.get_title(u'b7654321') )
+        self.assertEqual( 3, self.lookup.fetch_count )
+        self.assertEqual( u'American imago', self.lookup.get_title(u'b1234567') )
+        self.assertEqual( 3, self.lookup.fetch_count )
+
+    def test__breaker__half_open_trial( self ):
+        """ Checks that after the cool-down one trial call is allowed, and its outcome decides the state. """
+        breaker = CircuitBreaker()
+        ( breaker.FAILURE_THRESHOLD, breaker.COOLDOWN_SECONDS ) = ( 1, 60 )
+        breaker.record_failure()
+        self.assertEqual( False, breaker.allow() )
+        breaker.open_until = 0  # cool-down over
+        self.assertEqual( [True, False], [breaker.allow(), breaker.allow()] )
+        breaker.record_failure()
+        self.assertEqual( u'open', breaker.state )
+        breaker.open_until = 0
+        breaker.allow()
+        breaker.record_success()
+        self.assertEqual( [True, True], [breaker.allow(), breaker.allow()] )
+
+    # end class TitleLookupTest
+
+
+class TryAgainHelperTest( TestCase ):
+    """ Tests models.py TryAgainHelper() """
+
+    def setUp( self ):
+        self.helper = TryAgainHelper()
+        self.helper.PAGE_SIZE = 2
+        self.ids = []
+        for i in range( 5 ):
+            sr = ScanRequest( item_title=u'title %s' % i, status=u'in_process' )
+            sr.save()
+            self.ids.append( sr.id )
+
+    def test__build_data_dct__keyset_pages( self ):
+        """ Checks newest-first pages, the cursor, and that las blobs are left out. """
+        data_dct = self.helper.build_data_dct( RequestFactory().get(u'/easyscan/admin/try_again/') )
+        self.assertEqual( [self.ids[4], self.ids[3]], [ entry['pk'] for entry in data_dct['entries'] ] )
+        self.assertEqual( ( 5, self.ids[3] ), ( data_dct['entries_count'], data_dct['next_cursor'] ) )
+        self.assertFalse( u'las_conversion' in data_dct['entries'][0]['fields'] )
+        data_dct = self.helper.build_data_dct( RequestFactory().get(u'/easyscan/admin/try_again/', {u'before': self.ids[1]}) )
+        self.assertEqual( ( [self.ids[0]], None ), ( [ entry['pk'] for entry in data_dct['entries'] ], data_dct['next_cursor'] ) )
+
+    def test__stream_json( self ):
+        """ Checks that the streamed chunks form the same entries the serializer would have produced, minus las and search-text blobs. """
+        data_dct = self.helper.build_data_dct( RequestFactory().get(u'/easyscan/admin/try_again/') )
+        streamed = json.loads( u''.join(self.helper.stream_json(data_dct)) )
+        expected = json.loads( serializers.serialize(u'json', ScanRequest.objects.filter(id__in=self.ids[3:]).order_by(u'-id')) )
+        for entry in expected:
+            del entry['fields']['las_conversion']
+            del entry['fields']['search_text']
+        self.assertEqual( expected, streamed['entries'] )
+        self.assertEqual( self.ids[3], streamed['next_cursor'] )
+
+    # end class TryAgainHelperTest
+
+
+class TryAgainConfirmationHelperTest( TestCase ):
+    """ Tests models.py TryAgainConfirmationHelper() """
+
+    def setUp( self ):
+        ( self.original_prepper, self.original_sender ) = ( models.prepper, models.sender )
+        models.prepper = FakePrepper()
+        self.helper = TryAgainConfirmationHelper()
+        self.scnrqst = ScanRequest( item_title=u'foo', status=u'in_process' )
+        self.scnrqst.save()
+        self.job = TransferJob.objects.create( scan_request=self.scnrqst, attempts=2, next_attempt_datetime=datetime.datetime.now() + datetime.timedelta(minutes=5) )  # backing off
+
+    def tearDown( self ):
+        ( models.prepper, models.sender ) = ( self.original_prepper, self.original_sender )
+
+    def test__retransfer_data__claims_queued_job( self ):
+        """ Checks a manual resend finishes the queued job, so the queue worker has nothing left to send. """
+        models.sender = FakeSender()
+        self.assertEqual( True, self.helper.retransfer_data(self.scnrqst.id)['success'] )
+        self.assertEqual( 1, len(models.sender.transferred) )
+        self.assertEqual( ( u'done', 3 ), TransferJob.objects.filter(id=self.job.id).values_list(u'status', u'attempts')[0] )
+        self.assertEqual( 0, TransferJob.objects.filter(status=u'pending').count() )
+        self.assertEqual( u'transferred', ScanRequest.objects.get(id=self.scnrqst.id).status )
+        TransferJob.objects.filter( id=self.job.id ).update( next_attempt_datetime=datetime.datetime.now() )
+        self.assertEqual( 0, TransferQueueProcessor().process_due_jobs() )
+        self.assertEqual( 1, len(models.sender.transferred) )
+
+    def test__retransfer_data__without_queued_job( self ):
+        """ Checks a resend with no queued job records a done one. """
+        models.sender = FakeSender()
+        self.job.delete()
+        self.assertEqual( True, self.helper.retransfer_data(self.scnrqst.id)['success'] )
+        self.assertEqual( [u'done'], list(TransferJob.objects.filter(scan_request=self.scnrqst).values_list(u'status', flat=True)) )
+
+    def test__retransfer_data__failure_backs_off( self ):
+        """ Checks a failed resend counts an attempt and leaves the job backing off. """
+        models.sender = FakeSender( error=IOError(u'annex down') )
+        self.assertEqual( False, self.helper.retransfer_data(self.scnrqst.id)['success'] )
+        job = TransferJob.objects.get( id=self.job.id )
+        self.assertEqual( ( u'pending', 3 ), ( job.status, job.attempts ) )
+        self.assertTrue( job.next_attempt_datetime > datetime.datetime.now() )
+        self.assertEqual( u'in_process', ScanRequest.objects.get(id=self.scnrqst.id).status )
+
+    def test__retransfer_data__worker_running( self ):
+        """ Checks nothing is sent while a queue worker has the job. """
+        models.sender = FakeSender()
+        TransferJob.objects.filter( id=self.job.id ).update( status=u'in_process' )
+        self.assertEqual( False, self.helper.retransfer_data(self.scnrqst.id)['success'] )
+        self.assertEqual( [], models.sender.transferred )
+
+    # end class TryAgainConfirmationHelperTest
+
+
+class RecordEncoderTest( TestCase ):
+    """ Tests lib.record_encoder.RecordEncoder() """
+
+    def setUp( self ):
+        self.encoder = RecordEncoder( ScanRequest )
+        for ( i, title ) in enumerate( [u'plain', u'ünicode “quoted”', u''] ):
+            sr = ScanRequest( item_title=title, item_barcode=u'3123%s' % i, status=u'in_process', las_conversion=u'' )
+            sr.save()
+        job = TransferJob( scan_request=ScanRequest.objects.first() )
+        job.save()
+
+    def test__encode_queryset__matches_serializer( self ):
+        """ Checks dicts equal the serialize->json.loads output, field for field. """
+        expected = json.loads( serializers.serialize(u'json', ScanRequest.objects.order_by(u'id')) )
+        self.assertEqual( expected, list(self.encoder.encode_queryset(ScanRequest.objects.order_by(u'id'))) )
+
+    def test__encode_instance__matches_serializer( self ):
+        """ Checks jsonify() output, including the create_datetime string. """
+        sr = ScanRequest.objects.first()
+        expected = json.loads( serializers.serialize(u'json', [sr]) )[0]
+        self.assertEqual( expected, sr.jsonify() )
+
+    def test__foreign_key( self ):
+        """ Checks foreign-keys come out under the field name as the raw id, as the serializer writes them. """
+        encoder = RecordEncoder( TransferJob )
+        expected = json.loads( serializers.serialize(u'json', TransferJob.objects.all()) )
+        self.assertEqual( expected, list(encoder.encode_queryset(TransferJob.objects.all())) )
+
+    def test__stream_json_list( self ):
+        """ Checks streamed chunks join into valid json, including the empty list. """
+        records = list( self.encoder.encode_queryset(ScanRequest.objects.order_by(u'id')) )
+        self.assertEqual( records, json.loads(u''.join(self.encoder.stream_json_list(records))) )
+        self.assertEqual( [], json.loads(u''.join(self.encoder.stream_json_list([]))) )
+
+    # end class RecordEncoderTest
+
+
+@unittest.skipUnless( connection.vendor == 'sqlite', 'query plans are checked with sqlite EXPLAIN QUERY PLAN' )
+class ScanRequestQueryPlanTest( TestCase ):
+    """ Checks that hot ScanRequest queries are answered from an index rather than a table scan. """
+
+    def setUp( self ):
+        for i in range( 5 ):
+            ScanRequest( item_title=u'title %s' % i, item_barcode=u'3123%s' % i, patron_barcode=u'1234%s' % i, status=u'in_process' ).save()
+
+    def explain( self, sql, params=() ):
+        """ Returns sqlite's query-plan detail strings for the statement. """
+        cursor = connection.cursor()
+        cursor.execute( u'EXPLAIN QUERY PLAN %s' % sql, params )
+        return [ row[-1] for row in cursor.fetchall() ]
+
+    def assertCapturedQueriesIndexed( self, func ):
+        """ Runs func, then checks every captured statement reading scan-requests uses an index or the primary key. """
+        with CaptureQueriesContext( connection ) as context:
+            func()
+        statements = [ query['sql'] for query in context.captured_queries if u'"easyscan_app_scanrequest"' in query['sql'] ]
+        self.assertTrue( statements )
+        for sql in statements:
+            for detail in self.explain( sql ):
+                if u'easyscan_app_scanrequest ' in detail + u' ':
+                    self.assertTrue( u' USING ' in detail, u'`%s` for `%s`' % (detail, sql) )
+
+    def assertQuerysetUsesIndex( self, queryset, index_name ):
+        """ Checks the queryset's plan names the index. """
+        ( sql, params ) = queryset.query.sql_with_params()
+        self.assertTrue( any(index_name in detail for detail in self.explain(sql, params)), self.explain(sql, params) )
+
+    def test__stats_queries( self ):
+        """ Checks the stats-api's date-range aggregate. """
+        builder = StatsBuilder()
+        builder.check_params( {u'start_date': u'2015-04-01', u'end_date': unicode(datetime.date.today())}, u'server_name' )
+        self.assertCapturedQueriesIndexed( lambda: builder.process_results(builder.run_query()) )
+
+    def test__try_again_queries( self ):
+        """ Checks the try-again window count and a cursor page; the first page walks the primary key newest-first and stops at the page size. """
+        helper = TryAgainHelper()
+        helper.PAGE_SIZE = 2
+        last_id = ScanRequest.objects.order_by( u'-id' ).values_list( u'id', flat=True )[0]
+        self.assertCapturedQueriesIndexed( lambda: helper.build_data_dct(RequestFactory().get(u'/easyscan/admin/try_again/', {u'before': last_id})) )
+
+    def test__status_date_range( self ):
+        """ Checks one status over a date range. """
+        self.assertQuerysetUsesIndex(
+            ScanRequest.objects.filter(status=u'in_process', create_datetime__gte=datetime.date.today()), u'scanrequest_status_created' )
+
+    def test__date_range( self ):
+        """ Checks a plain date range, as the admin date-hierarchy filters. """
+        self.assertQuerysetUsesIndex( ScanRequest.objects.filter(create_datetime__gte=datetime.date.today()), u'scanrequest_created_status' )
+
+    def test__barcode_lookups( self ):
+        """ Checks staff lookups by item and patron barcode. """
+        self.assertQuerysetUsesIndex( ScanRequest.objects.filter(item_barcode=u'31230'), u'scanrequest_item_barcode' )
+        self.assertQuerysetUsesIndex( ScanRequest.objects.filter(patron_barcode=u'12340'), u'scanrequest_patron_barcode' )
+
+    def test__admin_barcode_search( self ):
+        """ Checks an admin barcode-prefix search goes through both barcode indexes. """
+        ( queryset, use_distinct ) = ScanRequestAdmin( ScanRequest, AdminSite() ).get_search_results( None, ScanRequest.objects.all(), u'312300' )
+        self.assertQuerysetUsesIndex( queryset, u'scanrequest_item_barcode' )
+        self.assertQuerysetUsesIndex( queryset, u'scanrequest_patron_barcode' )
+
+    # end class ScanRequestQueryPlanTest
+
+
+class ScanRequestArchiveTest( TestCase ):
+    """ Tests models.py ScanRequestArchive.archive_older_than() and the archive_scan_requests command. """
+
+    def setUp( self ):
+        old = datetime.datetime.now() - datetime.timedelta( days=400 )
+        self.old_ids = []
+        for i in range( 5 ):
+            sr = ScanRequest( item_title=u'Über %s' % i, item_barcode=u'3123600000%s' % i, status=u'transferred', create_datetime=old )
+            sr.save()
+            self.old_ids.append( sr.id )
+        TransferJob( scan_request_id=self.old_ids[0], status=u'pending' ).save()
+        TransferJob( scan_request_id=self.old_ids[1], status=u'done' ).save()
+        self.new = ScanRequest( item_title=u'recent', status=u'in_process' )
+        self.new.save()
+
+    def test__archive_older_than( self ):
+        """ Checks old requests move in chunks with ids and fields intact, leaving recent ones and ones with an in-flight transfer. """
+        expected = ScanRequest.objects.get( id=self.old_ids[2] )
+        moved = ScanRequestArchive.archive_older_than( datetime.datetime.now() - datetime.timedelta(days=365), chunk_size=2 )
+        self.assertEqual( 4, moved )
+        self.assertEqual( [self.old_ids[0], self.new.id], sorted(ScanRequest.objects.values_list(u'id', flat=True)) )
+        self.assertEqual( sorted(self.old_ids[1:]), sorted(ScanRequestArchive.objects.values_list(u'id', flat=True)) )
+        archived = ScanRequestArchive.objects.get( id=self.old_ids[2] )
+        for field_name in [ u'item_title', u'item_barcode', u'status', u'create_datetime', u'las_conversion', u'search_text' ]:
+            self.assertEqual( getattr(expected, field_name), getattr(archived, field_name) )
+        self.assertEqual( [u'pending'], list(TransferJob.objects.values_list(u'status', flat=True)) )
+
+    def test__stats_read_through( self ):
+        """ Checks rebuilt rollups still count archived requests. """
+        call_command( u'archive_scan_requests', days=365, stdout=open(os.devnull, u'w') )
+        ScanRequestDailyStats.objects.all().delete()
+        ScanRequestDailyStats.rebuild()
+        self.assertEqual( 6, sum(ScanRequestDailyStats.objects.values_list(u'count', flat=True)) )
+
+    def test__admin_search( self ):
+        """ Checks the archive admin searches like the live one. """
+        ScanRequestArchive.archive_older_than( datetime.datetime.now() - datetime.timedelta(days=365) )
+        archive_admin = ScanRequestArchiveAdmin( ScanRequestArchive, AdminSite() )
+        ( queryset, use_distinct ) = archive_admin.get_search_results( None, ScanRequestArchive.objects.all(), u'"uber 3"' )
+        self.assertEqual( [self.old_ids[3]], list(queryset.values_list(u'id', flat=True)) )
+        ( queryset, use_distinct ) = archive_admin.get_search_results( None, ScanRequestArchive.objects.all(), u'3123600000' )
+        self.assertEqual( 4, queryset.count() )
+
+    # end class ScanRequestArchiveTest
+
+
+class BulkResubmitterTest( TestCase ):
+    """ Tests models.py BulkResubmitter() """
+
+    def setUp( self ):
+        ( self.original_prepper, self.original_sender ) = ( models.prepper, models.sender )
+        models.prepper = FakePrepper()
+        self.scnrqsts = {}
+        for ( key, status ) in [ (u'plain', u'in_process'), (u'queued', u'in_process'), (u'running', u'in_process'), (u'done', u'transferred') ]:
+            self.scnrqsts[key] = ScanRequest( item_title=key, status=status )
+            self.scnrqsts[key].save()
+        self.queued_job = TransferJob( scan_request=self.scnrqsts[u'queued'], status=u'pending', attempts=3 )
+        self.queued_job.save()
+        TransferJob( scan_request=self.scnrqsts[u'running'], status=u'in_process' ).save()
+        self.resubmitter = BulkResubmitter()
+        self.resubmitter.BATCH_SIZE = 1
+
+    def tearDown( self ):
+        ( models.prepper, models.sender ) = ( self.original_prepper, self.original_sender )
+
+    def test__resubmit( self ):
+        """ Checks non-transferred requests are sent in batches with rebuilt las lines, skipping one a worker is running, with outcomes bulk-recorded. """
+        models.sender = FakeSender()
+        expected_line = ScanRequest.objects.get( id=self.scnrqsts[u'plain'].id ).las_conversion
+        ScanRequest.objects.filter( id=self.scnrqsts[u'plain'].id ).update( las_conversion=u'stale' )
+        today = datetime.date.today()
+        result = self.resubmitter.resubmit( self.resubmitter.select_requests(today, today) )
+        self.assertEqual( {u'selected': 2, u'transferred': 2, u'failed': 0}, result )
+        self.assertEqual( 2, len(models.sender.transferred) )
+        self.assertEqual( [expected_line], models.prepper.batches[0] )
+        statuses = dict( ScanRequest.objects.values_list(u'item_title', u'status') )
+        self.assertEqual( {u'plain': u'transferred', u'queued': u'transferred', u'running': u'in_process', u'done': u'transferred'}, statuses )
+        self.assertEqual( ( u'done', 4 ), TransferJob.objects.filter(id=self.queued_job.id).values_list(u'status', u'attempts')[0] )
+        plain = ScanRequest.objects.get( id=self.scnrqsts[u'plain'].id )
+        self.assertTrue( u'bulk resubmit completed' in plain.admin_notes )
+        self.assertEqual( models.search_text_maker.make_search_text(plain), plain.search_text )  # as save() would build it
+        self.assertEqual( 3, ScanRequestDailyStats.objects.get(day=today, status=u'transferred').count )
+
+    def test__resubmit__failure( self ):
+        """ Checks a failed send leaves statuses alone, notes the error, and returns claimed jobs to the queue. """
+        models.sender = FakeSender( error=IOError(u'annex down') )
+        result = self.resubmitter.resubmit( ScanRequest.objects.all() )
+        self.assertEqual( {u'selected': 2, u'transferred': 0, u'failed': 2}, result )
+        self.assertEqual( u'in_process', ScanRequest.objects.get(id=self.scnrqsts[u'plain'].id).status )
+        self.assertTrue( u'annex down' in ScanRequest.objects.get(id=self.scnrqsts[u'plain'].id).admin_notes )
+        job = TransferJob.objects.get( id=self.queued_job.id )
+        self.assertEqual( ( u'pending', 4 ), ( job.status, job.attempts ) )
+        self.assertTrue( u'annex down' in job.last_error )
+
+    def test__resubmit__failure_at_max_attempts( self ):
+        """ Checks a failed bulk attempt counts toward the queue's retry limit. """
+        models.sender = FakeSender( error=IOError(u'annex down') )
+        TransferJob.objects.filter( id=self.queued_job.id ).update( attempts=TransferQueueProcessor().MAX_ATTEMPTS - 1 )
+        self.resubmitter.resubmit( ScanRequest.objects.all() )
+        self.assertEqual( u'failed', TransferJob.objects.get(id=self.queued_job.id).status )
+
+    def test__resubmit__stale_requeue_between_batches( self ):
+        """ Checks that a queue worker requeueing stale jobs mid-run, then draining the queue, sends nothing the resubmit also sends. """
+        processor = TransferQueueProcessor()
+        sender = FakeSender()
+        def transfer_then_run_worker( data_filepath, count_filepath ):
+            FakeSender.transfer_files( sender, data_filepath, count_filepath )
+            if len( sender.transferred ) == 1:  # after the first bulk batch; the worker's own sends land here too
+                TransferJob.objects.filter( status=u'in_process' ).update( modify_datetime=datetime.datetime.now() - datetime.timedelta(seconds=processor.STALE_SECONDS + 1) )
+                processor.process_due_jobs()
+        sender.transfer_files = transfer_then_run_worker
+        models.sender = sender
+        self.resubmitter.resubmit( ScanRequest.objects.all() )
+        self.assertEqual( sorted(set(models.prepper.request_ids)), sorted(models.prepper.request_ids) )
+        self.assertTrue( self.scnrqsts[u'queued'].id in models.prepper.request_ids )
+        self.assertEqual( 0, TransferJob.objects.filter(status__in=[u'pending', u'in_process']).count() )
+
+    # end class BulkResubmitterTest
+
+
+class FlakyEmailBackend( EmailBackend ):
+    """ Locmem backend that counts connections opened, refuses any message to `bounce@` addresses, and silently drops any to `drop@` ones. """
+    opened = 0
+
+    def open( self ):
+        FlakyEmailBackend.opened += 1
+        return True
+
+    def send_messages( self, messages ):
+        if [ address for message in messages for address in message.to if address.startswith(u'bounce@') ]:
+            raise IOError( u'relay refused' )
+        if [ address for message in messages for address in message.to if address.startswith(u'drop@') ]:
+            return 0
+        return super( FlakyEmailBackend, self ).send_messages( messages )
+
+
+@override_settings( EMAIL_BACKEND='easyscan_app.tests.FlakyEmailBackend' )
+class OutboxEmailTest( TestCase ):
+    """ Tests models.py OutboxEmail() and OutboxProcessor() """
+
+    def setUp( self ):
+        FlakyEmailBackend.opened = 0
+        self.processor = OutboxProcessor()
+        self.processor.MAX_ATTEMPTS = 2
+
+    def test__email_patron_only_queues( self ):
+        """ Checks the request-cycle inserts a row and sends nothing. """
+        sr = ScanRequest( item_title=u'foo', patron_email=u'a@a.edu', status=u'in_process' )
+        sr.save()
+        RequestViewPostHelper().email_patron( sr )
+        self.assertEqual( 0, len(mail.outbox) )
+        email = OutboxEmail.objects.get()
+        self.assertEqual( ( [u'a@a.edu'], u'pending' ), ( json.loads(email.to_json), email.status ) )
+
+    def test__process_due_emails( self ):
+        """ Checks due emails go out over one connection, and a failing one is retried later, then dead-lettered. """
+        for address in [ u'a@a.edu', u'bounce@a.edu', u'b@a.edu' ]:
+            OutboxEmail.enqueue( u'subject', u'body', u'from@a.edu', [address], reply_to=u'reply@a.edu' )
+        self.assertEqual( 2, self.processor.process_due_emails() )
+        self.assertEqual( ( 1, 2 ), ( FlakyEmailBackend.opened, len(mail.outbox) ) )
+        self.assertEqual( u'reply@a.edu', mail.outbox[0].extra_headers['Reply-To'] )
+        bounced = OutboxEmail.objects.get( status=u'pending' )
+        self.assertEqual( 1, bounced.attempts )
+        self.assertTrue( bounced.next_attempt_datetime > datetime.datetime.now() )
+        self.assertEqual( 0, self.processor.process_due_emails() )  # not due yet
+        OutboxEmail.objects.filter( id=bounced.id ).update( next_attempt_datetime=datetime.datetime.now() )
+        self.assertEqual( 0, self.processor.process_due_emails() )
+        self.assertEqual( ( u'dead', 2 ), OutboxEmail.objects.filter(id=bounced.id).values_list(u'status', u'attempts')[0] )
+
+    def test__no_recipients_not_sent( self ):
+        """ Checks an email with no recipients is dead-lettered with an admin alert, not counted as sent. """
+        email = OutboxEmail.enqueue( u'subject', u'body', u'from@a.edu', [] )
+        self.assertEqual( 0, self.processor.process_due_emails() )
+        self.assertEqual( 0, len(mail.outbox) )
+        self.assertEqual( ( u'dead', u'no recipients' ), OutboxEmail.objects.filter(id=email.id).values_list(u'status', u'last_error')[0] )
+        self.assertTrue( u'no recipients' in AdminAlert.objects.get().message )
+
+    def test__nothing_sent_not_counted( self ):
+        """ Checks an email the backend reports as not sent is dead-lettered with an admin alert. """
+        email = OutboxEmail.enqueue( u'subject', u'body', u'from@a.edu', [u'drop@a.edu'] )
+        self.assertEqual( 0, self.processor.process_due_emails() )
+        self.assertEqual( u'dead', OutboxEmail.objects.get(id=email.id).status )
+        self.assertEqual( 1, AdminAlert.objects.count() )
+
+    # end class OutboxEmailTest
+
+
+@override_settings( EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend' )
+class AdminAlertTest( TestCase ):
+    """ Tests models.py AdminAlert() and AlertDigester() """
+
+    def test__errors_coalesced( self ):
+        """ Checks repeats of an error cost an id lookup and one update each, and land on one alert, keeping the affected ids. """
+        helper = RequestViewPostHelper()
+        helper.email_admins_on_error( u'annex down', [1] )
+        with CaptureQueriesContext( connection ) as context:
+            helper.email_admins_on_error( u'annex down', [2, 3] )
+        self.assertEqual( 2, len(context.captured_queries) )
+        helper.email_admins_on_error( u'disk full' )
+        self.assertEqual( 2, AdminAlert.objects.count() )
+        alert = AdminAlert.objects.get( message__contains=u'annex down' )
+        self.assertEqual( ( 2, [u'1', u'2', u'3'] ), ( alert.count, [ x for x in alert.scan_request_ids.split(u',') if x ] ) )
+        self.assertEqual( 0, OutboxEmail.objects.count() )
+
+    def test__duplicate_alerts_counted_once( self ):
+        """ Checks that, after a racing first insert, a repeat counts only on the lowest-id open alert. """
+        AdminAlert.record( u'annex down', [1] )
+        fingerprint = AdminAlert.objects.get().fingerprint
+        AdminAlert.objects.create( fingerprint=fingerprint, message=u'annex down', scan_request_ids=u',2' )
+        AdminAlert.record( u'annex down', [3] )
+        self.assertEqual( [ (2, u',1,3'), (1, u',2') ], list(AdminAlert.objects.order_by(u'id').values_list(u'count', u'scan_request_ids')) )
+
+    def test__flush_due( self ):
+        """ Checks nothing goes out inside the window, then one digest with counts and ids, merging duplicate open alerts. """
+        digester = AlertDigester()
+        AdminAlert.record( u'annex down', [1] )
+        AdminAlert.record( u'annex down', [2] )
+        AdminAlert.objects.create( fingerprint=AdminAlert.objects.get().fingerprint, message=u'annex down', scan_request_ids=u',3' )  # as from a concurrent first record()
+        AdminAlert.record( u'disk full' )
+        self.assertEqual( 0, digester.flush_due() )
+        AdminAlert.objects.update( first_datetime=datetime.datetime.now() - datetime.timedelta(seconds=digester.WINDOW_SECONDS + 1) )
+        self.assertEqual( 3, digester.flush_due() )
+        self.assertEqual( 0, digester.flush_due() )
+        email = OutboxEmail.objects.get()
+        self.assertEqual( u'easyscan errors (4)', email.subject )
+        self.assertTrue( u'3 time(s)' in email.body and u'scan_request ids: 1, 2, 3' in email.body )
+        self.assertTrue( u'disk full\nscan_request ids: none recorded' in email.body )
+        OutboxProcessor().process_due_emails()
+        self.assertEqual( [u'easyscan errors (4)'], [ message.subject for message in mail.outbox ] )
+
+    # end class AdminAlertTest
+
+
+class SessionStoreTest( TestCase ):
+    """ Tests lib.session_store.SessionStore() """
+
+    def setUp( self ):
+        session = SessionStore()
+        session['authz_info'] = { 'authorized': False }
+        session['try_again_page_accessed'] = True
+        session.save()
+        self.session = SessionStore( session_key=session.session_key )
+
+    def test__unchanged_values_not_modified( self ):
+        """ Checks reading, and re-setting values to what they already are, doesn't call for a write. """
+        self.assertEqual( False, self.session['authz_info']['authorized'] )
+        self.session['try_again_page_accessed'] = True
+        self.session['authz_info']['authorized'] = False
+        self.assertFalse( self.session.modified )
+
+    def test__nested_change_saved( self ):
+        """ Checks an in-place change to a nested dict is detected and saved. """
+        self.session['authz_info']['authorized'] = True
+        self.assertTrue( self.session.modified )
+        self.session.save()
+        self.assertEqual( True, SessionStore(session_key=self.session.session_key)['authz_info']['authorized'] )
+
+    def test__workers_with_separate_caches( self ):
+        """ Checks that, without a shared cache, a session changed by one worker is read fresh by another that loaded it earlier. """
+        self.assertEqual( 'django.contrib.sessions.backends.db', session_store.DEFAULT_BASE_ENGINE )  # EZSCAN__CACHES_JSON isn't set for tests
+        caches_setting = {
+            'default': { 'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default' },
+            'worker_a': { 'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'worker_a' },
+            'worker_b': { 'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'worker_b' } }
+        with override_settings( CACHES=caches_setting ):
+            with override_settings( SESSION_CACHE_ALIAS='worker_a' ):
+                self.assertEqual( False, SessionStore(session_key=self.session.session_key)['authz_info']['authorized'] )
+            with override_settings( SESSION_CACHE_ALIAS='worker_b' ):
+                worker_b = SessionStore( session_key=self.session.session_key )
+                worker_b['authz_info']['authorized'] = True
+                worker_b['user_info'] = { 'name': 'Ann' }
+                worker_b.save()
+            with override_settings( SESSION_CACHE_ALIAS='worker_a' ):
+                worker_a = SessionStore( session_key=self.session.session_key )
+                self.assertEqual( ( True, { 'name': 'Ann' } ), ( worker_a['authz_info']['authorized'], worker_a.get('user_info') ) )
+
+    def test__repeat_request_not_written( self ):
+        """ Checks that, through the session middleware, a repeat try-again GET leaves the session row alone, and a change is written. """
+        for ( title, expected_writes ) in [ (None, 0), (u'new title', 1) ]:
+            request = RequestFactory().get( u'/easyscan/admin/try_again/' )
+            request.COOKIES[settings.SESSION_COOKIE_NAME] = self.session.session_key
+            middleware = SessionMiddleware()
+            middleware.process_request( request )
+            with CaptureQueriesContext( connection ) as context:
+                response = TryAgainHelper().build_response( request )
+                if title:
+                    request.session['item_info'] = { 'title': title }
+                middleware.process_response( request, response )
+            writes = [ query for query in context.captured_queries if u'django_session' in query['sql'] and not query['sql'].startswith(u'SELECT') ]
+            self.assertEqual( expected_writes, len(writes) )
+
+    # end class SessionStoreTest
+
+
+class RequestTimingTest( TestCase ):
+    """ Tests lib.request_timer.RequestTimingMiddleware() and phase() """
+
+    def setUp( self ):
+        self.records = []
+        self.handler = logging.Handler()
+        self.handler.emit = self.records.append
+        self.timer_log = logging.getLogger( 'easyscan_app.lib.request_timer' )
+        self.timer_log.addHandler( self.handler )
+        self.timer_log.setLevel( logging.DEBUG )
+        self.middleware = RequestTimingMiddleware()
+        self.middleware.TIME_DB = True
+
+    def tearDown( self ):
+        self.timer_log.removeHandler( self.handler )
+
+    def run_request( self ):
+        """ Runs a fake view -- one query, one availability-api phase -- through the middleware. """
+        request = RequestFactory().get( '/easyscan/request/' )
+        self.middleware.process_request( request )
+        ScanRequest.objects.count()
+        with phase( 'availability_api' ):
+            time.sleep( 0.01 )
+        return self.middleware.process_response( request, models.HttpResponse('ok') )
+
+    def test__header_and_log_line( self ):
+        """ Checks the Server-Timing header's phases, and the one info line. """
+        response = self.run_request()
+        names = [ metric.split(';')[0] for metric in response['Server-Timing'].split(', ') ]
+        self.assertEqual( ['availability_api', 'db', 'total'], names )
+        self.assertEqual( [logging.INFO], [ record.levelno for record in self.records ] )
+        data = json.loads( self.records[0].getMessage().split(' ', 1)[1] )
+        self.assertEqual( '/easyscan/request/', data['path'] )
+        self.assertTrue( data['phases_ms']['availability_api'] >= 10 )
+        self.assertFalse( connection.force_debug_cursor )
+
+    def test__slow_request_breakdown( self ):
+        """ Checks a request over the threshold logs a warning with counts and queries. """
+        self.middleware.SLOW_REQUEST_MS = 0
+        self.run_request()
+        self.assertEqual( [logging.WARNING], [ record.levelno for record in self.records ] )
+        data = json.loads( self.records[0].getMessage().split(' ', 1)[1] )
+        self.assertEqual( { 'availability_api': 1, 'db': 1 }, data['phase_counts'] )
+        self.assertTrue( 'easyscan_app_scanrequest' in data['slowest_queries'][0]['sql'] )
+
+    def test__db_timing_off_by_default( self ):
+        """ Checks that, unless opted in, the debug cursor stays off and no db phase is reported. """
+        self.middleware = RequestTimingMiddleware()
+        request = RequestFactory().get( '/easyscan/request/' )
+        self.middleware.process_request( request )
+        self.assertFalse( connection.force_debug_cursor )
+        ScanRequest.objects.count()
+        response = self.middleware.process_response( request, models.HttpResponse('ok') )
+        self.assertEqual( 'total', response['Server-Timing'].split(';')[0] )
+
+    def test__phase_outside_request( self ):
+        """ Checks phase() records nothing when no request is being timed, eg in a queue worker. """
+        timer_state.timings = None
+        with phase( 'sftp' ):
+            pass
+        self.assertEqual( None, timer_state.timings )
+
+    # end class RequestTimingTest
+
+
+class MetricsTest( TestCase ):
+    """ Tests lib.metrics.MetricsStore() and models.MetricsHelper() """
+
+    def setUp( self ):
+        self.metrics_dir = tempfile.mkdtemp()
+        self.store = MetricsStore()
+        self.store.DIR = self.metrics_dir
+        self.original_store = models.metrics
+        models.metrics = self.store
+
+    def tearDown( self ):
+        models.metrics = self.original_store
+        shutil.rmtree( self.metrics_dir )
+
+    def test__histogram_buckets_cumulative( self ):
+        """ Checks an observation lands in every bucket at or above it, plus count and sum. """
+        self.store.observe( 'easyscan_sftp_put_seconds', 0.3 )
+        samples = self.store.samples
+        self.assertEqual( None, samples.get('easyscan_sftp_put_seconds_bucket{le="0.25"}') )
+        self.assertEqual( 1, samples['easyscan_sftp_put_seconds_bucket{le="0.5"}'] )
+        self.assertEqual( 1, samples['easyscan_sftp_put_seconds_bucket{le="30.0"}'] )
+        self.assertEqual( 1, samples['easyscan_sftp_put_seconds_bucket{le="+Inf"}'] )
+        self.assertEqual( 1, samples['easyscan_sftp_put_seconds_count'] )
+        self.assertRaises( KeyError, self.store.inc, 'easyscan_unknown_total' )
+
+    def test__render_sums_processes( self ):
+        """ Checks render() adds another worker's flushed file to this process's numbers. """
+        self.store.inc( 'easyscan_las_transfers_total', {'source': 'queue', 'outcome': 'success'}, 3 )
+        with open( os.path.join(self.metrics_dir, 'metrics_999999.json'), 'w' ) as f:
+            json.dump( { 'easyscan_las_transfers_total{outcome="success",source="queue"}': 2, 'easyscan_submissions_total': 4 }, f )
+        lines = self.store.render().splitlines()
+        self.assertTrue( 'easyscan_las_transfers_total{outcome="success",source="queue"} 5' in lines )
+        self.assertTrue( 'easyscan_submissions_total 4' in lines )
+        self.assertTrue( '# TYPE easyscan_smtp_send_seconds histogram' in lines )
+
+    def test__pid_file_reloaded( self ):
+        """ Checks a fresh store for the same pid -- eg a restarted worker reusing it -- keeps counting from the file. """
+        self.store.inc( 'easyscan_submissions_total' )
+        self.store.flush()
+        store = MetricsStore()
+        store.DIR = self.metrics_dir
+        store.inc( 'easyscan_submissions_total' )
+        self.assertEqual( 2, store.samples['easyscan_submissions_total'] )
+
+    def test__helper_response( self ):
+        """ Checks the scrape includes zero-filled queue depths, and the address check. """
+        scnrqst = ScanRequest.objects.create( item_title='t', status='in_process' )
+        TransferJob.objects.create( scan_request=scnrqst )
+        helper = MetricsHelper()
+        lines = helper.build_response().content.decode( 'utf-8' ).splitlines()
+        self.assertTrue( 'easyscan_transfer_queue_depth{status="pending"} 1' in lines )
+        self.assertTrue( 'easyscan_email_outbox_depth{status="sending"} 0' in lines )
+        self.assertFalse( helper.check_ip(RequestFactory().get('/easyscan/metrics/', REMOTE_ADDR='10.1.2.3')) )
+
+    # end class MetricsTest
+
+
+class VersionHelperTest( TestCase ):
+    """ Tests lib.version_helper """
+
+    def setUp( self ):
+        self.base_dir = tempfile.mkdtemp()
+        self.git_path = os.path.join( self.base_dir, '.git' )
+        os.makedirs( os.path.join(self.git_path, 'refs', 'heads') )
+        self.sha = 'a' * 40
+        version_helper.cache.clear()
+
+    def tearDown( self ):
+        shutil.rmtree( self.base_dir )
+        version_helper.cache.clear()
+
+    def write( self, relative_path, text ):
+        with open( os.path.join(self.git_path, relative_path), 'w' ) as f:
+            f.write( text )
+
+    def test__loose_and_packed_refs( self ):
+        """ Checks a branch is resolved from its loose ref, else from packed-refs. """
+        self.write( 'HEAD', 'ref: refs/heads/feature/x\n' )
+        self.write( 'packed-refs', '# pack-refs with: peeled fully-peeled sorted\n%s refs/heads/feature/x\n^%s\n' % (self.sha, 'b' * 40) )
+        self.assertEqual( {'branch': 'feature/x', 'commit': self.sha}, version_helper.read_git_dir(self.git_path) )
+        self.write( 'HEAD', 'ref: refs/heads/master\n' )
+        self.write( 'refs/heads/master', '%s\n' % ('c' * 40) )
+        self.assertEqual( {'branch': 'master', 'commit': 'c' * 40}, version_helper.read_git_dir(self.git_path) )
+
+    def test__detached_head_and_missing_checkout( self ):
+        """ Checks a detached HEAD, and that a missing checkout returns None for the fallback file to answer. """
+        self.write( 'HEAD', '%s\n' % self.sha )
+        self.assertEqual( {'branch': '(HEAD detached)', 'commit': self.sha}, version_helper.read_git_dir(self.git_path) )
+        self.assertEqual( None, version_helper.read_git_dir(os.path.join(self.git_path, 'nothing_here')) )
+        self.write( 'version.json', json.dumps({'branch': 'release', 'commit': self.sha}) )
+        self.assertEqual( {'branch': 'release', 'commit': self.sha}, version_helper.read_version_file(os.path.join(self.git_path, 'version.json')) )
+
+    def test__version_view_cached( self ):
+        """ Checks the view reports the checkout's branch and commit, and later calls reuse the cached info without chdir. """
+        self.write( 'HEAD', 'ref: refs/heads/master\n' )
+        self.write( 'refs/heads/master', '%s\n' % self.sha )
+        cwd = os.getcwd()
+        with override_settings( BASE_DIR=self.base_dir ):
+            response = self.client.get( reverse('version_url') )
+        self.assertEqual( 'master %s' % self.sha, json.loads(response.content)['response']['version'] )
+        self.write( 'refs/heads/master', '%s\n' % ('b' * 40) )
+        with override_settings( BASE_DIR=self.base_dir ):
+            self.assertEqual( 'commit %s' % self.sha, version_helper.get_commit() )
+        self.assertEqual( cwd, os.getcwd() )
+
+    # end class VersionHelperTest
+
+
+class DevJsHelperTest( TestCase ):
+    """ Tests models.DevJsHelper() and the dev javascript views. """
+
+    def test__rewrite_unchanged( self ):
+        """ Checks the served javascript is the same rewrite the views always made. """
+        js_path = os.path.join( DevJsHelper().JS_DIR_PATH, 'josiah_easyscan.js' )
+        with open( js_path ) as f:
+            expected = f.read().decode( 'utf-8' )
+        expected = expected.replace( 'library.brown.edu/easyscan/josiah_request_item.js', 'testserver/easyscan/dev_josiah_request_item.js' ).replace( 'library.brown.edu', 'testserver' ).replace( 'https', 'http' )
+        response = self.client.get( reverse('easyscan_js_url') )
+        self.assertEqual( expected, response.content.decode('utf-8') )
+        self.assertTrue( response.has_header('ETag') and response.has_header('Last-Modified') )
+
+    def test__conditional_get_and_gzip( self ):
+        """ Checks a matching ETag gets a 304, and gzip gets its own ETag and decompresses to the plain body. """
+        plain = self.client.get( reverse('request_item_js_url') )
+        self.assertEqual( 304, self.client.get( reverse('request_item_js_url'), HTTP_IF_NONE_MATCH=plain['ETag'] ).status_code )
+        self.assertEqual( 304, self.client.get( reverse('request_item_js_url'), HTTP_IF_MODIFIED_SINCE=plain['Last-Modified'] ).status_code )
+        zipped = self.client.get( reverse('request_item_js_url'), HTTP_ACCEPT_ENCODING='gzip, deflate' )
+        self.assertEqual( 'gzip', zipped['Content-Encoding'] )
+        self.assertNotEqual( plain['ETag'], zipped['ETag'] )
+        self.assertEqual( plain.content, gzip.GzipFile( fileobj=io.BytesIO(zipped.content) ).read() )
+
+    def test__one_stat_per_hit( self ):
+        """ Checks the etag, last-modified, and body lookups of one hit share a single stat. """
+        helper = views.dev_js_helper
+        stats = []
+        helper.read_mtime = lambda filename: stats.append( filename ) or DevJsHelper.read_mtime( helper, filename )
+        try:
+            self.client.get( reverse('easyscan_js_url') )
+        finally:
+            del helper.read_mtime
+        self.assertEqual( ['josiah_easyscan.js'], stats )
+
+    def test__mtime_invalidates( self ):
+        """ Checks a cached rewrite is kept per host, and rebuilt once the file changes. """
+        helper = DevJsHelper()
+        helper.JS_DIR_PATH = tempfile.mkdtemp()
+        js_path = os.path.join( helper.JS_DIR_PATH, 'josiah_request_item.js' )
+        with open( js_path, 'w' ) as f:
+            f.write( 'var u = "https://library.brown.edu/x";' )
+        new_request = lambda: RequestFactory().get( '/dev_josiah_request_item.js/' )
+        first = helper.get_entry( new_request(), 'josiah_request_item.js' )
+        self.assertTrue( first is helper.get_entry(new_request(), 'josiah_request_item.js') )
+        self.assertEqual( b'var u = "https://testserver/x";', first['body'] )
+        with open( js_path, 'w' ) as f:
+            f.write( 'var u = "https://library.brown.edu/y";' )
+        os.utime( js_path, (first['mtime'] + 10, first['mtime'] + 10) )
+        self.assertEqual( b'var u = "https://testserver/y";', helper.get_entry(new_request(), 'josiah_request_item.js')['body'] )
+        shutil.rmtree( helper.JS_DIR_PATH )
 
+    # end class DevJsHelperTest
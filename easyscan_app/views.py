@@ -7,9 +7,10 @@ from .lib import version_helper
 from django.conf import settings as project_settings
 from django.contrib.auth import logout
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseRedirect
 from django.shortcuts import render
 from django.utils.http import urlquote
+from django.views.decorators.http import condition
 from easyscan_app import models
 from easyscan_app.easyscan_forms import CitationForm
 from easyscan_app.lib.validator import Validator
@@ -25,6 +26,8 @@ try_again_helper = models.TryAgainHelper()
 try_again_confirmation_helper = models.TryAgainConfirmationHelper()
 basic_auth_helper = models.BasicAuthHelper()
 stats_builder = models.StatsBuilder()
+metrics_helper = models.MetricsHelper()
+dev_js_helper = models.DevJsHelper()
 validator = Validator()
 
 
@@ -67,7 +70,7 @@ def request_def( request ):
             redirect_url = request_view_post_helper.handle_valid_form( request )
             return HttpResponseRedirect( redirect_url )
         else:
-            request.session['form_data'] = request.POST
+            request.session['form_data'] = dict( [ (key, request.POST.get(key, '')) for key in CitationForm.base_fields ] )  # just the form's fields, not the whole POST
             log.debug( 'in views.request_def(); posted form invalid' )
             return HttpResponseRedirect( reverse('request_url'), {u'form': form} )
 
@@ -151,6 +154,13 @@ def stats_v1( request ):
     return HttpResponse( stats_builder.output, content_type=u'application/javascript; charset=utf-8' )
 
 
+def metrics( request ):
+    """ Returns counters, latency histograms, and queue depths in prometheus text format, to allowed scrapers. """
+    if not metrics_helper.check_ip( request ):
+        return HttpResponseForbidden( 'forbidden' )
+    return metrics_helper.build_response()
+
+
 def try_again( request ):
     """ Displays recent requests with both a try-again link and a view-in-admin link. """
     log.debug( 'request.__dict__, ```%s```' % request.__dict__ )
@@ -180,30 +190,15 @@ def try_again_confirmation( request, scan_request_id ):
         return HttpResponseRedirect( reverse(u'try_again_url') )
 
 
+@condition( etag_func=lambda request: dev_js_helper.get_etag(request, 'josiah_easyscan.js'), last_modified_func=lambda request: dev_js_helper.get_last_modified(request, 'josiah_easyscan.js') )
 def easyscan_js( request ):
     """ Returns modified javascript file for development.
         Hit by a `dev_josiah_easyscan.js` url; production hits the apache-served js file. """
-    js_unicode = u''
-    current_directory = os.path.dirname(os.path.abspath(__file__))
-    js_path = u'%s/lib/josiah_easyscan.js' % current_directory
-    with open( js_path ) as f:
-        js_utf8 = f.read()
-        js_unicode = js_utf8.decode( u'utf-8' )
-    js_unicode = js_unicode.replace( u'library.brown.edu/easyscan/josiah_request_item.js', u'%s/easyscan/dev_josiah_request_item.js' % request.get_host() )
-    js_unicode = js_unicode.replace( u'library.brown.edu', request.get_host() )
-    scheme = u'https' if request.is_secure() else u'http'
-    js_unicode = js_unicode.replace( u'https', scheme )
-    return HttpResponse( js_unicode, content_type = u'application/javascript; charset=utf-8' )
+    return dev_js_helper.build_response( request, 'josiah_easyscan.js' )
 
 
+@condition( etag_func=lambda request: dev_js_helper.get_etag(request, 'josiah_request_item.js'), last_modified_func=lambda request: dev_js_helper.get_last_modified(request, 'josiah_request_item.js') )
 def request_item_js( request ):
     """ Returns modified javascript file for development.
         Hit by a `dev_josiah_request_item.js` url; production hits the apache-served js file. """
-    js_unicode = u''
-    current_directory = os.path.dirname(os.path.abspath(__file__))
-    js_path = u'%s/lib/josiah_request_item.js' % current_directory
-    with open( js_path ) as f:
-        js_utf8 = f.read()
-        js_unicode = js_utf8.decode( u'utf-8' )
-    js_unicode = js_unicode.replace( u'library.brown.edu', request.get_host() )
-    return HttpResponse( js_unicode, content_type = u'application/javascript; charset=utf-8' )
+    return dev_js_helper.build_response( request, 'josiah_request_item.js' )
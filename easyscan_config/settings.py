@@ -46,6 +46,7 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'easyscan_app.lib.request_timer.RequestTimingMiddleware',  # first, so its total covers the others
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -131,11 +132,22 @@ EMAIL_HOST = os.environ['EZSCAN__EMAIL_HOST']
 EMAIL_PORT = int( os.environ['EZSCAN__EMAIL_PORT'] )
 
 
+# Cache
+## optional; without it django uses its per-process local-memory cache
+## example: '{"default": {"BACKEND": "django.core.cache.backends.memcached.MemcachedCache", "LOCATION": "127.0.0.1:11211"}}'
+if os.environ.get( 'EZSCAN__CACHES_JSON' ):
+    CACHES = json.loads( os.environ['EZSCAN__CACHES_JSON'] )
+
+
 # sessions
 
-# <https://docs.djangoproject.com/en/1.6/ref/settings/#std:setting-SESSION_SAVE_EVERY_REQUEST>
-# Thinking: not that many concurrent users, and no pages where session info isn't required, so overhead is reasonable.
-SESSION_SAVE_EVERY_REQUEST = True
+## the default engine saves a session only when its contents changed, over cached_db when EZSCAN__CACHES_JSON sets a shared cache, else db
+##   (or EZSCAN__SESSION_BASE_ENGINE, eg 'django.contrib.sessions.backends.signed_cookies')
+## expired rows of the db-backed engines are purged by `manage.py clearsessions`
+SESSION_ENGINE = os.environ.get( 'EZSCAN__SESSION_ENGINE', 'easyscan_app.lib.session_store' )
+# <https://docs.djangoproject.com/en/1.11/ref/settings/#std:setting-SESSION_SAVE_EVERY_REQUEST>
+# Off: the session engine above already saves whenever anything in the session, nested dicts included, changed.
+SESSION_SAVE_EVERY_REQUEST = False
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 
 # logging
@@ -24,6 +24,8 @@ urlpatterns = [
 
     url( r'^stats_api/v1/$',  views.stats_v1, name='stats_v1_url' ),
 
+    url( r'^metrics/$',  views.metrics, name='metrics_url' ),
+
     url( r'^admin/try_again/$',  views.try_again, name='try_again_url' ),
     url( r'^admin/try_again/confirm/(?P<scan_request_id>[^/]+)/$',  views.try_again_confirmation, name='try_again_confirmation_url' ),
 